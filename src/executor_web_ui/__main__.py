@@ -2,6 +2,7 @@ import os
 import sys
 import gzip
 import json
+import hashlib
 import aiofiles
 import logging
 
@@ -11,6 +12,11 @@ from aiohttp import web
 
 PORT = 8000
 REPORT_FILE = os.path.join(os.path.dirname(__file__), 'report', 'report_data.json')
+# externalized module reports, by their SHA-256
+BLOBS_DIR = os.path.join(os.path.dirname(__file__), 'report', 'blobs')
+PATCH_CONTENT_TYPE = 'application/json-patch+json'
+# last received report and its sequence number - patches are applied to it
+report_state = {'seq': None, 'report': None}
 
 
 def require_basic_auth(handler):
@@ -52,12 +58,25 @@ async def send_report(request):
         request_bytes = gzip.decompress(body) if is_gzip_encoded else body
         data = json.loads(request_bytes.decode('utf-8'))
         json_size = len(request_bytes)
+        is_patch = request.headers.get('Content-Type', '') == PATCH_CONTENT_TYPE
+        report_kind = 'patch' if is_patch else 'report'
         if is_gzip_encoded:
             compressed_size = len(body)
             ratio = json_size / compressed_size
-            logging.info(f"Received report: compressed={compressed_size} bytes, decompressed={json_size} bytes, ratio={ratio:.2f}")
+            logging.info(f"Received {report_kind}: compressed={compressed_size} bytes, decompressed={json_size} bytes, ratio={ratio:.2f}")
         else:
-            logging.info(f"Received report: size={json_size} bytes")
+            logging.info(f"Received {report_kind}: size={json_size} bytes")
+
+        if is_patch:
+            if report_state['report'] is None or request.headers.get('X-Report-Base-Seq') != report_state['seq']:
+                logging.info(f"Patch base seq={request.headers.get('X-Report-Base-Seq')} doesn't match current seq={report_state['seq']}, requesting full report")
+                return web.json_response({'error': 'Full report is required'}, status=409)
+            data = apply_patch(report_state['report'], data)
+            if request.headers.get('X-Report-Hash') and request.headers.get('X-Report-Hash') != report_hash(data):
+                logging.info("Hash of patched report doesn't match, requesting full report")
+                report_state.update(seq=None, report=None)
+                return web.json_response({'error': 'Full report is required'}, status=409)
+        report_state.update(seq=request.headers.get('X-Report-Seq'), report=data)
 
         async with aiofiles.open(REPORT_FILE, 'w') as f:
             await f.write(json.dumps(data))
@@ -66,6 +85,62 @@ async def send_report(request):
         return web.json_response({'error': str(e)}, status=500)
 
 
+@require_bearer_auth
+async def send_blob(request):
+    try:
+        body = await request.read()
+        blob = gzip.decompress(body) if request.headers.get('Content-Encoding', '') == 'gzip' else body
+        blob_hash = hashlib.sha256(blob).hexdigest()
+        if request.headers.get('X-Blob-Hash') != blob_hash:
+            return web.json_response({'error': "Blob hash doesn't match X-Blob-Hash"}, status=400)
+        logging.info(f"Received blob {blob_hash}: size={len(blob)} bytes")
+        os.makedirs(BLOBS_DIR, exist_ok=True)
+        async with aiofiles.open(os.path.join(BLOBS_DIR, blob_hash), 'wb') as f:
+            await f.write(blob)
+        return web.json_response({'status': 'success'})
+    except Exception as e:
+        return web.json_response({'error': str(e)}, status=500)
+
+
+async def get_blob(request):
+    blob_hash = request.match_info['blob_hash']
+    blob_path = os.path.join(BLOBS_DIR, blob_hash)
+    if len(blob_hash) != 64 or not all(c in '0123456789abcdef' for c in blob_hash) or not os.path.exists(blob_path):
+        return web.json_response({'error': 'No blob found'}, status=404)
+    return web.FileResponse(blob_path)
+
+
+def report_hash(report):
+    canonical_json = json.dumps(report, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical_json.encode('utf-8')).hexdigest()
+
+
+def apply_patch(report, operations):
+    report = json.loads(json.dumps(report))  # so failed patch won't leave current report half-applied
+    for operation in operations:
+        tokens = [token.replace('~1', '/').replace('~0', '~') for token in operation['path'].split('/')[1:]]
+        if not tokens:
+            report = operation.get('value')
+            continue
+        parent = report
+        for token in tokens[:-1]:
+            parent = parent[int(token)] if isinstance(parent, list) else parent[token]
+        last_token = tokens[-1]
+        if isinstance(parent, list):
+            index = len(parent) if last_token == '-' else int(last_token)
+            if operation['op'] == 'add':
+                parent.insert(index, operation['value'])
+            elif operation['op'] == 'remove':
+                del parent[index]
+            else:
+                parent[index] = operation['value']
+        elif operation['op'] == 'remove':
+            del parent[last_token]
+        else:
+            parent[last_token] = operation['value']
+    return report
+
+
 async def get_report(request):
     try:
         if not os.path.exists(REPORT_FILE):
@@ -88,6 +163,8 @@ def create_app():
     app.router.add_get('/', serve_index)
     app.router.add_post('/send_report', send_report)
     app.router.add_get('/get_report', get_report)
+    app.router.add_post('/send_blob', send_blob)
+    app.router.add_get('/get_blob/{blob_hash}', get_blob)
     app.router.add_static('/', path='static/', name='static')
 
     async def add_cors(request, response):
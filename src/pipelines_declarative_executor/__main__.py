@@ -45,6 +45,34 @@ def __retry_pipeline(pipeline_dir: str, retry_vars: str, log_level: str):
         asyncio.run(retry_pipeline(pipeline_dir, retry_vars))
 
 
+@cli.command("graph")
+@click.option('--pipeline_data', required=True, type=str, help="Pipeline data (pipeline/config file paths)")
+@click.option('--pipeline_vars', required=False, type=str, help="Pipeline vars with high priority")
+@click.option('--pipeline_vars_secure', required=False, type=str, help="Secure pipeline vars with high priority that are masked in logs/report")
+@click.option('--infer_dependencies', default=True, type=bool, help="Infer stage dependencies from referenced variables and files")
+def __graph_pipeline(pipeline_data: str, pipeline_vars: str, pipeline_vars_secure: str, infer_dependencies: bool):
+    CommonSetup.setup_cli(log_env_vars=False)
+    logging.info(
+        f'command "GRAPH" with params:'
+        f'\n{format_param("PIPELINE_DATA", pipeline_data)}'
+        f'\n{format_pipeline_vars(pipeline_vars, pipeline_vars_secure)}'
+        f'\nINFER_DEPENDENCIES="{infer_dependencies}"'
+    )
+    from pipelines_declarative_executor.orchestrator.pipeline_orchestrator import PipelineOrchestrator
+    from pipelines_declarative_executor.orchestrator.stage_dependency_graph import StageDependencyGraph
+    try:
+        pipeline_execution = PipelineOrchestrator.prepare_pipeline_execution(
+            pipeline_data=pipeline_data,
+            pipeline_vars=pipeline_vars,
+            pipeline_vars_secure=pipeline_vars_secure,
+            infer_stage_dependencies=infer_dependencies,
+        )
+    except Exception as e:
+        logging.error(f"Exception during orchestration: {e}")
+        sys.exit(1)
+    logging.info(f"Stage dependency graph of \"{pipeline_execution.pipeline.name}\":\n{StageDependencyGraph.describe(pipeline_execution.pipeline)}")
+
+
 @cli.command("archive")
 @click.option('--pipeline_dir', required=True, type=str, help="Path to directory where pipeline was executed")
 @click.option('--target_path', required=True, type=str, help="Path to resulting archive")
@@ -108,6 +136,10 @@ def install_cancellation_handlers():
 async def create_and_run_pipeline(pipeline_data: str, pipeline_vars: str, pipeline_vars_secure: str, pipeline_dir: str, is_dry_run: bool):
     from pipelines_declarative_executor.orchestrator.pipeline_orchestrator import PipelineOrchestrator
     from pipelines_declarative_executor.executor.pipeline_executor import PipelineExecutor
+    from pipelines_declarative_executor.executor.module_worker_pool import ModuleWorkerPool
+    from pipelines_declarative_executor.executor.module_fork_server import ModuleForkServer
+    from pipelines_declarative_executor.executor.stage_footprint_store import StageFootprintStore
+    from pipelines_declarative_executor.executor.execution_store import ExecutionStore
     from pipelines_declarative_executor.report.report_uploader import ReportUploader
     from pipelines_declarative_executor.model.stage import ExecutionStatus
     install_cancellation_handlers()
@@ -120,13 +152,19 @@ async def create_and_run_pipeline(pipeline_data: str, pipeline_vars: str, pipeli
     except Exception as e:
         logging.error(f"Exception during orchestration: {e}")
         sys.exit(1)
-    async with ReportUploader(execution=pipeline_execution, configs=ReportUploader.load_endpoint_configs()):
-        await PipelineExecutor.start(
-            execution=pipeline_execution,
-            execution_folder_path=pipeline_dir,
-            is_dry_run=is_dry_run,
-            wait_for_finish=True,
-        )
+    try:
+        async with ReportUploader(execution=pipeline_execution, configs=ReportUploader.load_endpoint_configs()):
+            await PipelineExecutor.start(
+                execution=pipeline_execution,
+                execution_folder_path=pipeline_dir,
+                is_dry_run=is_dry_run,
+                wait_for_finish=True,
+            )
+    finally:
+        await ModuleWorkerPool.shutdown()
+        await ModuleForkServer.shutdown()
+        StageFootprintStore.save()
+        ExecutionStore.close_all()
     if pipeline_execution.status != ExecutionStatus.SUCCESS:
         sys.exit(1)
 
@@ -134,6 +172,10 @@ async def create_and_run_pipeline(pipeline_data: str, pipeline_vars: str, pipeli
 async def retry_pipeline(pipeline_dir: str, retry_vars: str):
     from pipelines_declarative_executor.orchestrator.retry_orchestrator import PipelineRetryOrchestrator
     from pipelines_declarative_executor.executor.pipeline_executor import PipelineExecutor
+    from pipelines_declarative_executor.executor.module_worker_pool import ModuleWorkerPool
+    from pipelines_declarative_executor.executor.module_fork_server import ModuleForkServer
+    from pipelines_declarative_executor.executor.stage_footprint_store import StageFootprintStore
+    from pipelines_declarative_executor.executor.execution_store import ExecutionStore
     from pipelines_declarative_executor.report.report_uploader import ReportUploader
     from pipelines_declarative_executor.model.stage import ExecutionStatus
     install_cancellation_handlers()
@@ -145,13 +187,19 @@ async def retry_pipeline(pipeline_dir: str, retry_vars: str):
     except Exception as e:
         logging.error(f"Exception during orchestration: {e}")
         sys.exit(1)
-    async with ReportUploader(execution=pipeline_execution, configs=ReportUploader.load_endpoint_configs()):
-        await PipelineExecutor.start(
-            execution=pipeline_execution,
-            execution_folder_path=pipeline_dir,
-            is_dry_run=pipeline_execution.is_dry_run,
-            wait_for_finish=True,
-        )
+    try:
+        async with ReportUploader(execution=pipeline_execution, configs=ReportUploader.load_endpoint_configs()):
+            await PipelineExecutor.start(
+                execution=pipeline_execution,
+                execution_folder_path=pipeline_dir,
+                is_dry_run=pipeline_execution.is_dry_run,
+                wait_for_finish=True,
+            )
+    finally:
+        await ModuleWorkerPool.shutdown()
+        await ModuleForkServer.shutdown()
+        StageFootprintStore.save()
+        ExecutionStore.close_all()
     if pipeline_execution.status != ExecutionStatus.SUCCESS:
         sys.exit(1)
 
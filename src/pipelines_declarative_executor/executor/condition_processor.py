@@ -1,19 +1,23 @@
 from pipelines_declarative_executor.model.pipeline import PipelineExecution
-from pipelines_declarative_executor.model.stage import When, ExecutionStatus
+from pipelines_declarative_executor.model.stage import Stage, When, ExecutionStatus
 from pipelines_declarative_executor.model.exceptions import PipelineExecutorException
 from pipelines_declarative_executor.utils.constants import Constants
 
 
 class ConditionProcessor:
     @staticmethod
-    def need_to_execute(execution: PipelineExecution, when: When) -> bool:
-        return ConditionProcessor._check_status(execution, when) and ConditionProcessor._check_condition(execution, when)
+    def need_to_execute(execution: PipelineExecution, when: When, stage: Stage = None) -> bool:
+        return ConditionProcessor._check_status(execution, when, stage) and ConditionProcessor._check_condition(execution, when)
 
     @staticmethod
-    def _check_status(execution: PipelineExecution, when: When) -> bool:
+    def _check_status(execution: PipelineExecution, when: When, stage: Stage = None) -> bool:
         if ExecutionStatus.ANY in when.statuses:
             return True
-        is_any_stage_failed = any(stage.status == ExecutionStatus.FAILED for stage in execution.pipeline.stages)
+        if stage and execution.pipeline.has_stage_dependencies():
+            checked_stages = execution.pipeline.get_upstream_stages(stage)
+        else:
+            checked_stages = execution.pipeline.stages
+        is_any_stage_failed = any(s.status == ExecutionStatus.FAILED for s in checked_stages)
         return (is_any_stage_failed and ExecutionStatus.FAILED in when.statuses
                 or not is_any_stage_failed and ExecutionStatus.SUCCESS in when.statuses)
 
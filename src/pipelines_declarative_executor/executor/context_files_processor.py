@@ -41,7 +41,9 @@ class ContextFilesProcessor:
 
         if stage.type == StageType.REPORT:
             target_report_path = stage.exec_dir.joinpath(Constants.STAGE_INPUT_FILES_DIR_NAME).joinpath(Constants.PIPELINE_REPORT_FOR_REPORT_STAGE_FILE_NAME)
-            shutil.copyfile(execution.state_dir.joinpath(Constants.PIPELINE_REPORT_FILE_NAME), target_report_path)
+            # state file might be behind journaled transitions - so current view is written instead of copying it
+            from pipelines_declarative_executor.report.report_collector import ReportCollector
+            CommonUtils.write_json(ReportCollector.prepare_ui_view(execution), target_report_path)
 
         if stage.is_first_run() and stage.retry is not None: # won't re-evaluate retry config on stage-retry
             stage.evaluated_params['retry'], _ = CommonUtils.calculate_dict_values(execution, stage.retry, mask_secrets=True)
@@ -112,6 +114,8 @@ class ContextFilesProcessor:
             else:
                 files_info[file_key] = full_file_path
         execution.vars.files_info.update(files_info)
+        for file_key in files_info:
+            execution.vars.mark_changed('files_info', file_key)
 
     @staticmethod
     def store_pipeline_results(execution: PipelineExecution):
@@ -0,0 +1,117 @@
+import json, logging
+
+from pathlib import Path
+
+from pipelines_declarative_executor.model.stage import Stage
+from pipelines_declarative_executor.utils.constants import Constants
+from pipelines_declarative_executor.utils.env_var_utils import EnvVar
+from pipelines_declarative_executor.utils.state_serializer import StateSerializer
+from pipelines_declarative_executor.utils.string_utils import StringUtils
+
+
+class ExecutionJournal:
+    """Append-only log of stage transitions and vars updates, compacted into state files ('snapshot') periodically.
+    State files plus events appended after them describe current execution state"""
+
+    STAGE_EVENT = "stage"
+    VARS_EVENT = "vars"
+    SET_TYPE_VARS = ["secure_vars"]
+
+    def __init__(self, state_dir: Path):
+        self.journal_path = state_dir.joinpath(Constants.STATE_JOURNAL_FILE_NAME)
+        self.events_since_snapshot = 0
+
+    @staticmethod
+    def is_enabled() -> bool:
+        return EnvVar.ENABLE_EXECUTION_JOURNAL
+
+    def append(self, stage: Stage, vars_changes: dict, with_nested: bool = False) -> bool:
+        """Appends stage transition and vars updates, returns True when it's time to write snapshot instead"""
+        lines = [json.dumps({"event": ExecutionJournal.STAGE_EVENT, "uuid": stage.uuid, "data": ExecutionJournal._stage_data(stage, with_nested)},
+                            default=StringUtils.json_encode)]
+        if vars_changes:
+            lines.append(json.dumps({"event": ExecutionJournal.VARS_EVENT, "data": vars_changes}, default=StringUtils.json_encode))
+        with open(self.journal_path, "a", encoding="utf-8") as journal_file:
+            journal_file.write("\n".join(lines) + "\n")
+        self.events_since_snapshot += len(lines)
+        return self.events_since_snapshot >= EnvVar.EXECUTION_JOURNAL_SNAPSHOT_INTERVAL
+
+    def snapshot_position(self) -> int:
+        """Called when snapshot content is captured - returns journal position it covers"""
+        self.events_since_snapshot = 0
+        return self.journal_path.stat().st_size if self.journal_path.exists() else 0
+
+    def clear(self, position: int = None):
+        """Called after snapshot is written - events before its position are not needed anymore"""
+        if not self.journal_path.exists():
+            return
+        if position is None or position >= self.journal_path.stat().st_size:
+            self.journal_path.unlink(missing_ok=True)
+            return
+        # events appended while snapshot was being written are kept
+        with open(self.journal_path, "rb") as journal_file:
+            journal_file.seek(position)
+            remaining_events = journal_file.read()
+        tmp_path = self.journal_path.with_name(self.journal_path.name + ".tmp")
+        tmp_path.write_bytes(remaining_events)
+        tmp_path.replace(self.journal_path)
+
+    @staticmethod
+    def load_state(state_dir: Path) -> tuple[dict, dict, dict]:
+        """Returns (execution, pipeline, vars) dicts - as they are in state files, with journaled events applied"""
+        execution_dict = StateSerializer.load(state_dir, Constants.STATE_EXECUTION_FILE_NAME)
+        pipeline_dict = StateSerializer.load(state_dir, Constants.STATE_PIPELINE_FILE_NAME)
+        vars_dict = StateSerializer.load(state_dir, Constants.STATE_VARS_FILE_NAME)
+        stages_by_uuid = {}
+        ExecutionJournal._index_stage_dicts((pipeline_dict or {}).get("stages", []), stages_by_uuid)
+        for event in ExecutionJournal._read_events(state_dir.joinpath(Constants.STATE_JOURNAL_FILE_NAME)):
+            if event.get("event") == ExecutionJournal.STAGE_EVENT:
+                if (stage_dict := stages_by_uuid.get(event.get("uuid"))) is not None:
+                    stage_dict.update(event["data"])
+                    ExecutionJournal._index_stage_dicts(event["data"].get("nested_parallel_stages") or [], stages_by_uuid)
+            elif event.get("event") == ExecutionJournal.VARS_EVENT and vars_dict is not None:
+                for vars_name, values in event["data"].items():
+                    if vars_name in ExecutionJournal.SET_TYPE_VARS:
+                        vars_dict[vars_name] = sorted(set(vars_dict.get(vars_name) or []) | set(values))
+                    else:
+                        vars_dict.setdefault(vars_name, {}).update(values)
+        return execution_dict, pipeline_dict, vars_dict
+
+    @staticmethod
+    def compact(state_dir: Path) -> bool:
+        """Applies journaled events to state files of (finished or interrupted) execution, returns True if there were any"""
+        journal_path = state_dir.joinpath(Constants.STATE_JOURNAL_FILE_NAME)
+        if not journal_path.exists():
+            return False
+        execution_dict, pipeline_dict, vars_dict = ExecutionJournal.load_state(state_dir)
+        for state_dict, file_name in [(execution_dict, Constants.STATE_EXECUTION_FILE_NAME), (pipeline_dict, Constants.STATE_PIPELINE_FILE_NAME),
+                                      (vars_dict, Constants.STATE_VARS_FILE_NAME)]:
+            if state_dict is not None:
+                StateSerializer.write(state_dict, state_dir, file_name)
+        journal_path.unlink(missing_ok=True)
+        return True
+
+    @staticmethod
+    def _stage_data(stage: Stage, with_nested: bool = False) -> dict:
+        # shallow - nested stages have their own events, unless they were just created (e.g. expanded matrix)
+        return stage.to_dict(with_nested=with_nested)
+
+    @staticmethod
+    def _index_stage_dicts(stage_dicts: list, stages_by_uuid: dict):
+        for stage_dict in stage_dicts:
+            stages_by_uuid[stage_dict.get("uuid")] = stage_dict
+            ExecutionJournal._index_stage_dicts(stage_dict.get("nested_parallel_stages") or [], stages_by_uuid)
+
+    @staticmethod
+    def _read_events(journal_path: Path):
+        if not journal_path.exists():
+            return
+        with open(journal_path, "r", encoding="utf-8") as journal_file:
+            for line_number, line in enumerate(journal_file, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    # last line might be cut short if process was killed while writing it
+                    logging.warning(f"Skipping malformed line {line_number} of execution journal '{journal_path}'")
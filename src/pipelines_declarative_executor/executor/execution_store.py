@@ -0,0 +1,249 @@
+import json, sqlite3, threading
+
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+from pipelines_declarative_executor.model.stage import Stage
+from pipelines_declarative_executor.utils.constants import Constants
+from pipelines_declarative_executor.utils.env_var_utils import EnvVar
+from pipelines_declarative_executor.utils.string_utils import StringUtils
+
+
+class ExecutionStore:
+    """Optional SQLite database with state of whole execution tree (top-level pipeline and all its nested pipelines), used instead of state files and journal.
+    Rows of each execution are keyed by its directory, relative to top-level execution directory ('.' for top-level execution itself)"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS executions (
+            execution TEXT PRIMARY KEY, pipeline_id TEXT, pipeline_name TEXT, status TEXT, data TEXT NOT NULL, pipeline_data TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS stages (
+            execution TEXT NOT NULL, uuid TEXT NOT NULL, parent_uuid TEXT, position INTEGER NOT NULL, name TEXT, type TEXT, status TEXT,
+            start_time TEXT, finish_time TEXT, has_nested INTEGER NOT NULL, data TEXT NOT NULL, PRIMARY KEY (execution, uuid));
+        CREATE INDEX IF NOT EXISTS stages_by_uuid ON stages (uuid);
+        CREATE INDEX IF NOT EXISTS stages_by_status ON stages (execution, status);
+        CREATE INDEX IF NOT EXISTS stages_by_parent ON stages (execution, parent_uuid, position);
+        CREATE TABLE IF NOT EXISTS vars (
+            execution TEXT NOT NULL, vars_name TEXT NOT NULL, name TEXT NOT NULL, value TEXT, PRIMARY KEY (execution, vars_name, name));
+        CREATE TABLE IF NOT EXISTS files_info (
+            execution TEXT NOT NULL, name TEXT NOT NULL, value TEXT, PRIMARY KEY (execution, name));
+        CREATE TABLE IF NOT EXISTS events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, execution TEXT NOT NULL, uuid TEXT NOT NULL, status TEXT, time TEXT NOT NULL);
+        CREATE INDEX IF NOT EXISTS events_by_stage ON events (execution, uuid);
+    """
+    STAGE_COLUMNS = ["name", "type", "status", "start_time", "finish_time"]
+    FILES_INFO = "files_info"
+    SECURE_VARS = "secure_vars"
+
+    _stores: dict[Path, "ExecutionStore"] = {}
+
+    def __init__(self, root_dir: Path):
+        self.root_dir = Path(root_dir).resolve()
+        self.db_path = ExecutionStore.get_db_path(self.root_dir)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        # connection is shared with background state writer thread - access is serialized by lock
+        self._connection = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(ExecutionStore.SCHEMA)
+        self._lock = threading.Lock()
+        self._events_since_snapshot: dict[str, int] = {}
+
+    @staticmethod
+    def is_enabled() -> bool:
+        return EnvVar.ENABLE_SQLITE_STATE_STORE
+
+    @staticmethod
+    def get_db_path(exec_dir: Path) -> Path:
+        return Path(exec_dir).joinpath(Constants.PIPELINE_STATE_DIR_NAME, Constants.STATE_STORE_FILE_NAME)
+
+    @staticmethod
+    def open(root_dir: Path) -> "ExecutionStore":
+        """Returns (cached) store of execution tree with given top-level directory, creating its database if needed"""
+        root_dir = Path(root_dir).resolve()
+        if (store := ExecutionStore._stores.get(root_dir)) is None:
+            store = ExecutionStore._stores[root_dir] = ExecutionStore(root_dir)
+        return store
+
+    @staticmethod
+    def find(exec_dir: Path) -> "ExecutionStore | None":
+        """Returns store containing state of execution in given (top-level or nested pipeline's) directory, if there is one"""
+        if not exec_dir:
+            return None
+        exec_dir = Path(exec_dir).resolve()
+        for root_dir in [exec_dir, *exec_dir.parents]:
+            if root_dir in ExecutionStore._stores or ExecutionStore.get_db_path(root_dir).exists():
+                if (store := ExecutionStore.open(root_dir)).has_execution(exec_dir):
+                    return store
+        return None
+
+    @staticmethod
+    def close_all():
+        for store in ExecutionStore._stores.values():
+            store.close()
+        ExecutionStore._stores.clear()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def execution_key(self, exec_dir: Path) -> str:
+        return Path(exec_dir).resolve().relative_to(self.root_dir).as_posix()
+
+    def has_execution(self, exec_dir: Path) -> bool:
+        try:
+            key = self.execution_key(exec_dir)
+        except ValueError:
+            return False
+        with self._lock:
+            return self._connection.execute("SELECT 1 FROM executions WHERE execution = ?", (key,)).fetchone() is not None
+
+    def write_state(self, exec_dir: Path, execution_dict: dict, pipeline_dict: dict, vars_dict: dict):
+        """Replaces whole state of execution, in single transaction"""
+        key = self.execution_key(exec_dir)
+        with self._lock, self._transaction():
+            self._events_since_snapshot[key] = 0
+            self._write_execution(key, execution_dict, pipeline_dict)
+            self._write_pipeline_stages(key, pipeline_dict)
+            for table in ["vars", "files_info"]:
+                self._connection.execute(f"DELETE FROM {table} WHERE execution = ?", (key,))
+            self._write_vars(key, vars_dict)
+
+    def write_pipeline(self, exec_dir: Path, pipeline_dict: dict):
+        key = self.execution_key(exec_dir)
+        with self._lock, self._transaction():
+            self._connection.execute("UPDATE executions SET pipeline_id = ?, pipeline_name = ?, pipeline_data = ? WHERE execution = ?",
+                                     (pipeline_dict.get("id"), pipeline_dict.get("name"), ExecutionStore._dump(ExecutionStore._pipeline_data(pipeline_dict)), key))
+            self._write_pipeline_stages(key, pipeline_dict)
+
+    def write_stage(self, exec_dir: Path, stage: Stage, vars_changes: dict, with_nested: bool = False) -> bool:
+        """Updates row of given stage (and replaces its nested stages, when 'with_nested'), applies vars changes and records transition event.
+        Like 'ExecutionJournal.append', returns True when it's time to write whole state (and report file) instead"""
+        key = self.execution_key(exec_dir)
+        stage_dict = stage.to_dict(with_nested=with_nested)
+        with self._lock, self._transaction():
+            row = self._connection.execute("SELECT parent_uuid, position FROM stages WHERE execution = ? AND uuid = ?", (key, stage.uuid)).fetchone()
+            parent_uuid, position = row if row else (None, 0)
+            if with_nested:
+                self._delete_nested_stages(key, stage.uuid)
+                self._write_stages(key, [stage_dict], parent_uuid, position)
+            else:
+                self._write_stage_rows([self._stage_row(key, stage_dict, parent_uuid, position, stage.nested_parallel_stages is not None)])
+            self._write_vars(key, vars_changes)
+            self._connection.execute("INSERT INTO events (execution, uuid, status, time) VALUES (?, ?, ?, ?)",
+                                     (key, stage.uuid, stage.status, datetime.now().isoformat()))
+            self._events_since_snapshot[key] = self._events_since_snapshot.get(key, 0) + 1
+            return self._events_since_snapshot[key] >= EnvVar.EXECUTION_JOURNAL_SNAPSHOT_INTERVAL
+
+    def load_state(self, exec_dir: Path) -> tuple[dict, dict, dict]:
+        """Returns (execution, pipeline, vars) dicts - in the same format as state files"""
+        key = self.execution_key(exec_dir)
+        with self._lock:
+            row = self._connection.execute("SELECT data FROM executions WHERE execution = ?", (key,)).fetchone()
+            if row is None:
+                return None, None, None
+            return json.loads(row[0]), self._load_pipeline(key), self._load_vars(key)
+
+    def load_pipeline(self, exec_dir: Path) -> dict | None:
+        key = self.execution_key(exec_dir)
+        with self._lock:
+            return self._load_pipeline(key)
+
+    @contextmanager
+    def _transaction(self):
+        self._connection.execute("BEGIN")
+        try:
+            yield
+        except BaseException:
+            self._connection.execute("ROLLBACK")
+            raise
+        self._connection.execute("COMMIT")
+
+    def _write_execution(self, key: str, execution_dict: dict, pipeline_dict: dict):
+        self._connection.execute(
+            "INSERT OR REPLACE INTO executions (execution, pipeline_id, pipeline_name, status, data, pipeline_data) VALUES (?, ?, ?, ?, ?, ?)",
+            (key, pipeline_dict.get("id"), pipeline_dict.get("name"), execution_dict.get("status"),
+             ExecutionStore._dump(execution_dict), ExecutionStore._dump(ExecutionStore._pipeline_data(pipeline_dict))))
+
+    def _write_pipeline_stages(self, key: str, pipeline_dict: dict):
+        self._connection.execute("DELETE FROM stages WHERE execution = ?", (key,))
+        self._write_stages(key, pipeline_dict.get("stages") or [], parent_uuid=None)
+
+    def _write_stages(self, key: str, stage_dicts: list[dict], parent_uuid: str | None, first_position: int = 0):
+        rows, pending = [], [(stage_dicts, parent_uuid, first_position)]
+        while pending:
+            siblings, siblings_parent_uuid, position = pending.pop()
+            for index, stage_dict in enumerate(siblings, start=position):
+                nested_stages = stage_dict.get("nested_parallel_stages")
+                rows.append(self._stage_row(key, stage_dict, siblings_parent_uuid, index, nested_stages is not None))
+                if nested_stages:
+                    pending.append((nested_stages, stage_dict.get("uuid"), 0))
+        self._write_stage_rows(rows)
+
+    def _write_stage_rows(self, rows: list[tuple]):
+        self._connection.executemany(
+            "INSERT INTO stages (execution, uuid, parent_uuid, position, name, type, status, start_time, finish_time, has_nested, data) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (execution, uuid) DO UPDATE SET "
+            "name = excluded.name, type = excluded.type, status = excluded.status, start_time = excluded.start_time, "
+            "finish_time = excluded.finish_time, has_nested = excluded.has_nested, data = excluded.data", rows)
+
+    @staticmethod
+    def _stage_row(key: str, stage_dict: dict, parent_uuid: str | None, position: int, has_nested: bool) -> tuple:
+        # nested stages are stored as separate rows, referencing their parent
+        data = {name: value for name, value in stage_dict.items() if name != "nested_parallel_stages"}
+        columns = [data.get(column) for column in ExecutionStore.STAGE_COLUMNS]
+        return (key, data.get("uuid"), parent_uuid, position,
+                *[StringUtils.json_encode(value) if isinstance(value, datetime) else value for value in columns],
+                int(has_nested), ExecutionStore._dump(data))
+
+    def _delete_nested_stages(self, key: str, uuid: str):
+        self._connection.execute(
+            "WITH RECURSIVE nested(uuid) AS (SELECT uuid FROM stages WHERE execution = ?1 AND parent_uuid = ?2 "
+            "UNION SELECT stages.uuid FROM stages JOIN nested ON stages.parent_uuid = nested.uuid WHERE stages.execution = ?1) "
+            "DELETE FROM stages WHERE execution = ?1 AND uuid IN nested", (key, uuid))
+
+    def _write_vars(self, key: str, vars_dict: dict):
+        rows = []
+        for vars_name, values in (vars_dict or {}).items():
+            if vars_name == ExecutionStore.FILES_INFO:
+                self._connection.executemany("INSERT OR REPLACE INTO files_info (execution, name, value) VALUES (?, ?, ?)",
+                                             [(key, name, ExecutionStore._dump(value)) for name, value in values.items()])
+            elif vars_name == ExecutionStore.SECURE_VARS:
+                rows.extend((key, vars_name, name, None) for name in values)
+            else:
+                rows.extend((key, vars_name, name, ExecutionStore._dump(value)) for name, value in values.items())
+        self._connection.executemany("INSERT OR REPLACE INTO vars (execution, vars_name, name, value) VALUES (?, ?, ?, ?)", rows)
+
+    def _load_pipeline(self, key: str) -> dict | None:
+        row = self._connection.execute("SELECT pipeline_data FROM executions WHERE execution = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        pipeline_data = json.loads(row[0])
+        children: dict[str | None, list[dict]] = {}
+        for parent_uuid, has_nested, data in self._connection.execute(
+                "SELECT parent_uuid, has_nested, data FROM stages WHERE execution = ? ORDER BY parent_uuid, position", (key,)):
+            stage_dict = json.loads(data)
+            stage_dict["nested_parallel_stages"] = children.setdefault(stage_dict.get("uuid"), []) if has_nested else None
+            children.setdefault(parent_uuid, []).append(stage_dict)
+        return {**pipeline_data, "stages": children.get(None, [])}
+
+    def _load_vars(self, key: str) -> dict:
+        from pipelines_declarative_executor.model.pipeline import PipelineVars
+        vars_dict = {vars_name: {} for vars_name in PipelineVars.VARS_DICT_NAMES}
+        vars_dict[ExecutionStore.SECURE_VARS] = []
+        for vars_name, name, value in self._connection.execute("SELECT vars_name, name, value FROM vars WHERE execution = ?", (key,)):
+            if vars_name == ExecutionStore.SECURE_VARS:
+                vars_dict[vars_name].append(name)
+            else:
+                vars_dict.setdefault(vars_name, {})[name] = json.loads(value)
+        for name, value in self._connection.execute("SELECT name, value FROM files_info WHERE execution = ?", (key,)):
+            vars_dict[ExecutionStore.FILES_INFO][name] = json.loads(value)
+        return vars_dict
+
+    @staticmethod
+    def _pipeline_data(pipeline_dict: dict) -> dict:
+        return {name: value for name, value in pipeline_dict.items() if name != "stages"}
+
+    @staticmethod
+    def _dump(value) -> str:
+        return json.dumps(value, default=StringUtils.json_encode)
@@ -0,0 +1,62 @@
+import os, logging
+
+from pathlib import Path
+
+from pipelines_declarative_executor.utils.env_var_utils import EnvVar
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+
+class HostSlotPool:
+    """Concurrency slots shared by all executor processes on the host - each slot is an exclusively locked file in shared directory"""
+
+    SLOT_FILE_PREFIX = "slot-"
+    SLOT_FILE_SUFFIX = ".lock"
+
+    _unsupported_logged = False
+
+    @staticmethod
+    def is_enabled() -> bool:
+        if not EnvVar.HOST_SLOTS_DIR:
+            return False
+        if fcntl is None:
+            if not HostSlotPool._unsupported_logged:
+                logging.warning("Host-wide slot pool is not supported on this platform - ignoring HOST_SLOTS_DIR")
+                HostSlotPool._unsupported_logged = True
+            return False
+        return True
+
+    @staticmethod
+    def try_acquire(count: int) -> list | None:
+        """Locks 'count' free slots without waiting, returns their open files (or None if not enough slots are free).
+        Locks are released by OS when holding process dies, so slots of crashed executors are freed automatically"""
+        slots_dir = Path(EnvVar.HOST_SLOTS_DIR)
+        slots_dir.mkdir(parents=True, exist_ok=True)
+        count = min(count, EnvVar.HOST_MAX_CONCURRENT_STAGES)
+        acquired = []
+        for slot_index in range(EnvVar.HOST_MAX_CONCURRENT_STAGES):
+            slot_file = open(slots_dir.joinpath(f"{HostSlotPool.SLOT_FILE_PREFIX}{slot_index}{HostSlotPool.SLOT_FILE_SUFFIX}"), "a+")
+            try:
+                fcntl.flock(slot_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                slot_file.close()
+                continue
+            slot_file.truncate(0)
+            slot_file.write(str(os.getpid()))  # holder's pid, for troubleshooting
+            slot_file.flush()
+            acquired.append(slot_file)
+            if len(acquired) == count:
+                return acquired
+        HostSlotPool.release(acquired)
+        return None
+
+    @staticmethod
+    def release(slot_files: list):
+        for slot_file in slot_files or []:
+            try:
+                fcntl.flock(slot_file.fileno(), fcntl.LOCK_UN)
+            finally:
+                slot_file.close()
@@ -0,0 +1,126 @@
+import os, json, signal, asyncio, logging, itertools
+
+from pathlib import Path
+
+from pipelines_declarative_executor.model.exceptions import ModuleWorkerException
+
+
+class ForkedModuleProcess:
+    def __init__(self, pid: int, return_code: asyncio.Future):
+        self.pid = pid
+        self._return_code = return_code
+
+    async def wait(self) -> int:
+        return await asyncio.shield(self._return_code)
+
+    def kill(self):
+        try:
+            os.kill(self.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+
+class ModuleForkServer:
+
+    ZYGOTE_SCRIPT_PATH = Path(__file__).with_name("module_zygote.py")
+
+    _servers: dict[str, "ModuleForkServer | None"] = {}
+    _locks: dict[str, asyncio.Lock] = {}
+
+    def __init__(self, module_path: str, process: asyncio.subprocess.Process):
+        self.module_path = module_path
+        self.process = process
+        self._job_ids = itertools.count(1)
+        self._pids: dict[int, asyncio.Future] = {}
+        self._return_codes: dict[int, asyncio.Future] = {}
+        self._reader_task = asyncio.create_task(self._read_responses())
+
+    @classmethod
+    async def get(cls, module_path: str) -> "ModuleForkServer | None":
+        """Returns running fork server for module, or None if module can't be preloaded (caller should fall back to plain subprocess)"""
+        if not hasattr(os, "fork"):
+            return None
+        async with cls._locks.setdefault(module_path, asyncio.Lock()):
+            if module_path in cls._servers:
+                server = cls._servers[module_path]
+                if server is None or server.is_alive():
+                    return server
+            cls._servers[module_path] = server = await cls._start(module_path)
+            return server
+
+    @classmethod
+    async def shutdown(cls):
+        servers = [server for server in cls._servers.values() if server]
+        cls._servers.clear()
+        if servers:
+            await asyncio.gather(*(server.stop() for server in servers), return_exceptions=True)
+
+    @classmethod
+    async def _start(cls, module_path: str) -> "ModuleForkServer | None":
+        process = await asyncio.create_subprocess_exec(
+            "python", cls.ZYGOTE_SCRIPT_PATH.as_posix(), module_path,
+            stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE,
+        )
+        ready_line = await process.stdout.readline()
+        ready = json.loads(ready_line) if ready_line else {"ready": False, "error": "fork server exited during preload"}
+        if not ready.get("ready"):
+            logging.warning(f"Can't preload \"{module_path}\" in fork server ({ready.get('error')}) - falling back to plain subprocess")
+            if process.returncode is None:
+                process.kill()
+            await process.wait()
+            return None
+        logging.debug(f"Started fork server (pid={process.pid}) for \"{module_path}\"")
+        return ModuleForkServer(module_path, process)
+
+    def is_alive(self) -> bool:
+        return self.process.returncode is None and not self._reader_task.done()
+
+    async def spawn(self, args: list[str], stdout_path: Path, stderr_path: Path) -> ForkedModuleProcess:
+        job_id = next(self._job_ids)
+        loop = asyncio.get_running_loop()
+        self._pids[job_id] = pid_future = loop.create_future()
+        self._return_codes[job_id] = return_code_future = loop.create_future()
+        job = {"id": job_id, "args": args, "stdout": stdout_path.as_posix(), "stderr": stderr_path.as_posix()}
+        try:
+            self.process.stdin.write((json.dumps(job) + "\n").encode("utf-8"))
+            await self.process.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError) as e:
+            self._pids.pop(job_id, None)
+            self._return_codes.pop(job_id, None)
+            raise ModuleWorkerException(f"Fork server (pid={self.process.pid}) is not reachable: {e}")
+        return ForkedModuleProcess(await pid_future, return_code_future)
+
+    async def stop(self):
+        if self.process.returncode is None:
+            try:
+                self.process.stdin.close()
+                await asyncio.wait_for(self.process.wait(), timeout=5)
+            except (asyncio.TimeoutError, BrokenPipeError, ConnectionResetError):
+                self.process.kill()
+        await self.process.wait()
+        await self._reader_task
+
+    async def _read_responses(self):
+        try:
+            while line := await self.process.stdout.readline():
+                response = json.loads(line)
+                job_id = response["id"]
+                if "pid" in response:
+                    future = self._pids.pop(job_id, None)
+                    value = response["pid"]
+                    if future is None or future.cancelled():
+                        # stage was cancelled while waiting for its pid - nothing else would track (and kill) this child
+                        ForkedModuleProcess(value, None).kill()
+                        continue
+                else:
+                    future = self._return_codes.pop(job_id, None)
+                    value = response["returncode"]
+                if future and not future.done():
+                    future.set_result(value)
+        finally:
+            error = ModuleWorkerException(f"Fork server (pid={self.process.pid}) for \"{self.module_path}\" exited")
+            for future in [*self._pids.values(), *self._return_codes.values()]:
+                if not future.done():
+                    future.set_exception(error)
+            self._pids.clear()
+            self._return_codes.clear()
@@ -0,0 +1,100 @@
+"""
+Long-lived worker process for "Python Module" stages (WORKER_POOL execution mode).
+
+Started by ModuleWorkerPool as `python module_worker.py <module_path>` and intentionally does not import executor code.
+Receives one JSON job per line on stdin and answers with one JSON result per line on its original stdout.
+Module imports stay cached in `sys.modules` between jobs, so only the first job pays for them.
+"""
+import os, sys, json, runpy, logging, traceback
+
+
+def _redirect(fd: int, path: str) -> int:
+    saved_fd = os.dup(fd)
+    target_fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    os.dup2(target_fd, fd)
+    os.close(target_fd)
+    return saved_fd
+
+
+def _restore(fd: int, saved_fd: int):
+    os.dup2(saved_fd, fd)
+    os.close(saved_fd)
+
+
+def _snapshot_log_handlers() -> dict:
+    loggers = [logging.getLogger(), *(lg for lg in logging.Logger.manager.loggerDict.values() if isinstance(lg, logging.Logger))]
+    return {lg: list(lg.handlers) for lg in loggers}
+
+
+def _cleanup_log_handlers(snapshot: dict):
+    # modules usually attach file handlers pointing into stage folder - they must not leak into the next job
+    loggers = [logging.getLogger(), *(lg for lg in logging.Logger.manager.loggerDict.values() if isinstance(lg, logging.Logger))]
+    for lg in loggers:
+        for handler in list(lg.handlers):
+            if handler not in snapshot.get(lg, []):
+                lg.removeHandler(handler)
+                try:
+                    handler.close()
+                except Exception:
+                    pass
+
+
+def _exit_code(e: SystemExit) -> int:
+    if e.code is None:
+        return 0
+    if isinstance(e.code, int):
+        return e.code
+    print(e.code, file=sys.stderr)
+    return 1
+
+
+def run_job(module_path: str, job: dict) -> int:
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved_stdout = _redirect(1, job["stdout"])
+    saved_stderr = _redirect(2, job["stderr"])
+    saved_argv, saved_cwd, saved_env = sys.argv, os.getcwd(), dict(os.environ)
+    log_handlers = _snapshot_log_handlers()
+    return_code = 0
+    try:
+        sys.argv = [module_path, *job["args"]]
+        runpy.run_path(module_path, run_name="__main__")
+    except SystemExit as e:
+        return_code = _exit_code(e)
+    except BaseException:
+        traceback.print_exc()
+        return_code = 1
+    finally:
+        _cleanup_log_handlers(log_handlers)
+        sys.stdout.flush()
+        sys.stderr.flush()
+        _restore(1, saved_stdout)
+        _restore(2, saved_stderr)
+        sys.argv = saved_argv
+        os.chdir(saved_cwd)
+        os.environ.clear()
+        os.environ.update(saved_env)
+    return return_code
+
+
+def main():
+    module_path = sys.argv[1]
+    # keep protocol channels private, so module output or input reads can't corrupt them
+    requests = os.fdopen(os.dup(0), "r", encoding="utf-8")
+    responses = os.fdopen(os.dup(1), "w", encoding="utf-8")
+    devnull = os.open(os.devnull, os.O_RDWR)
+    os.dup2(devnull, 0)
+    os.dup2(devnull, 1)
+    os.close(devnull)
+
+    for line in requests:
+        if not line.strip():
+            continue
+        job = json.loads(line)
+        return_code = run_job(module_path, job)
+        responses.write(json.dumps({"returncode": return_code}) + "\n")
+        responses.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+import asyncio, json, logging
+
+from pathlib import Path
+
+from pipelines_declarative_executor.model.exceptions import ModuleWorkerException
+from pipelines_declarative_executor.utils.env_var_utils import EnvVar
+
+
+class ModuleWorker:
+    def __init__(self, module_path: str, process: asyncio.subprocess.Process):
+        self.module_path = module_path
+        self.process = process
+        self.processed_stages = 0
+
+    @property
+    def pid(self) -> int:
+        return self.process.pid
+
+    def is_alive(self) -> bool:
+        return self.process.returncode is None
+
+    async def run(self, args: list[str], stdout_path: Path, stderr_path: Path) -> int:
+        self.processed_stages += 1
+        job = {"args": args, "stdout": stdout_path.as_posix(), "stderr": stderr_path.as_posix()}
+        try:
+            self.process.stdin.write((json.dumps(job) + "\n").encode("utf-8"))
+            await self.process.stdin.drain()
+            response = await self.process.stdout.readline()
+        except (BrokenPipeError, ConnectionResetError) as e:
+            raise ModuleWorkerException(f"Module worker (pid={self.pid}) is not reachable: {e}")
+        if not response:
+            await self.process.wait()
+            raise ModuleWorkerException(f"Module worker (pid={self.pid}) crashed with return code {self.process.returncode}")
+        return json.loads(response).get("returncode")
+
+    async def stop(self):
+        if self.is_alive():
+            try:
+                self.process.kill()
+            except ProcessLookupError:
+                pass
+        await self.process.wait()
+
+
+class ModuleWorkerPool:
+
+    WORKER_SCRIPT_PATH = Path(__file__).with_name("module_worker.py")
+
+    _idle_workers: dict[str, list[ModuleWorker]] = {}
+    _busy_workers: set[ModuleWorker] = set()
+
+    @classmethod
+    async def acquire(cls, module_path: str) -> ModuleWorker:
+        idle_workers = cls._idle_workers.setdefault(module_path, [])
+        while idle_workers:
+            worker = idle_workers.pop()
+            if worker.is_alive():
+                cls._busy_workers.add(worker)
+                return worker
+            await worker.stop()
+        worker = await cls._spawn(module_path)
+        cls._busy_workers.add(worker)
+        return worker
+
+    @classmethod
+    async def release(cls, worker: ModuleWorker, reusable: bool = True):
+        cls._busy_workers.discard(worker)
+        if reusable and worker.is_alive() and worker.processed_stages < EnvVar.MODULE_WORKER_MAX_STAGES:
+            cls._idle_workers.setdefault(worker.module_path, []).append(worker)
+            return
+        logging.debug(f"Recycling module worker (pid={worker.pid}) after {worker.processed_stages} stages")
+        await worker.stop()
+
+    @classmethod
+    async def shutdown(cls):
+        workers = [*cls._busy_workers, *(w for workers in cls._idle_workers.values() for w in workers)]
+        cls._idle_workers.clear()
+        cls._busy_workers.clear()
+        if workers:
+            await asyncio.gather(*(worker.stop() for worker in workers), return_exceptions=True)
+
+    @classmethod
+    async def _spawn(cls, module_path: str) -> ModuleWorker:
+        process = await asyncio.create_subprocess_exec(
+            "python", cls.WORKER_SCRIPT_PATH.as_posix(), module_path,
+            stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE,
+        )
+        logging.debug(f"Started module worker (pid={process.pid}) for \"{module_path}\"")
+        return ModuleWorker(module_path, process)
@@ -0,0 +1,142 @@
+"""
+Fork-server ("zygote") process for "Python Module" stages (FORK_SERVER execution mode).
+
+Started by ModuleForkServer as `python module_zygote.py <module_path>` and intentionally does not import executor code.
+Preloads module's imports once, then forks a fresh child per stage request received on stdin (one JSON per line).
+Reports child pid right after fork, and its return code after it is reaped - both as JSON lines on its original stdout.
+"""
+import os, sys, json, runpy, select, signal, traceback
+
+
+def _redirect(fd: int, path: str):
+    target_fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    os.dup2(target_fd, fd)
+    os.close(target_fd)
+
+
+def _preload(module_path: str) -> str | None:
+    # module's `__main__` guarded by `if __name__ == "__main__"` only imports its dependencies here
+    try:
+        runpy.run_path(module_path, run_name="__pde_preload__")
+    except SystemExit:
+        return "module's entrypoint is not guarded by `if __name__ == '__main__'`"
+    except BaseException as e:
+        return f"{type(e).__name__}: {e}"
+    return None
+
+
+def _run_child(module_path: str, job: dict, protocol_fds: list[int]):
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+    for fd in protocol_fds:
+        os.close(fd)
+    return_code = 0
+    try:
+        _redirect(1, job["stdout"])
+        _redirect(2, job["stderr"])
+        sys.argv = [module_path, *job["args"]]
+        runpy.run_path(module_path, run_name="__main__")
+    except SystemExit as e:
+        if e.code is None:
+            return_code = 0
+        elif isinstance(e.code, int):
+            return_code = e.code
+        else:
+            print(e.code, file=sys.stderr)
+            return_code = 1
+    except BaseException:
+        traceback.print_exc()
+        return_code = 1
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(return_code)
+
+
+def _reap_children(children: dict, responses):
+    while children:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            return
+        if pid == 0:
+            return
+        if (job_id := children.pop(pid, None)) is not None:
+            responses.write(json.dumps({"id": job_id, "returncode": os.waitstatus_to_exitcode(status)}) + "\n")
+            responses.flush()
+
+
+def _install_sigchld_wakeup() -> tuple[int, int]:
+    """Returns self-pipe which becomes readable when any child exits - so main loop can block in select without polling"""
+    wakeup_read_fd, wakeup_write_fd = os.pipe()
+    os.set_blocking(wakeup_read_fd, False)
+    os.set_blocking(wakeup_write_fd, False)
+
+    def _on_sigchld(signum, frame):
+        try:
+            os.write(wakeup_write_fd, b"\0")
+        except BlockingIOError:  # pipe is full - main loop is going to wake up anyway
+            pass
+
+    signal.signal(signal.SIGCHLD, _on_sigchld)
+    return wakeup_read_fd, wakeup_write_fd
+
+
+def _drain(fd: int):
+    try:
+        while os.read(fd, 4096):
+            pass
+    except BlockingIOError:
+        pass
+
+
+def main():
+    module_path = sys.argv[1]
+    requests_fd = os.dup(0)
+    responses = os.fdopen(os.dup(1), "w", encoding="utf-8")
+    devnull = os.open(os.devnull, os.O_RDWR)
+    os.dup2(devnull, 0)
+    os.dup2(devnull, 1)
+    saved_stderr = os.dup(2)
+    os.dup2(devnull, 2)
+    os.close(devnull)
+
+    error = _preload(module_path)
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os.dup2(saved_stderr, 2)
+    os.close(saved_stderr)
+    responses.write(json.dumps({"ready": error is None, "error": error}) + "\n")
+    responses.flush()
+    if error:
+        return
+
+    children = {}
+    buffer = b""
+    wakeup_read_fd, wakeup_write_fd = _install_sigchld_wakeup()
+    protocol_fds = [requests_fd, responses.fileno(), wakeup_read_fd, wakeup_write_fd]
+    while True:
+        readable, _, _ = select.select([requests_fd, wakeup_read_fd], [], [])
+        if wakeup_read_fd in readable:
+            _drain(wakeup_read_fd)  # before reaping - so child exiting meanwhile wakes loop up again
+            _reap_children(children, responses)
+        if requests_fd in readable:
+            chunk = os.read(requests_fd, 65536)
+            if not chunk:
+                break
+            buffer += chunk
+            while b"\n" in buffer:
+                line, buffer = buffer.split(b"\n", 1)
+                if not line.strip():
+                    continue
+                job = json.loads(line)
+                pid = os.fork()
+                if pid == 0:
+                    _run_child(module_path, job, protocol_fds)
+                children[pid] = job["id"]
+                responses.write(json.dumps({"id": job["id"], "pid": pid}) + "\n")
+                responses.flush()
+
+if __name__ == "__main__":
+    main()
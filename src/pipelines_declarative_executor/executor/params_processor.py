@@ -8,8 +8,11 @@ class ParamsProcessor:
                  key: str, value: Any, source: dict, is_secure: bool) -> None:
         getattr(vars_storage, vars_dict_name)[key] = value
         vars_storage.vars_source[key] = source
+        vars_storage.mark_changed(vars_dict_name, key)
+        vars_storage.mark_changed('vars_source', key)
         if is_secure:
             vars_storage.secure_vars.add(key)
+            vars_storage.mark_changed('secure_vars', key)
 
     @staticmethod
     def file_source(source_path: str, is_remote: bool) -> dict:
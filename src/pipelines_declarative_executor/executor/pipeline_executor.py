@@ -5,9 +5,11 @@ from pathlib import Path
 
 from pipelines_declarative_executor.executor.context_files_processor import ContextFilesProcessor
 from pipelines_declarative_executor.executor.stage_processor import StageProcessor
-from pipelines_declarative_executor.model.stage import ExecutionStatus
+from pipelines_declarative_executor.executor.state_writer import StateWriter
+from pipelines_declarative_executor.model.stage import ExecutionStatus, Stage
 from pipelines_declarative_executor.model.exceptions import StageExecutionException
 from pipelines_declarative_executor.model.pipeline import PipelineExecution
+from pipelines_declarative_executor.report.report_collector import ReportCollector
 from pipelines_declarative_executor.report.report_summary_table import ReportSummaryTable
 from pipelines_declarative_executor.utils.color_utils import ColorUtils
 from pipelines_declarative_executor.utils.common_utils import CommonUtils
@@ -42,11 +44,17 @@ class PipelineExecutor:
     async def _process(execution: PipelineExecution, suppress_summary: bool = False) -> PipelineExecution:
         try:
             PipelineExecutor._execution_start(execution)
-            for stage in execution.pipeline.stages:
-                try:
-                    await StageProcessor.process(execution, stage)
-                except StageExecutionException:
-                    pass
+            if StateWriter.is_enabled():
+                execution.state_writer = StateWriter(execution)
+                execution.state_writer.start()
+            if execution.pipeline.has_stage_dependencies():
+                await PipelineExecutor._process_stages_graph(execution)
+            else:
+                for stage in execution.pipeline.stages:
+                    try:
+                        await StageProcessor.process(execution, stage)
+                    except StageExecutionException:
+                        pass
             ContextFilesProcessor.store_pipeline_results(execution)
         except asyncio.CancelledError:
             execution.logger.warning("Pipeline execution cancelled!")
@@ -54,6 +62,8 @@ class PipelineExecutor:
         except Exception as e:
             execution.logger.error(f"Exception during Pipeline execution: [{type(e)} - {str(e)}]")
         finally:
+            if execution.state_writer is not None:
+                await execution.state_writer.stop()
             PipelineExecutor._execution_finish(execution)
             try:
                 from pipelines_declarative_executor.executor.retry_processor import RetryProcessor
@@ -69,6 +79,29 @@ class PipelineExecutor:
                     return execution
         return execution
 
+    @staticmethod
+    async def _process_stages_graph(execution: PipelineExecution):
+        # each stage starts as soon as all stages it 'needs' are finished
+        async def _process_stage(stage: Stage, dependencies: list[asyncio.Task]):
+            if dependencies:
+                await asyncio.wait(dependencies)
+            try:
+                await StageProcessor.process(execution, stage)
+            except StageExecutionException:
+                pass
+
+        tasks: dict[str, asyncio.Task] = {}
+        for stage in execution.pipeline.stages:
+            dependencies = [tasks[uuid] for uuid in stage.needs or [] if uuid in tasks]
+            tasks[stage.uuid] = asyncio.create_task(_process_stage(stage, dependencies))
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+
     @staticmethod
     def _execution_start(execution: PipelineExecution):
         log_msg = (f"Execution Started"
@@ -86,6 +119,7 @@ class PipelineExecutor:
         execution.code = CommonUtils.calculate_final_code(execution)
         execution.finish_time = datetime.now()
         execution.store_state()
+        ReportCollector.release_nested_reports(execution)  # their final reports are in cached fragments by now
         log_msg = f"Execution Finished - {ColorUtils.colorize_status(execution.status)} - {execution.pipeline.logged_name()}"
         execution.logger.info("\n" + StringUtils.format_pipeline_header(log_msg))
         execution.logger.handlers.clear()  # clean up Logger
@@ -93,5 +127,5 @@ class PipelineExecutor:
     @staticmethod
     def _generate_summary(execution: PipelineExecution):
         execution.store_state()
-        execution.logger.info(f"\n{ReportSummaryTable.generate_summary_table(execution=execution)}")
+        ReportSummaryTable.log_summary_table(execution.logger, execution=execution)
         DebugDataCollector.collect_debug_data(execution=execution)
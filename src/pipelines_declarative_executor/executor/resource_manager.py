@@ -1,64 +1,172 @@
 import asyncio
+import itertools
 import logging
+import math
 import psutil
 
+from collections import deque
+
+from pipelines_declarative_executor.executor.host_slot_pool import HostSlotPool
 from pipelines_declarative_executor.utils.env_var_utils import EnvVar
 
 
+class ResourceRequest:
+    _arrival_counter = itertools.count()
+
+    def __init__(self, cpu: float, memory: float, queue_key: str):
+        self.cpu = cpu
+        self.memory = memory
+        self.queue_key = queue_key
+        self.arrival = next(ResourceRequest._arrival_counter)
+        self.future = asyncio.get_running_loop().create_future()
+        self.host_slots = None
+        self.memory_shortage_logged = False
+
+
 class ResourceManager:
+    """Admits stage subprocesses in fair order - FIFO inside each pipeline, least served pipeline first"""
 
     PEAKS = {
         "memory": {"value": 0.0, "datetime": None},
         "cpu": {"value": 0.0, "datetime": None}
     }
 
-    _current_count = 0
-    _lock = None
-    _condition = None
+    RECHECK_INTERVAL = 0.5
+
+    _used_cpu = 0.0
+    _queues: dict[str, deque[ResourceRequest]] = {}
+    _served_cpu: dict[str, float] = {}
+    _granted_count: dict[str, int] = {}
+    _recheck_handle: asyncio.TimerHandle = None
 
     @classmethod
-    def _initialize(cls):
-        if cls._lock is None:
-            cls._lock = asyncio.Lock()
-            cls._condition = asyncio.Condition(cls._lock)
+    def get_stage_request(cls, resources: dict = None) -> tuple[float, float]:
+        """Returns (cpu, memory in MB) requested by stage, defaulting to one 'slot' and REQUIRED_MEMORY_PER_SUBPROCESS"""
+        resources = resources or {}
+        cpu = resources.get("cpu", 1.0)
+        memory = resources.get("memory", EnvVar.REQUIRED_MEMORY_PER_SUBPROCESS)
+        return min(cpu, float(EnvVar.MAX_CONCURRENT_STAGES)), memory
 
     @classmethod
-    async def acquire(cls) -> bool:
-        cls._initialize()
-        async with cls._condition:
-            try:
-                await asyncio.wait_for(cls._wait_for_resources(), timeout=EnvVar.RESOURCE_MANAGER_QUEUE_TIMEOUT)
-                cls._current_count += 1
-                return True
-            except asyncio.TimeoutError:
-                return False
+    async def acquire(cls, resources: dict = None, queue_key: str = None) -> ResourceRequest | None:
+        """Waits until requested resources are granted, returns None on timeout (granted request should be passed to 'release')"""
+        cpu, memory = cls.get_stage_request(resources)
+        if resources and resources.get("cpu", 0) > cpu:
+            logging.warning(f"Requested cpu ({resources.get('cpu')}) exceeds MAX_CONCURRENT_STAGES ({EnvVar.MAX_CONCURRENT_STAGES}) - limiting it")
+        request = ResourceRequest(cpu, memory, queue_key)
+        if queue_key not in cls._queues:
+            # newly active pipeline starts on par with currently waiting ones, instead of catching up on their whole history
+            cls._served_cpu[queue_key] = max(cls._served_cpu.get(queue_key, 0.0),
+                                             min((cls._served_cpu.get(key, 0.0) for key in cls._queues), default=0.0))
+        cls._queues.setdefault(queue_key, deque()).append(request)
+        cls._dispatch()
+        try:
+            # not 'wait_for' - it swallows cancellation when request was already granted, and cancelled stage would keep running
+            async with asyncio.timeout(EnvVar.RESOURCE_MANAGER_QUEUE_TIMEOUT):
+                await asyncio.shield(request.future)
+            return request
+        except TimeoutError:
+            cls._withdraw(request)
+            return None
+        except asyncio.CancelledError:
+            cls._withdraw(request)
+            raise
+
+    @classmethod
+    async def release(cls, request: ResourceRequest):
+        cls._release_granted(request)
+        cls._dispatch()
+
+    @classmethod
+    def _release_granted(cls, request: ResourceRequest):
+        cls._used_cpu = max(0.0, cls._used_cpu - request.cpu)
+        HostSlotPool.release(request.host_slots)
+        request.host_slots = None
+        cls._granted_count[request.queue_key] -= 1
+        cls._forget_if_idle(request.queue_key)
 
     @classmethod
-    async def release(cls):
-        async with cls._condition:
-            cls._current_count = max(0, cls._current_count - 1)
-            cls._condition.notify_all()
+    def _withdraw(cls, request: ResourceRequest):
+        if request.future.done() and not request.future.cancelled():
+            # was granted while we were timing out/cancelled - give resources back
+            cls._release_granted(request)
+        else:
+            request.future.cancel()
+            cls._remove(request)
+        cls._dispatch()
 
     @classmethod
-    async def _wait_for_resources(cls):
-        while True:
-            if cls._can_acquire():
+    def _remove(cls, request: ResourceRequest):
+        if (queue := cls._queues.get(request.queue_key)) is not None:
+            if request in queue:
+                queue.remove(request)
+            if not queue:
+                cls._queues.pop(request.queue_key, None)
+                cls._forget_if_idle(request.queue_key)
+
+    @classmethod
+    def _forget_if_idle(cls, queue_key: str):
+        # keys are execution ids (new one for every nested execution too) - so served cpu of idle pipelines isn't kept forever
+        if queue_key not in cls._queues and not cls._granted_count.get(queue_key):
+            cls._served_cpu.pop(queue_key, None)
+            cls._granted_count.pop(queue_key, None)
+
+    @classmethod
+    def _dispatch(cls):
+        # only current head of queue is checked, so bigger requests can't be starved by smaller ones
+        reserved_memory = 0.0  # admitted in this pass, but not yet started - so not reflected in available memory
+        while head := cls._select_head():
+            if not cls._can_acquire(head, reserved_memory):
+                if cls._has_cpu(head):  # blocked by memory
+                    cls._schedule_recheck()
                 return
-            await cls._condition.wait()
+            if EnvVar.ENABLE_RESOURCE_MANAGER and HostSlotPool.is_enabled():
+                if not (host_slots := HostSlotPool.try_acquire(max(1, math.ceil(head.cpu)))):
+                    cls._schedule_recheck()  # slots are released by other processes - nothing will notify us
+                    return
+                head.host_slots = host_slots
+            cls._granted_count[head.queue_key] = cls._granted_count.get(head.queue_key, 0) + 1
+            cls._remove(head)
+            reserved_memory += head.memory
+            cls._used_cpu += head.cpu
+            cls._served_cpu[head.queue_key] = cls._served_cpu.get(head.queue_key, 0.0) + head.cpu
+            head.future.set_result(True)
+
+    @classmethod
+    def _select_head(cls) -> ResourceRequest | None:
+        heads = [queue[0] for queue in cls._queues.values() if queue]
+        if not heads:
+            return None
+        return min(heads, key=lambda r: (cls._served_cpu.get(r.queue_key, 0.0), r.arrival))
+
+    @classmethod
+    def _schedule_recheck(cls):
+        # memory or host slots might be freed by something other than our stages - so blocked head is periodically re-checked
+        if cls._recheck_handle is None:
+            def _recheck():
+                cls._recheck_handle = None
+                cls._dispatch()
+            cls._recheck_handle = asyncio.get_running_loop().call_later(cls.RECHECK_INTERVAL, _recheck)
+
+    @classmethod
+    def _has_cpu(cls, request: ResourceRequest) -> bool:
+        return cls._used_cpu + request.cpu <= EnvVar.MAX_CONCURRENT_STAGES
 
     @classmethod
-    def _can_acquire(cls) -> bool:
+    def _can_acquire(cls, request: ResourceRequest, reserved_memory: float = 0.0) -> bool:
         if not EnvVar.ENABLE_RESOURCE_MANAGER:
             return True
 
-        if cls._current_count >= EnvVar.MAX_CONCURRENT_STAGES:
+        if not cls._has_cpu(request):
             return False
 
         try:
-            required_memory = EnvVar.REQUIRED_MEMORY_PER_SUBPROCESS * 1024 * 1024  # to bytes
+            required_memory = (request.memory + reserved_memory) * 1024 * 1024  # to bytes
             available_memory = psutil.virtual_memory().available
             if available_memory < required_memory:
-                logging.warning("Not enough memory to start subprocess!")
+                if not request.memory_shortage_logged:  # blocked head is re-checked every RECHECK_INTERVAL
+                    logging.warning("Not enough memory to start subprocess!")
+                    request.memory_shortage_logged = True
                 return False
         except Exception as e:
             logging.error(f"Could not check available virtual memory: [{type(e)} - {str(e)}]")
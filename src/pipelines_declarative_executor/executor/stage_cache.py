@@ -0,0 +1,151 @@
+import os, json, uuid, shutil, asyncio, hashlib
+from datetime import datetime
+from pathlib import Path
+
+from pipelines_declarative_executor.model.pipeline import PipelineExecution
+from pipelines_declarative_executor.model.stage import Stage, StageType
+from pipelines_declarative_executor.utils.constants import Constants
+from pipelines_declarative_executor.utils.env_var_utils import EnvVar
+from pipelines_declarative_executor.x_modules_ops.job_data_registry import JobDataRegistry
+
+
+class StageCache:
+    """Content-addressed cache of stage results, keyed by stage definition and its evaluated inputs"""
+
+    CACHE_HIT = "HIT"
+    CACHE_MISS = "MISS"
+    CACHEABLE_TYPES = [StageType.PYTHON_MODULE, StageType.SHELL_COMMAND]
+    ENTRY_META_FILE_NAME = "cache_entry.json"
+    HASH_CHUNK_SIZE = 1024 * 1024
+
+    @staticmethod
+    def is_enabled(execution: PipelineExecution, stage: Stage) -> bool:
+        return (EnvVar.ENABLE_STAGE_CACHE and not execution.is_dry_run
+                and stage.type in StageCache.CACHEABLE_TYPES and stage.cache is not False)
+
+    @staticmethod
+    async def restore(execution: PipelineExecution, stage: Stage) -> bool:
+        """Restores stage results from cache into stage folder, returns False on cache miss"""
+        try:
+            key = await asyncio.to_thread(StageCache.calculate_key, stage)
+            stage.custom_data['cache_key'] = key
+            entry_dir = StageCache._cache_dir().joinpath(key)
+            if not entry_dir.joinpath(StageCache.ENTRY_META_FILE_NAME).exists():
+                stage.custom_data['cache'] = StageCache.CACHE_MISS
+                return False
+            await asyncio.to_thread(StageCache._restore_entry, entry_dir, stage.exec_dir)
+        except Exception as e:
+            execution.logger.warning(f"Failed to restore stage {stage.logged_name()} results from cache: [{type(e)} - {str(e)}]")
+            stage.custom_data['cache'] = StageCache.CACHE_MISS
+            return False
+        stage.custom_data['cache'] = StageCache.CACHE_HIT
+        execution.logger.info(f"Restored results of stage {stage.logged_name()} from cache (key={key[:12]}...)")
+        return True
+
+    @staticmethod
+    async def store(execution: PipelineExecution, stage: Stage):
+        if not (key := stage.custom_data.get('cache_key')):
+            return
+        try:
+            await asyncio.to_thread(StageCache._store_entry, key, stage)
+            await asyncio.to_thread(StageCache._evict)
+        except Exception as e:
+            execution.logger.warning(f"Failed to store stage {stage.logged_name()} results in cache: [{type(e)} - {str(e)}]")
+
+    @staticmethod
+    def calculate_key(stage: Stage) -> str:
+        hasher = hashlib.sha256()
+        stage_descriptor = {
+            "type": stage.type,
+            "path": stage.path,
+            "path_mtime": os.stat(stage.path).st_mtime_ns if stage.path and os.path.exists(stage.path) else None,
+            "command": stage.evaluated_params.get('command'),
+            "input": stage.evaluated_params.get('input'),
+        }
+        hasher.update(json.dumps(stage_descriptor, sort_keys=True, default=str).encode("utf-8"))
+        input_files_dir = stage.exec_dir.joinpath(Constants.STAGE_INPUT_FILES_DIR_NAME)
+        for file_path in sorted(p for p in input_files_dir.rglob("*") if p.is_file()):
+            hasher.update(file_path.relative_to(input_files_dir).as_posix().encode("utf-8") + b"\0")
+            with open(file_path, "rb") as file:
+                while chunk := file.read(StageCache.HASH_CHUNK_SIZE):
+                    hasher.update(chunk)
+        return hasher.hexdigest()
+
+    @staticmethod
+    def _cache_dir() -> Path:
+        return Path(EnvVar.STAGE_CACHE_DIR)
+
+    @staticmethod
+    def _cached_relative_paths(stage_dir: Path) -> list[Path]:
+        registry = JobDataRegistry(stage_dir)
+        logs_dir = stage_dir.joinpath(Constants.STAGE_LOGS_DIR_NAME)
+        cached_paths = [registry.output_params_filepath, registry.output_params_secure_filepath, registry.output_files_dirpath,
+                        logs_dir.joinpath(Constants.STAGE_REPORT_JSON_FILE_NAME), logs_dir.joinpath(Constants.STAGE_REPORT_YAML_FILE_NAME)]
+        return [path.relative_to(stage_dir) for path in cached_paths]
+
+    @staticmethod
+    def _restore_entry(entry_dir: Path, stage_dir: Path):
+        for relative_path in StageCache._cached_relative_paths(stage_dir):
+            cached_path = entry_dir.joinpath(relative_path)
+            if not cached_path.exists():
+                continue
+            target_path = stage_dir.joinpath(relative_path)
+            if cached_path.is_dir():
+                shutil.copytree(cached_path, target_path, dirs_exist_ok=True)
+            else:
+                target_path.parent.mkdir(parents=True, exist_ok=True)
+                shutil.copyfile(cached_path, target_path)
+        os.utime(entry_dir.joinpath(StageCache.ENTRY_META_FILE_NAME))  # marks entry as recently used
+
+    @staticmethod
+    def _store_entry(key: str, stage: Stage):
+        cache_dir = StageCache._cache_dir()
+        entry_dir = cache_dir.joinpath(key)
+        if entry_dir.exists():
+            return
+        temp_dir = cache_dir.joinpath(f".tmp-{key}-{uuid.uuid4().hex[:8]}")
+        try:
+            size = 0
+            for relative_path in StageCache._cached_relative_paths(stage.exec_dir):
+                stage_path = stage.exec_dir.joinpath(relative_path)
+                if not stage_path.exists():
+                    continue
+                cached_path = temp_dir.joinpath(relative_path)
+                if stage_path.is_dir():
+                    shutil.copytree(stage_path, cached_path)
+                    size += sum(p.stat().st_size for p in cached_path.rglob("*") if p.is_file())
+                else:
+                    cached_path.parent.mkdir(parents=True, exist_ok=True)
+                    shutil.copyfile(stage_path, cached_path)
+                    size += cached_path.stat().st_size
+            temp_dir.mkdir(parents=True, exist_ok=True)
+            with open(temp_dir.joinpath(StageCache.ENTRY_META_FILE_NAME), "w") as meta_file:
+                json.dump({"stage": stage.name, "path": stage.path, "size": size, "created": datetime.now().isoformat()}, meta_file)
+            os.replace(temp_dir, entry_dir)
+        except OSError:
+            if entry_dir.exists():  # stored concurrently by another stage with same key
+                return
+            raise
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    @staticmethod
+    def _evict():
+        entries, total_size = [], 0
+        for entry_dir in StageCache._cache_dir().iterdir():
+            meta_path = entry_dir.joinpath(StageCache.ENTRY_META_FILE_NAME)
+            if entry_dir.name.startswith(".tmp-") or not meta_path.exists():
+                continue
+            try:
+                with open(meta_path) as meta_file:
+                    size = json.load(meta_file).get("size", 0)
+                entries.append((meta_path.stat().st_mtime, size, entry_dir))
+                total_size += size
+            except (OSError, ValueError):
+                continue
+        max_size = EnvVar.STAGE_CACHE_MAX_SIZE_MB * 1024 * 1024
+        for _, size, entry_dir in sorted(entries, key=lambda entry: entry[0]):
+            if total_size <= max_size:
+                break
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total_size -= size
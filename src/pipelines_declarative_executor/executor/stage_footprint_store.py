@@ -0,0 +1,89 @@
+import os, json, math, uuid, hashlib, logging
+
+from pathlib import Path
+
+from pipelines_declarative_executor.model.stage import Stage
+from pipelines_declarative_executor.utils.env_var_utils import EnvVar
+
+
+class StageFootprintStore:
+    """Local history of stages' peak memory usage, used to reserve learned footprint instead of a constant one"""
+
+    PERCENTILE = 95
+
+    _footprints: dict[str, list[float]] = None
+    _recorded: dict[str, list[float]] = {}
+
+    @staticmethod
+    def is_enabled() -> bool:
+        return EnvVar.ENABLE_STAGE_FOOTPRINT_STORE and EnvVar.ENABLE_RESOURCE_MANAGER
+
+    @staticmethod
+    def calculate_key(stage: Stage) -> str:
+        return hashlib.sha256(f"{stage.type}\0{stage.path}\0{stage.command}".encode("utf-8")).hexdigest()[:32]
+
+    @staticmethod
+    def resolve_resources(stage: Stage) -> dict | None:
+        """Returns stage resources, with learned memory footprint when stage doesn't declare it explicitly"""
+        if not StageFootprintStore.is_enabled() or (stage.resources and "memory" in stage.resources):
+            return stage.resources
+        if (memory := StageFootprintStore.get_memory_estimate(stage)) is None:
+            return stage.resources
+        stage.custom_data['reserved_memory_mb'] = round(memory, 1)
+        return {**(stage.resources or {}), "memory": memory}
+
+    @staticmethod
+    def get_memory_estimate(stage: Stage) -> float | None:
+        samples = StageFootprintStore._load().get(StageFootprintStore.calculate_key(stage))
+        if not samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[max(0, math.ceil(len(ordered) * StageFootprintStore.PERCENTILE / 100) - 1)]
+
+    @staticmethod
+    def record(stage: Stage, peak_memory_mb: float):
+        if not StageFootprintStore.is_enabled() or peak_memory_mb <= 0:
+            return
+        key = StageFootprintStore.calculate_key(stage)
+        for footprints in [StageFootprintStore._load(), StageFootprintStore._recorded]:
+            samples = footprints.setdefault(key, [])
+            samples.append(round(peak_memory_mb, 1))
+            del samples[:-EnvVar.STAGE_FOOTPRINT_HISTORY_SIZE]
+
+    @staticmethod
+    def save():
+        """Merges footprints recorded during this execution into store file (re-read to keep concurrent executions' samples)"""
+        if not StageFootprintStore._recorded:
+            return
+        store_path = Path(EnvVar.STAGE_FOOTPRINT_STORE_PATH)
+        try:
+            footprints = StageFootprintStore._read(store_path)
+            for key, samples in StageFootprintStore._recorded.items():
+                merged_samples = footprints.setdefault(key, [])
+                merged_samples.extend(samples)
+                del merged_samples[:-EnvVar.STAGE_FOOTPRINT_HISTORY_SIZE]
+            store_path.parent.mkdir(parents=True, exist_ok=True)
+            temp_path = store_path.with_name(f".{store_path.name}.{uuid.uuid4().hex[:8]}")
+            with open(temp_path, "w", encoding="utf-8") as store_file:
+                json.dump(footprints, store_file)
+            os.replace(temp_path, store_path)
+            StageFootprintStore._recorded.clear()
+        except Exception as e:
+            logging.warning(f"Failed to save stage footprints to '{store_path}': [{type(e)} - {str(e)}]")
+
+    @staticmethod
+    def _load() -> dict[str, list[float]]:
+        if StageFootprintStore._footprints is None:
+            StageFootprintStore._footprints = StageFootprintStore._read(Path(EnvVar.STAGE_FOOTPRINT_STORE_PATH))
+        return StageFootprintStore._footprints
+
+    @staticmethod
+    def _read(store_path: Path) -> dict[str, list[float]]:
+        try:
+            with open(store_path, "r", encoding="utf-8") as store_file:
+                return json.load(store_file)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logging.warning(f"Failed to read stage footprints from '{store_path}': [{type(e)} - {str(e)}]")
+            return {}
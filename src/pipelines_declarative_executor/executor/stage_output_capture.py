@@ -0,0 +1,105 @@
+import asyncio, time
+
+from collections import deque
+from pathlib import Path
+
+from pipelines_declarative_executor.utils.env_var_utils import EnvVar
+
+
+class StageOutputCapture:
+    """Streams stage output into log file, keeping only bounded tail of its lines in memory"""
+
+    READ_CHUNK_SIZE = 64 * 1024
+    MAX_LINE_LENGTH = 4096
+    LOG_FLUSH_SIZE = 1024 * 1024
+    LOG_FLUSH_INTERVAL = 1.0
+
+    def __init__(self, log_file_path: Path = None, max_lines: int = None):
+        self.log_file_path = log_file_path
+        self.lines = deque(maxlen=max_lines or EnvVar.STAGE_OUTPUT_TAIL_LINES)
+        self.total_lines = 0
+        self._pending = bytearray()
+        self._skip_until_newline = False
+
+    @property
+    def omitted_lines(self) -> int:
+        return self.total_lines - len(self.lines)
+
+    def has_output(self) -> bool:
+        return self.total_lines > 0
+
+    async def consume_stream(self, stream: asyncio.StreamReader):
+        log_file = await asyncio.to_thread(self.log_file_path.open, "wb") if self.log_file_path else None
+        # chunks are batched and written off the event loop, so slow disk doesn't stall other stages
+        buffer = bytearray()
+        last_flush = time.monotonic()
+        try:
+            while chunk := await stream.read(self.READ_CHUNK_SIZE):
+                if log_file:
+                    buffer.extend(chunk)
+                    if len(buffer) >= self.LOG_FLUSH_SIZE or time.monotonic() - last_flush >= self.LOG_FLUSH_INTERVAL:
+                        await asyncio.to_thread(self._write_log, log_file, bytes(buffer))
+                        buffer.clear()
+                        last_flush = time.monotonic()
+                self._feed(chunk)
+            self._finish()
+        finally:
+            if log_file:
+                await asyncio.to_thread(self._close_log, log_file, bytes(buffer))
+
+    @staticmethod
+    def _write_log(log_file, data: bytes):
+        log_file.write(data)
+        log_file.flush()
+
+    @staticmethod
+    def _close_log(log_file, data: bytes):
+        try:
+            log_file.write(data)
+        finally:
+            log_file.close()
+
+    def consume_log_file(self):
+        """Collects tail from already written log file (when output was redirected into it directly)"""
+        if not self.log_file_path or not self.log_file_path.exists():
+            return
+        with self.log_file_path.open("rb") as log_file:
+            while chunk := log_file.read(self.READ_CHUNK_SIZE):
+                self._feed(chunk)
+        self._finish()
+
+    def render(self) -> str:
+        text = "\n".join(self.lines).strip()
+        if self.omitted_lines:
+            location = f", full output is in \"{self.log_file_path.as_posix()}\"" if self.log_file_path else ""
+            text = f"... {self.omitted_lines} earlier lines omitted{location} ...\n{text}"
+        return text
+
+    def _feed(self, chunk: bytes):
+        self._pending.extend(chunk)
+        start = 0
+        while (end := self._pending.find(b"\n", start)) != -1:
+            if self._skip_until_newline:
+                self._skip_until_newline = False
+            else:
+                self._add_line(self._pending[start:end])
+            start = end + 1
+        del self._pending[:start]
+        if len(self._pending) > self.MAX_LINE_LENGTH:
+            if not self._skip_until_newline:
+                self._add_line(self._pending)
+                self._skip_until_newline = True
+            self._pending.clear()
+
+    def _finish(self):
+        if self._pending and not self._skip_until_newline:
+            self._add_line(self._pending)
+        self._pending.clear()
+        self._skip_until_newline = False
+
+    def _add_line(self, line: bytes):
+        self.total_lines += 1
+        line = line.rstrip(b"\r")
+        if len(line) > self.MAX_LINE_LENGTH:
+            line = line[:self.MAX_LINE_LENGTH] + b"..."
+        self.lines.append(line.decode(errors="ignore"))
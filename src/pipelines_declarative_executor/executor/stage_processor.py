@@ -1,15 +1,22 @@
-import os, asyncio
+import os, asyncio, shlex, time
 from datetime import datetime
 
 from pipelines_declarative_executor.executor.condition_processor import ConditionProcessor
 from pipelines_declarative_executor.executor.context_files_processor import ContextFilesProcessor
 from pipelines_declarative_executor.executor.params_processor import ParamsProcessor
+from pipelines_declarative_executor.executor.module_fork_server import ModuleForkServer
+from pipelines_declarative_executor.executor.module_worker_pool import ModuleWorkerPool
 from pipelines_declarative_executor.executor.resource_manager import ResourceManager
+from pipelines_declarative_executor.executor.stage_cache import StageCache
+from pipelines_declarative_executor.executor.stage_footprint_store import StageFootprintStore
+from pipelines_declarative_executor.executor.stage_output_capture import StageOutputCapture
+from pipelines_declarative_executor.model.executor import ModuleExecutionMode
 from pipelines_declarative_executor.model.stage import ExecutionStatus, Stage, StageType, COMPLEX_TYPES
 from pipelines_declarative_executor.model.exceptions import StageExecutionException, PipelineExecutorException
 from pipelines_declarative_executor.model.pipeline import PipelineExecution
 from pipelines_declarative_executor.orchestrator.pipeline_orchestrator import PipelineOrchestrator
 from pipelines_declarative_executor.orchestrator.retry_orchestrator import PipelineRetryOrchestrator
+from pipelines_declarative_executor.report.report_collector import ReportCollector
 from pipelines_declarative_executor.utils.color_utils import ColorUtils
 from pipelines_declarative_executor.utils.common_utils import CommonUtils
 from pipelines_declarative_executor.utils.constants import Constants
@@ -22,8 +29,6 @@ from pipelines_declarative_executor.x_modules_ops.dict_utils import UtilsDiction
 
 class StageProcessor:
 
-    RETRY_NESTED_FLAG = "_need_to_retry_nested"
-
     @staticmethod
     async def process(execution: PipelineExecution, stage: Stage, parent_stage: Stage = None):
 
@@ -34,19 +39,23 @@ class StageProcessor:
         is_first_run = stage.is_first_run()
         StageProcessor._pre_process(execution, stage, is_first_run)
 
-        if not ConditionProcessor.need_to_execute(execution, stage.when):
+        if not ConditionProcessor.need_to_execute(execution, stage.when, stage):
             stage.status = ExecutionStatus.SKIPPED
             StageProcessor._post_process(execution, stage)
             return
 
         stage.status = ExecutionStatus.IN_PROGRESS
-        execution.store_state() # just for UI realtime rendering?
+        execution.store_state(stage) # just for UI realtime rendering?
 
         try:
             ContextFilesProcessor.prepare_stage_folder(execution, stage, parent_stage)
             if stage.type in [StageType.PYTHON_MODULE, StageType.REPORT, StageType.SHELL_COMMAND]:
                 command, logged_cmd_name = StageProcessor._build_shell_command(stage)
-                await StageProcessor._run_shell_command(stage, execution, command, logged_cmd_name=logged_cmd_name)
+                use_cache = StageCache.is_enabled(execution, stage)
+                if not (use_cache and await StageCache.restore(execution, stage)):
+                    await StageProcessor._run_shell_command(stage, execution, command, logged_cmd_name=logged_cmd_name)
+                    if use_cache:
+                        await StageCache.store(execution, stage)
             elif stage.type == StageType.PARALLEL_BLOCK:
                 await StageProcessor._run_parallel_block(execution, stage)
             elif stage.type == StageType.ATLAS_PIPELINE_TRIGGER:
@@ -80,7 +89,7 @@ class StageProcessor:
             return True
 
         if stage.type == StageType.ATLAS_PIPELINE_TRIGGER and stage.status == ExecutionStatus.IN_PROGRESS:
-            setattr(stage, StageProcessor.RETRY_NESTED_FLAG, True)
+            stage.retry_nested = True
             return False
 
         raise PipelineExecutorException(
@@ -103,7 +112,7 @@ class StageProcessor:
         stage.finish_time = datetime.now()
         total_time_log = f" (time: {stage.logged_time()})" if stage.type not in COMPLEX_TYPES else ""
         execution.logger.info(f"Finish processing stage {stage.logged_name()} - {ColorUtils.colorize_status(stage.status)}{total_time_log}")
-        execution.store_state()
+        execution.store_state(stage)
 
     @staticmethod
     def _build_shell_command(stage: Stage) -> tuple[str, str]:
@@ -131,47 +140,154 @@ class StageProcessor:
             execution.logger.debug(f'{stage.logged_name()} - [{logged_cmd_name}] skipped in DRY RUN')
             return
 
-        if not await ResourceManager.acquire():
+        resources = StageFootprintStore.resolve_resources(stage)
+        profile_usage = EnvVar.ENABLE_STAGE_RESOURCE_USAGE_PROFILING or StageFootprintStore.is_enabled()
+        queue_start = time.perf_counter()
+        if not (resources_grant := await ResourceManager.acquire(resources, queue_key=execution.pipeline.id)):
             raise Exception(f"Resource acquisition timeout for stage {stage.logged_name()}")
+        stage.custom_data['queue_wait'] = round(time.perf_counter() - queue_start, 3)
+
+        return_code, stdout, stderr, profiling_task, metrics = None, None, None, None, None
+
+        def _on_process_start(pid: int):
+            nonlocal profiling_task, metrics
+            if profile_usage and pid:
+                metrics = ProfilingUtils.get_profiling_metrics()
+                profiling_task = asyncio.create_task(ProfilingUtils.profile_process(pid=pid, metrics=metrics))
+
+        try:
+            fork_server = await ModuleForkServer.get(stage.path) if StageProcessor._use_module_execution_mode(stage, ModuleExecutionMode.FORK_SERVER) else None
+            if StageProcessor._use_module_execution_mode(stage, ModuleExecutionMode.WORKER_POOL):
+                return_code, stdout, stderr = await StageProcessor._run_in_module_worker(stage, execution, _on_process_start)
+            elif fork_server:
+                return_code, stdout, stderr = await StageProcessor._run_in_fork_server(stage, execution, fork_server, _on_process_start)
+            else:
+                return_code, stdout, stderr = await StageProcessor._run_in_subprocess(stage, execution, cmd, _on_process_start)
+
+        finally:
+            try:
+                await ResourceManager.release(resources_grant)
+            except Exception as e:
+                execution.logger.error(f"Error releasing resources: [{type(e)} - {str(e)}]")
+            if profile_usage:
+                await StageProcessor._run_shell_command_finalize(stage, profiling_task, metrics)
+                if metrics and return_code is not None and return_code >= 0:
+                    StageFootprintStore.record(stage, metrics['peak_memory_mb'])
+
+        # Normal failure exits with a positive code, negative means our subprocess was killed by a signal - cancel case
+        # Can also be a false positive due to OOM - but we can still treat that as cancellation
+        if return_code is not None and return_code < 0:
+            execution.logger.warning(f"Shell subprocess for stage {stage.logged_name()} was terminated by signal {-return_code} - treating as cancellation")
+            raise asyncio.CancelledError
+
+        await StageProcessor._run_shell_command_log(stage, execution, return_code, stdout, stderr, expected_return_code, logged_cmd_name)
 
-        process, stdout, stderr, profiling_task, metrics = None, None, None, None, None
+    @staticmethod
+    async def _run_in_subprocess(stage: Stage, execution: PipelineExecution, cmd: str, on_process_start) -> tuple[int, StageOutputCapture, StageOutputCapture]:
+        process, output_task, completion = None, None, None
         try:
             use_cwd = stage.type == StageType.SHELL_COMMAND
+            stdout, stderr = StageProcessor._prepare_output_captures(stage)
             process = await asyncio.create_subprocess_shell(cmd, cwd=stage.exec_dir if use_cwd else None, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
-            if EnvVar.ENABLE_STAGE_RESOURCE_USAGE_PROFILING and process.pid:
-                metrics = ProfilingUtils.get_profiling_metrics()
-                profiling_task = asyncio.create_task(ProfilingUtils.profile_process(pid=process.pid, metrics=metrics))
+            on_process_start(process.pid)
+            output_task = asyncio.gather(stdout.consume_stream(process.stdout), stderr.consume_stream(process.stderr))
             try:
-                stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=EnvVar.SHELL_PROCESS_TIMEOUT)
+                completion = asyncio.gather(output_task, process.wait())
+                await asyncio.wait_for(completion, timeout=EnvVar.SHELL_PROCESS_TIMEOUT)
             except asyncio.TimeoutError:
                 if process:
-                    process.kill() # instead of terminate
+                    StageProcessor._kill_process_tree(process) # instead of terminate
                     await process.wait()
                 raise Exception(f"Shell command timed out after {EnvVar.SHELL_PROCESS_TIMEOUT} seconds")
+            return process.returncode, stdout, stderr
 
         except asyncio.CancelledError:
             execution.logger.warning(f"Shell Execution cancelled! (stage {stage.logged_name()})")
             if process:
-                process.kill()
+                StageProcessor._kill_process_tree(process)
                 await process.wait()
+            if completion and completion.done() and not completion.cancelled():
+                completion.exception()  # consumed, so it isn't reported as never retrieved
             raise
-
         finally:
+            if output_task and not output_task.done():
+                output_task.cancel()
+
+    @staticmethod
+    def _kill_process_tree(process: asyncio.subprocess.Process):
+        # shell might have forked command instead of exec-ing it - killing only the shell would leave command running (and holding our pipes)
+        try:
+            import psutil
+            children = psutil.Process(process.pid).children(recursive=True)
+        except Exception:
+            children = []
+        process.kill()
+        for child in children:
             try:
-                await ResourceManager.release()
-            except Exception as e:
-                execution.logger.error(f"Error releasing resources: [{type(e)} - {str(e)}]")
-            if EnvVar.ENABLE_STAGE_RESOURCE_USAGE_PROFILING:
-                await StageProcessor._run_shell_command_finalize(stage, profiling_task, metrics)
+                child.kill()
+            except Exception:
+                pass
 
-        # Normal failure exits with a positive code, negative means our subprocess was killed by a signal - cancel case
-        # Can also be a false positive due to OOM - but we can still treat that as cancellation
-        if process and process.returncode is not None and process.returncode < 0:
-            execution.logger.warning(f"Shell subprocess for stage {stage.logged_name()} was terminated by signal {-process.returncode} - treating as cancellation")
-            raise asyncio.CancelledError
+    @staticmethod
+    def _use_module_execution_mode(stage: Stage, mode: ModuleExecutionMode) -> bool:
+        return (EnvVar.PYTHON_MODULE_EXECUTION_MODE == mode
+                and stage.type in [StageType.PYTHON_MODULE, StageType.REPORT] and bool(stage.path))
 
-        await StageProcessor._run_shell_command_log(stage, execution, process, stdout, stderr, expected_return_code, logged_cmd_name)
+    @staticmethod
+    def _prepare_output_captures(stage: Stage) -> tuple[StageOutputCapture, StageOutputCapture]:
+        if StageProcessor._need_to_mask_output(stage):
+            return StageOutputCapture(), StageOutputCapture()
+        logs_dir = stage.exec_dir.joinpath(Constants.STAGE_LOGS_DIR_NAME)
+        logs_dir.mkdir(parents=True, exist_ok=True)
+        return (StageOutputCapture(logs_dir.joinpath(Constants.STAGE_STDOUT_LOG_FILE_NAME)),
+                StageOutputCapture(logs_dir.joinpath(Constants.STAGE_STDERR_LOG_FILE_NAME)))
+
+    @staticmethod
+    def _prepare_module_invocation(stage: Stage) -> tuple[list[str], StageOutputCapture, StageOutputCapture]:
+        args = [*shlex.split(stage.evaluated_params.get('command') or ""),
+                f"--context_path={stage.exec_dir.joinpath('context.yaml')}",
+                f"--log-level={LoggingUtils.get_log_level_name()}"]
+        return args, *StageProcessor._prepare_output_captures(stage)
+
+    @staticmethod
+    async def _run_in_fork_server(stage: Stage, execution: PipelineExecution, fork_server: ModuleForkServer, on_process_start) -> tuple[int, StageOutputCapture, StageOutputCapture]:
+        args, stdout, stderr = StageProcessor._prepare_module_invocation(stage)
+        process = await fork_server.spawn(args, stdout.log_file_path, stderr.log_file_path)
+        try:
+            on_process_start(process.pid)
+            return_code = await asyncio.wait_for(process.wait(), timeout=EnvVar.SHELL_PROCESS_TIMEOUT)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            raise Exception(f"Forked module process timed out after {EnvVar.SHELL_PROCESS_TIMEOUT} seconds")
+        except asyncio.CancelledError:
+            execution.logger.warning(f"Forked module execution cancelled! (stage {stage.logged_name()})")
+            process.kill()
+            await process.wait()
+            raise
+        stdout.consume_log_file()
+        stderr.consume_log_file()
+        return return_code, stdout, stderr
 
+    @staticmethod
+    async def _run_in_module_worker(stage: Stage, execution: PipelineExecution, on_process_start) -> tuple[int, StageOutputCapture, StageOutputCapture]:
+        args, stdout, stderr = StageProcessor._prepare_module_invocation(stage)
+        worker = await ModuleWorkerPool.acquire(stage.path)
+        is_reusable = False
+        try:
+            on_process_start(worker.pid)
+            return_code = await asyncio.wait_for(worker.run(args, stdout.log_file_path, stderr.log_file_path), timeout=EnvVar.SHELL_PROCESS_TIMEOUT)
+            is_reusable = True
+        except asyncio.TimeoutError:
+            raise Exception(f"Module worker timed out after {EnvVar.SHELL_PROCESS_TIMEOUT} seconds")
+        except asyncio.CancelledError:
+            execution.logger.warning(f"Module worker execution cancelled! (stage {stage.logged_name()})")
+            raise
+        finally:
+            await ModuleWorkerPool.release(worker, reusable=is_reusable)
+        stdout.consume_log_file()
+        stderr.consume_log_file()
+        return return_code, stdout, stderr
 
     @staticmethod
     async def _run_shell_command_finalize(stage: Stage, profiling_task: asyncio.Task, metrics: dict):
@@ -191,31 +307,76 @@ class StageProcessor:
             })
 
     @staticmethod
-    async def _run_shell_command_log(stage: Stage, execution: PipelineExecution, process, stdout, stderr, expected_return_code: int, logged_cmd_name: str):
-        header_color = ColorUtils.SUCCESS_COLOR if process.returncode == expected_return_code else ColorUtils.FAILURE_COLOR
+    def _need_to_mask_output(stage: Stage) -> bool:
+        return bool(EnvVar.STRICT_MODE and stage.type == StageType.SHELL_COMMAND and stage.custom_data.get('command_used_secure'))
+
+    @staticmethod
+    async def _run_shell_command_log(stage: Stage, execution: PipelineExecution, return_code: int, stdout: StageOutputCapture, stderr: StageOutputCapture,
+                                     expected_return_code: int, logged_cmd_name: str):
+        header_color = ColorUtils.SUCCESS_COLOR if return_code == expected_return_code else ColorUtils.FAILURE_COLOR
         header = ColorUtils.with_color(message=f" Stage Output from {stage.logged_name()}", color=header_color)
-        need_to_mask_output = EnvVar.STRICT_MODE and stage.type == StageType.SHELL_COMMAND and stage.custom_data.get('command_used_secure')
-        masked_output = StringUtils.indent_lines(f"{Constants.DEFAULT_MASKED_VALUE} - Shell output is masked in STRICT_MODE") if need_to_mask_output else None
+        masked_output = StringUtils.indent_lines(f"{Constants.DEFAULT_MASKED_VALUE} - Shell output is masked in STRICT_MODE") if StageProcessor._need_to_mask_output(stage) else None
         with LoggingUtils.collapsible_section(header=header, stage=stage):
-            if stdout and EnvVar.ENABLE_MODULE_STDOUT_LOG:
-                normalized_output = masked_output or StringUtils.indent_lines(StringUtils.normalize_line_endings(stdout.decode(errors="ignore").strip()))
-                execution.logger.info(f'Shell STDOUT for {stage.logged_name()} (return_code={process.returncode}):\n{normalized_output}')
-            if stderr or process.returncode != expected_return_code:
-                if stderr:
-                    normalized_output = masked_output or StringUtils.indent_lines(StringUtils.normalize_line_endings(stderr.decode(errors="ignore").strip()))
-                    execution.logger.error(f'Shell STDERR for {stage.logged_name()} (return_code={process.returncode}):\n{normalized_output}')
+            if stdout.has_output() and EnvVar.ENABLE_MODULE_STDOUT_LOG:
+                normalized_output = masked_output or StringUtils.indent_lines(stdout.render())
+                execution.logger.info(f'Shell STDOUT for {stage.logged_name()} (return_code={return_code}):\n{normalized_output}')
+            if stderr.has_output() or return_code != expected_return_code:
+                if stderr.has_output():
+                    normalized_output = masked_output or StringUtils.indent_lines(stderr.render())
+                    execution.logger.error(f'Shell STDERR for {stage.logged_name()} (return_code={return_code}):\n{normalized_output}')
                 raise Exception(f"Error during {stage.logged_name()} - \"{logged_cmd_name}\"")
 
     @staticmethod
     async def _run_parallel_block(execution: PipelineExecution, parent_stage: Stage):
+        if parent_stage.matrix is not None and not parent_stage.nested_parallel_stages:
+            parent_stage.nested_parallel_stages = PipelineOrchestrator.expand_matrix_stage(parent_stage, execution.vars)
+            execution.store_state(parent_stage, with_nested=True)
         execution.logger.info(f'Processing parallel block with multiple ({len(parent_stage.nested_parallel_stages)}) stages... (stage {parent_stage.logged_name()})')
+        semaphore = asyncio.Semaphore(parent_stage.max_parallel) if parent_stage.max_parallel else None
+        tasks = {asyncio.create_task(StageProcessor._run_parallel_stage(execution, nested_stage, parent_stage, semaphore)): nested_stage
+                 for nested_stage in parent_stage.nested_parallel_stages}
         try:
-            tasks = [StageProcessor.process(execution, nested_stage, parent_stage) for nested_stage in parent_stage.nested_parallel_stages]
-            await asyncio.gather(*tasks, return_exceptions=True)
-            parent_stage.status = CommonUtils.calculate_final_status(parent_stage.nested_parallel_stages)
+            if parent_stage.fail_fast and await StageProcessor._wait_fail_fast(execution, parent_stage, tasks):
+                parent_stage.status = ExecutionStatus.FAILED
+            else:
+                await asyncio.gather(*tasks, return_exceptions=True)
+                parent_stage.status = CommonUtils.calculate_final_status(parent_stage.nested_parallel_stages)
         except asyncio.CancelledError:
             execution.logger.warning(f"Parallel block execution cancelled! (stage {parent_stage.logged_name()})")
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+    @staticmethod
+    async def _run_parallel_stage(execution: PipelineExecution, stage: Stage, parent_stage: Stage, semaphore: asyncio.Semaphore = None):
+        if semaphore is None:
+            return await StageProcessor.process(execution, stage, parent_stage)
+        try:
+            await semaphore.acquire()
+        except asyncio.CancelledError:
+            stage.status = ExecutionStatus.CANCELLED  # was waiting for its turn in block
+            execution.store_state(stage)
             raise
+        try:
+            await StageProcessor.process(execution, stage, parent_stage)
+        finally:
+            if not (parent_stage.fail_fast and stage.status == ExecutionStatus.FAILED):
+                semaphore.release()  # failed stage of fail-fast block keeps its slot - so waiting siblings are cancelled instead of started
+
+    @staticmethod
+    async def _wait_fail_fast(execution: PipelineExecution, parent_stage: Stage, tasks: dict[asyncio.Task, Stage]) -> bool:
+        """Waits for block's stages, cancelling remaining ones as soon as any of them fails. Returns True if block was cut short"""
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            if any(tasks[task].status == ExecutionStatus.FAILED for task in done) and pending:
+                execution.logger.warning(f"Stage failed in fail-fast parallel block - cancelling {len(pending)} remaining stage(s) (stage {parent_stage.logged_name()})")
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                return True
+        return False
 
     @staticmethod
     async def _run_nested_pipeline(execution: PipelineExecution, stage: Stage):
@@ -223,32 +384,32 @@ class StageProcessor:
             execution.logger.info(f'Processing nested pipeline... (stage {stage.logged_name()})')
             input_calculated, _ = CommonUtils.calculate_dict_values(execution, stage.input)
 
-            state_dir = stage.exec_dir.joinpath(Constants.PIPELINE_STATE_DIR_NAME)
-            if (execution.is_retry and getattr(stage, StageProcessor.RETRY_NESTED_FLAG, False)
-                    and state_dir.joinpath(Constants.STATE_EXECUTION_FILE_NAME).exists()):
-                nested_execution = PipelineRetryOrchestrator.create_execution_from_dict(
-                    CommonUtils.load_json_file(state_dir.joinpath(Constants.STATE_EXECUTION_FILE_NAME)),
-                    stage.exec_dir, execution.inputs.get("retry_vars")
-                )
-                nested_execution.pipeline = PipelineRetryOrchestrator.load_pipeline_from_dict(
-                    CommonUtils.load_json_file(state_dir.joinpath(Constants.STATE_PIPELINE_FILE_NAME))
-                )
-                nested_execution.vars = PipelineRetryOrchestrator.load_vars_from_dict(
-                    CommonUtils.load_json_file(state_dir.joinpath(Constants.STATE_VARS_FILE_NAME)), clear_stage_vars=True
-                )
+            old_execution = None
+            if execution.is_retry and stage.retry_nested:
+                old_execution, old_pipeline, old_vars = PipelineRetryOrchestrator.load_state_dicts(stage.exec_dir)
+            if old_execution is not None:
+                nested_execution = PipelineRetryOrchestrator.create_execution_from_dict(old_execution, stage.exec_dir, execution.inputs.get("retry_vars"))
+                nested_execution.pipeline = PipelineRetryOrchestrator.load_pipeline_from_dict(old_pipeline)
+                nested_execution.vars = PipelineRetryOrchestrator.load_vars_from_dict(old_vars, clear_stage_vars=True)
                 for key, value in execution.vars.vars_retry.items():
                     ParamsProcessor.set_retry_var(nested_execution.vars, key, value)
             else:
                 nested_execution = PipelineOrchestrator.prepare_pipeline_execution(**StageProcessor._extract_nested_params(input_calculated))
 
+            nested_execution.state_store = execution.state_store
+            ReportCollector.publish_nested_execution(execution, stage, nested_execution)
             from pipelines_declarative_executor.executor.pipeline_executor import PipelineExecutor
-            nested_execution = await PipelineExecutor.start(
-                nested_execution,
-                execution_folder_path=stage.exec_dir,
-                is_dry_run=execution.is_dry_run or StringUtils.to_bool(UtilsDictionary.get_by_path(input_calculated, "params.params.IS_DRY_RUN")),
-                wait_for_finish=True,
-                is_nested=True,
-            )
+            try:
+                nested_execution = await PipelineExecutor.start(
+                    nested_execution,
+                    execution_folder_path=stage.exec_dir,
+                    is_dry_run=execution.is_dry_run or StringUtils.to_bool(UtilsDictionary.get_by_path(input_calculated, "params.params.IS_DRY_RUN")),
+                    wait_for_finish=True,
+                    is_nested=True,
+                )
+            finally:
+                # also when cancelled or failed - so live nested execution isn't referenced by parent anymore
+                ReportCollector.publish_nested_execution(execution, stage, nested_execution, is_finished=True)
             ContextFilesProcessor.store_stage_results(execution, stage, stage.exec_dir.joinpath(Constants.PIPELINE_OUTPUT_DIR_NAME))
             stage.status = nested_execution.status
         except asyncio.CancelledError:
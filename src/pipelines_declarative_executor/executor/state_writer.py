@@ -0,0 +1,61 @@
+import asyncio, logging, time
+
+from pipelines_declarative_executor.model.pipeline import PipelineExecution
+from pipelines_declarative_executor.utils.env_var_utils import EnvVar
+
+
+class StateWriter:
+    """Background task writing execution state files - coalesces requested writes into at most one per STATE_WRITE_INTERVAL"""
+
+    def __init__(self, execution: PipelineExecution):
+        self.execution = execution
+        self._dirty = asyncio.Event()
+        self._stop = asyncio.Event()
+        self._last_write = 0.0
+        self._task: asyncio.Task = None
+
+    @staticmethod
+    def is_enabled() -> bool:
+        return EnvVar.STATE_WRITE_INTERVAL > 0
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done() and not self._stop.is_set()
+
+    def mark_dirty(self):
+        self._dirty.set()
+
+    async def stop(self):
+        """Waits for write in progress, pending changes are left to be written by caller"""
+        if self._task is None:
+            return
+        self._stop.set()
+        self._dirty.set()
+        try:
+            await asyncio.shield(self._task)
+        except Exception as e:
+            logging.error(f"State writer failed: [{type(e)} - {str(e)}]")
+
+    async def _run(self):
+        while True:
+            await self._dirty.wait()
+            delay = EnvVar.STATE_WRITE_INTERVAL / 1000 - (time.monotonic() - self._last_write)
+            if delay > 0 and not self._stop.is_set():
+                try:
+                    async with asyncio.timeout(delay):
+                        await self._stop.wait()
+                except TimeoutError:
+                    pass
+            if self._stop.is_set():
+                return
+            self._dirty.clear()
+            try:
+                # state is captured on loop (so it's consistent), encoding and writing files is done in separate thread
+                state_files, journal_position = self.execution.capture_state()
+                await asyncio.to_thread(self.execution.write_state_files, state_files)
+                self.execution.journal.clear(journal_position)
+            except Exception as e:
+                logging.error(f"Exception during writing execution state: [{type(e)} - {str(e)}]")
+            self._last_write = time.monotonic()
@@ -8,3 +8,7 @@ class PipelineExecutorException(Exception):
 
 class SopsException(Exception):
     pass
+
+
+class ModuleWorkerException(Exception):
+    pass
@@ -0,0 +1,12 @@
+from enum import StrEnum
+
+
+class ModuleExecutionMode(StrEnum):
+    SUBPROCESS = "SUBPROCESS"
+    WORKER_POOL = "WORKER_POOL"
+    FORK_SERVER = "FORK_SERVER"
+
+
+class StateFileFormat(StrEnum):
+    JSON = "JSON"
+    MSGPACK = "MSGPACK"
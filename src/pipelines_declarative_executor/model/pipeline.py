@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-import asyncio, logging
+import asyncio, copy, logging
 
 from dataclasses import dataclass, field
 from datetime import datetime
@@ -11,15 +11,17 @@ from pipelines_declarative_executor.model.stage import Stage, ExecutionStatus
 from pipelines_declarative_executor.utils.common_utils import CommonUtils
 from pipelines_declarative_executor.utils.constants import Constants
 from pipelines_declarative_executor.utils.env_var_utils import EnvVar
+from pipelines_declarative_executor.utils.state_serializer import StateSerializer
 from pipelines_declarative_executor.utils.string_utils import StringUtils
 
 
-@dataclass
+@dataclass(slots=True)
 class Pipeline:
     id: str = None
     name: str = None
     stages: list[Stage] = field(default_factory=list)
     configuration: dict = field(default_factory=dict)
+    _top_level_stages: dict = field(default_factory=dict, init=False, repr=False)
 
     def logged_name(self) -> str:
         if EnvVar.USE_COMPACT_LOGGED_NAMES:
@@ -28,8 +30,49 @@ class Pipeline:
         else:
             return f'"{self.name}" (id={self.id})'
 
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "stages": [stage.to_dict() for stage in self.stages],
+            "configuration": self.configuration,
+        }
 
-@dataclass
+    @staticmethod
+    def from_dict(pipeline_dict: dict) -> Pipeline:
+        pipeline = Pipeline(**pipeline_dict)
+        pipeline.stages = [Stage.from_dict(stage_dict) for stage_dict in pipeline_dict.get("stages", [])]
+        return pipeline
+
+    def has_stage_dependencies(self) -> bool:
+        return any(stage.needs is not None for stage in self.stages)
+
+    def get_upstream_stages(self, stage: Stage) -> list[Stage]:
+        """Returns top-level stages which given (top-level or nested) stage transitively depends on via 'needs'"""
+        if stage.uuid not in self._top_level_stages:
+            self._index_top_level_stages()
+        if not (top_level_stage := self._top_level_stages.get(stage.uuid)):
+            return self.stages
+        stages_by_uuid = {s.uuid: s for s in self.stages}
+        upstream, pending = {}, list(top_level_stage.needs or [])
+        while pending:
+            uuid = pending.pop()
+            if uuid not in upstream and (needed_stage := stages_by_uuid.get(uuid)):
+                upstream[uuid] = needed_stage
+                pending.extend(needed_stage.needs or [])
+        return list(upstream.values())
+
+    def _index_top_level_stages(self):
+        def _index(top_level_stage: Stage, stage: Stage):
+            self._top_level_stages[stage.uuid] = top_level_stage
+            for nested_stage in stage.nested_parallel_stages or []:
+                _index(top_level_stage, nested_stage)
+        self._top_level_stages.clear()
+        for s in self.stages:
+            _index(s, s)
+
+
+@dataclass(slots=True)
 class PipelineVars:
     vars_pipeline: dict = field(default_factory=dict)
     vars_config: dict = field(default_factory=dict)
@@ -41,9 +84,40 @@ class PipelineVars:
     vars_source: dict = field(default_factory=dict)
     secure_vars: set = field(default_factory=set)
 
-    def __post_init__(self):
-        self._merged_initial_vars = {}
-        self._initial_vars_with_sources = []
+    _merged_initial_vars: dict = field(default_factory=dict, init=False, repr=False)
+    _initial_vars_with_sources: list = field(default_factory=list, init=False, repr=False)
+    _changed_keys: dict[str, set] = field(default_factory=dict, init=False, repr=False)
+
+    VARS_DICT_NAMES = ["vars_pipeline", "vars_config", "vars_override", "vars_retry",
+                       "vars_stage_output", "files_info", "vars_source"]
+
+    def to_dict(self) -> dict:
+        data = {vars_name: dict(getattr(self, vars_name)) for vars_name in PipelineVars.VARS_DICT_NAMES}
+        data["secure_vars"] = list(self.secure_vars)
+        return data
+
+    @staticmethod
+    def from_dict(vars_dict: dict) -> PipelineVars:
+        vars_obj = PipelineVars()
+        for vars_name in PipelineVars.VARS_DICT_NAMES:
+            setattr(vars_obj, vars_name, vars_dict.get(vars_name, {}))
+        vars_obj.secure_vars = set(vars_dict.get("secure_vars", []))
+        return vars_obj
+
+    def mark_changed(self, vars_name: str, key: str):
+        self._changed_keys.setdefault(vars_name, set()).add(key)
+
+    def pop_changes(self) -> dict:
+        """Returns values changed since previous call, grouped by vars dict name (keys only for 'secure_vars')"""
+        changes = {}
+        for vars_name, keys in self._changed_keys.items():
+            values = getattr(self, vars_name)
+            if isinstance(values, set):
+                changes[vars_name] = sorted(key for key in keys if key in values)
+            else:
+                changes[vars_name] = {key: values[key] for key in keys if key in values}
+        self._changed_keys = {}
+        return changes
 
     def all_vars(self) -> dict:
         if not self._merged_initial_vars:
@@ -80,7 +154,7 @@ class PipelineVars:
         return self._initial_vars_with_sources
 
 
-@dataclass
+@dataclass(slots=True)
 class PipelineExecution:
     inputs: dict = None
     pipeline: Pipeline = None
@@ -101,18 +175,67 @@ class PipelineExecution:
     is_retry: bool = False
     previous_executions: list = field(default_factory=list)
     custom_data: dict = field(default_factory=dict)
-
-    def store_state(self):
+    journal: 'ExecutionJournal' = None  # noqa: F821
+    state_writer: 'StateWriter' = None  # noqa: F821
+    state_store: 'ExecutionStore' = None  # noqa: F821
+    report_fragments: 'ReportFragmentCache' = None  # noqa: F821
+    # nested executions run by this process (or their final reports), by uuid of stage which started them
+    nested_reports: dict = field(default_factory=dict)
+
+    def store_state(self, stage: Stage = None, with_nested: bool = False):
+        """Writes whole state, or only journals transition of given stage (with periodic full snapshots) when journal or execution store is enabled.
+        While background state writer is running, full writes are coalesced by it instead"""
         if not self.state_dir:
             self.state_dir = self.exec_dir.joinpath(Constants.PIPELINE_STATE_DIR_NAME)
         if not self.state_dir.exists():
             self.state_dir.mkdir(parents=True, exist_ok=True)
-        CommonUtils.write_json(self._exec_state(), self.state_dir.joinpath(Constants.STATE_EXECUTION_FILE_NAME))
-        CommonUtils.write_json(self.pipeline, self.state_dir.joinpath(Constants.STATE_PIPELINE_FILE_NAME))
-        CommonUtils.write_json(self.vars, self.state_dir.joinpath(Constants.STATE_VARS_FILE_NAME))
 
+        from pipelines_declarative_executor.executor.execution_journal import ExecutionJournal
+        from pipelines_declarative_executor.executor.execution_store import ExecutionStore
         from pipelines_declarative_executor.report.report_collector import ReportCollector
-        CommonUtils.write_json(ReportCollector.prepare_ui_view(self), self.state_dir.joinpath(Constants.PIPELINE_REPORT_FILE_NAME))
+        if stage is not None:
+            ReportCollector.mark_stage_changed(self, stage, with_nested)
+        if self.journal is None:
+            self.journal = ExecutionJournal(self.state_dir)
+        if self.state_store is None and ExecutionStore.is_enabled() and not self.is_nested:
+            self.state_store = ExecutionStore.open(self.exec_dir)  # nested pipelines use store of top-level one
+        if stage is not None and self.state_store is not None:
+            if not self.state_store.write_stage(self.exec_dir, stage, self.vars.pop_changes(), with_nested):
+                return
+        elif stage is not None and ExecutionJournal.is_enabled():
+            if not self.journal.append(stage, self.vars.pop_changes(), with_nested):
+                return
+
+        if self.state_writer is not None and self.state_writer.is_running():
+            self.state_writer.mark_dirty()
+            return
+        state_files, journal_position = self.capture_state()
+        self.write_state_files(state_files)
+        self.journal.clear(journal_position)
+
+    def capture_state(self) -> tuple[dict, int]:
+        """Returns detached content of state files (safe to serialize in another thread), and journal position it corresponds to"""
+        self.vars.pop_changes()  # included in snapshot
+        from pipelines_declarative_executor.report.report_collector import ReportCollector
+        state_files = {
+            Constants.STATE_EXECUTION_FILE_NAME: copy.deepcopy(self._exec_state()),
+            Constants.STATE_PIPELINE_FILE_NAME: self.pipeline.to_dict(),
+            Constants.STATE_VARS_FILE_NAME: self.vars.to_dict(),
+            Constants.PIPELINE_REPORT_FILE_NAME: ReportCollector.prepare_ui_view(self),
+        }
+        return state_files, self.journal.snapshot_position()
+
+    def write_state_files(self, state_files: dict):
+        if self.state_store is not None:
+            self.state_store.write_state(self.exec_dir, state_files[Constants.STATE_EXECUTION_FILE_NAME],
+                                         state_files[Constants.STATE_PIPELINE_FILE_NAME], state_files[Constants.STATE_VARS_FILE_NAME])
+        for file_name, content in state_files.items():
+            if file_name == Constants.PIPELINE_REPORT_FILE_NAME:  # always JSON - it's read by UI
+                CommonUtils.write_json(content, self.state_dir.joinpath(file_name))
+            elif self.state_store is not None:
+                StateSerializer.remove(self.state_dir, file_name)  # so state files from before store was enabled won't be read instead
+            else:
+                StateSerializer.write(content, self.state_dir, file_name)
 
     def _exec_state(self) -> dict:
         return {
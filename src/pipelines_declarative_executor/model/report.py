@@ -13,6 +13,8 @@ class HttpEndpointConfig(RemoteEndpointConfig):
     auth: BasicAuth = None
     headers: dict = None
     use_compression: bool = None
+    use_delta: bool = None
+    blob_endpoint: str = None
 
 
 @dataclass
@@ -28,6 +30,7 @@ class S3EndpointConfig(RemoteEndpointConfig):
 class ReportUploadMode(StrEnum):
     PERIODIC = "PERIODIC"
     ON_COMPLETION = "ON_COMPLETION"
+    ON_CHANGE = "ON_CHANGE"
 
 
 class ReportUploadType(StrEnum):
@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, fields
 from datetime import datetime
 from enum import StrEnum
 from pathlib import Path
@@ -43,7 +43,7 @@ COMPLEX_TYPES = [StageType.PARALLEL_BLOCK, StageType.ATLAS_PIPELINE_TRIGGER]
 VALID_STAGE_TYPES = {st.value for st in StageType}
 
 
-@dataclass
+@dataclass(slots=True)
 class Stage:
     id: str = None
     uuid: str = None
@@ -54,6 +54,13 @@ class Stage:
     input: dict = None
     output: dict = None
     retry: dict = None
+    cache: bool = None
+    needs: list[str] = None
+    resources: dict = None
+    max_parallel: int = None
+    fail_fast: bool = None
+    matrix: dict = None
+    matrix_template: dict = None
     when: When = field(default_factory=lambda: When())
     nested_parallel_stages: list[Stage] = None
 
@@ -62,8 +69,30 @@ class Stage:
     start_time: datetime = None
     finish_time: datetime = None
     exec_dir: Path = None
-    evaluated_params: dict = field(default_factory=dict)
-    custom_data: dict = field(default_factory=dict)
+    # allocated on first access - most stages of huge pipelines are waiting to be started
+    _evaluated_params: dict = field(default=None, init=False, repr=False)
+    _custom_data: dict = field(default=None, init=False, repr=False)
+    retry_nested: bool = field(default=False, init=False, repr=False)  # not persisted
+
+    @property
+    def evaluated_params(self) -> dict:
+        if self._evaluated_params is None:
+            self._evaluated_params = {}
+        return self._evaluated_params
+
+    @evaluated_params.setter
+    def evaluated_params(self, value: dict):
+        self._evaluated_params = value
+
+    @property
+    def custom_data(self) -> dict:
+        if self._custom_data is None:
+            self._custom_data = {}
+        return self._custom_data
+
+    @custom_data.setter
+    def custom_data(self, value: dict):
+        self._custom_data = value
 
     def logged_name(self) -> str:
         if EnvVar.USE_COMPACT_LOGGED_NAMES:
@@ -82,10 +111,57 @@ class Stage:
             return StringUtils.get_duration_str(start_time=self.start_time, finish_time=self.finish_time)
 
     def is_first_run(self) -> bool:
-        return self.custom_data.get("retry_attempt", 0) == 0
+        return not self._custom_data or self._custom_data.get("retry_attempt", 0) == 0
+
+    def to_dict(self, with_nested: bool = True) -> dict:
+        """Unlike 'dataclasses.asdict', doesn't deepcopy values - only containers changed during execution are copied"""
+        data = {name: getattr(self, name) for name in STAGE_FIELD_NAMES}
+        data["when"] = self.when.to_dict() if self.when is not None else None
+        if not with_nested:
+            data.pop("nested_parallel_stages")
+        elif self.nested_parallel_stages is not None:
+            data["nested_parallel_stages"] = [nested_stage.to_dict() for nested_stage in self.nested_parallel_stages]
+        data["evaluated_params"] = dict(self._evaluated_params or {})
+        data["custom_data"] = dict(self._custom_data or {})
+        return data
 
-
-@dataclass
+    @staticmethod
+    def from_dict(stage_dict: dict) -> Stage:
+        stage = Stage(**{key: value for key, value in stage_dict.items() if key not in RUNTIME_DICT_NAMES})
+        stage.evaluated_params = stage_dict.get("evaluated_params") or None
+        stage.custom_data = stage_dict.get("custom_data") or None
+        stage.status = ExecutionStatus(stage.status)  # loaded strings are replaced with shared enum members
+        if stage.type in VALID_STAGE_TYPES:
+            stage.type = StageType(stage.type)
+        if (when_dict := stage_dict.get("when")) is not None:
+            stage.when = When.from_dict(when_dict)
+        if stage.exec_dir:
+            stage.exec_dir = Path(stage.exec_dir)
+        if (nested_stage_dicts := stage_dict.get("nested_parallel_stages")) is not None:
+            stage.nested_parallel_stages = [Stage.from_dict(nested_stage) for nested_stage in nested_stage_dicts]
+        if start_time := stage_dict.get("start_time"):
+            stage.start_time = datetime.fromisoformat(start_time)
+        if finish_time := stage_dict.get("finish_time"):
+            stage.finish_time = datetime.fromisoformat(finish_time)
+        return stage
+
+
+@dataclass(slots=True)
 class When:
     condition: str = None
     statuses: list[ExecutionStatus] = field(default_factory=lambda: [ExecutionStatus.SUCCESS])
+
+    def to_dict(self) -> dict:
+        return {"condition": self.condition, "statuses": list(self.statuses) if self.statuses is not None else None}
+
+    @staticmethod
+    def from_dict(when_dict: dict) -> When:
+        when = When(**when_dict)
+        if when.statuses is not None:
+            when.statuses = [ExecutionStatus(status) for status in when.statuses]
+        return when
+
+
+RUNTIME_DICT_NAMES = ["evaluated_params", "custom_data"]
+# persisted fields - state file format is the same as for non-slotted 'Stage' with plain dict fields
+STAGE_FIELD_NAMES = [stage_field.name for stage_field in fields(Stage) if stage_field.init]
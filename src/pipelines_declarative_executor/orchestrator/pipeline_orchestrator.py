@@ -1,4 +1,4 @@
-import uuid, os, logging
+import re, copy, uuid, os, yaml, logging, itertools
 
 from urllib.parse import urlparse
 from pipelines_declarative_executor.executor.params_processor import ParamsProcessor
@@ -6,6 +6,7 @@ from pipelines_declarative_executor.model.exceptions import SopsException
 from pipelines_declarative_executor.model.orchestrator import AtlasMetaFile, PipelineTemplate
 from pipelines_declarative_executor.model.pipeline import PipelineExecution, PipelineVars, Pipeline, Stage
 from pipelines_declarative_executor.model.stage import ExecutionStatus, StageType, VALID_STAGE_TYPES
+from pipelines_declarative_executor.orchestrator.stage_dependency_graph import StageDependencyGraph
 from pipelines_declarative_executor.utils.common_utils import CommonUtils
 from pipelines_declarative_executor.utils.constants import Constants
 from pipelines_declarative_executor.utils.env_var_utils import EnvVar
@@ -16,8 +17,14 @@ from pipelines_declarative_executor.x_modules_ops.dict_utils import UtilsDiction
 
 
 class PipelineOrchestrator:
+
+    MATRIX_BLOCK_KEYS = ['matrix', 'for_each', 'as', 'max_parallel', 'fail_fast', 'needs', 'job']
+    MATRIX_DEFAULT_ITEM_VAR = "ITEM"
+    MATRIX_NAME_PLACEHOLDER = "*"
+
     @staticmethod
-    def prepare_pipeline_execution(pipeline_data: str, pipeline_vars: str = None, pipeline_vars_secure: str = None) -> PipelineExecution:
+    def prepare_pipeline_execution(pipeline_data: str, pipeline_vars: str = None, pipeline_vars_secure: str = None,
+                                   infer_stage_dependencies: bool = None) -> PipelineExecution:
         pipeline_execution = PipelineExecution(inputs={
             "pipeline_data": pipeline_data,
             "pipeline_vars": pipeline_vars,
@@ -62,7 +69,9 @@ class PipelineOrchestrator:
         if EnvVar.ENCRYPT_OUTPUT_PARAMS:
             SOPS.init()
 
-        pipeline_execution.pipeline = PipelineOrchestrator._create_pipeline_from_dict(last_pipeline.data, vars_obj, merged_template)
+        if infer_stage_dependencies is None:
+            infer_stage_dependencies = EnvVar.INFER_STAGE_DEPENDENCIES
+        pipeline_execution.pipeline = PipelineOrchestrator._create_pipeline_from_dict(last_pipeline.data, vars_obj, merged_template, infer_stage_dependencies)
         pipeline_execution.vars = vars_obj
         return pipeline_execution
 
@@ -109,7 +118,8 @@ class PipelineOrchestrator:
                     logging.warning(f"Error loading Global Config YAML from '{env_key}' env var: {str(e)}")
 
     @staticmethod
-    def _create_pipeline_from_dict(pipeline_dict: dict, vars_obj: PipelineVars, merged_template: PipelineTemplate) -> Pipeline:
+    def _create_pipeline_from_dict(pipeline_dict: dict, vars_obj: PipelineVars, merged_template: PipelineTemplate,
+                                   infer_stage_dependencies: bool = False) -> Pipeline:
         pipeline = Pipeline()
         pipeline_data = pipeline_dict.get('pipeline', {})
         jobs_templates = {**merged_template.job_templates, **pipeline_data.get('jobs', {})}
@@ -123,6 +133,7 @@ class PipelineOrchestrator:
         for stage_index, stage_data in enumerate(flattened_stages):
             stage = PipelineOrchestrator._create_stage(stage_index, stage_data, jobs_templates, vars_obj)
             pipeline.stages.append(stage)
+        PipelineOrchestrator._resolve_stage_needs(pipeline.stages, infer_stage_dependencies, vars_obj.all_vars())
 
         return pipeline
 
@@ -152,7 +163,11 @@ class PipelineOrchestrator:
             job_template = jobs_templates.get(template_name)
             if not job_template:
                 raise Exception(f"Missing job-template requested: {Constants.DEFAULT_MASKED_VALUE if used_secure else template_name}")
-        merged_stage_data = CommonUtils.recursive_merge(job_template, stage_data)
+        # job-template values are shared by all stages using it, not copied - stage definitions are not modified at runtime
+        merged_stage_data = CommonUtils.merge_shared(job_template, stage_data)
+
+        if any(key in merged_stage_data for key in ['matrix', 'for_each']):
+            merged_stage_data = PipelineOrchestrator._split_matrix_stage_data(stage, merged_stage_data)
 
         for field_name in ['name', 'type', 'path']: # evaluated at orchestration time
             if value := merged_stage_data.get(field_name):
@@ -176,18 +191,35 @@ class PipelineOrchestrator:
         stage.id = StringUtils.get_safe_filename(f"{stage_index}_{stage.name.lower()}")
         stage.uuid = str(uuid.uuid4())
 
+        if (needs := merged_stage_data.get('needs')) is not None:
+            stage.needs = [vars_obj.calculate_expression_safe(str(ref)) for ref in (needs if isinstance(needs, list) else [needs])]
+
+        if (cache := merged_stage_data.get('cache')) is not None:
+            stage.cache = StringUtils.to_bool(vars_obj.calculate_expression_safe(cache) if isinstance(cache, str) else cache)
+
+        if (resources := merged_stage_data.get('resources')) is not None:
+            stage.resources = PipelineOrchestrator._calculate_stage_resources(stage, resources, vars_obj)
+
         if (retry := merged_stage_data.get('retry')) is not None:
             stage.retry = retry
             PipelineOrchestrator._validate_stage_retry_config(stage)
 
-        if parallel_block := merged_stage_data.get('parallel', []):
+        if (parallel_block := merged_stage_data.get('parallel', [])) or stage.matrix is not None:
             if isinstance(parallel_block, dict):
                 parallel_block = list(parallel_block.values())
             stage.nested_parallel_stages = []
             stage.type = StageType.PARALLEL_BLOCK
             for nested_stage_index, nested_stage_data in enumerate(parallel_block):
                 nested_stage = PipelineOrchestrator._create_stage(nested_stage_index, nested_stage_data, jobs_templates, vars_obj)
+                if nested_stage.needs is not None:
+                    raise Exception(f"'needs' is only supported for top-level stages (in stage {nested_stage.name} - {nested_stage.id})")
                 stage.nested_parallel_stages.append(nested_stage)
+            if (max_parallel := merged_stage_data.get('max_parallel')) is not None:
+                stage.max_parallel = PipelineOrchestrator._calculate_max_parallel(stage, max_parallel, vars_obj)
+            if (fail_fast := merged_stage_data.get('fail_fast')) is not None:
+                stage.fail_fast = StringUtils.to_bool(vars_obj.calculate_expression_safe(fail_fast) if isinstance(fail_fast, str) else fail_fast)
+        elif any(key in merged_stage_data for key in ['max_parallel', 'fail_fast']):
+            raise Exception(f"'max_parallel' and 'fail_fast' are only supported for parallel blocks (in stage {stage.name} - {stage.id})")
 
         if stage.type == StageType.ATLAS_PIPELINE_TRIGGER:
             PipelineOrchestrator._validate_stage_trigger_config(stage)
@@ -197,6 +229,119 @@ class PipelineOrchestrator:
 
         return stage
 
+    @staticmethod
+    def _resolve_stage_needs(stages: list[Stage], infer_stage_dependencies: bool = False, pipeline_vars: dict = None):
+        # references are resolved to previously declared stages only - so dependency graph can't have cycles
+        if not infer_stage_dependencies and not any(stage.needs is not None for stage in stages):
+            return
+        inferred_needs = StageDependencyGraph.infer_needs(stages, pipeline_vars) if infer_stage_dependencies else {}
+        for stage_index, stage in enumerate(stages):
+            if stage.needs is None:
+                if infer_stage_dependencies:
+                    stage.needs = inferred_needs[stage.uuid]
+                else:
+                    stage.needs = [stages[stage_index - 1].uuid] if stage_index > 0 else []
+                continue
+            resolved_needs = []
+            for reference in stage.needs:
+                candidates = [s for s in stages[:stage_index] if reference in (s.name, s.id)]
+                if not candidates:
+                    raise Exception(f"Stage {stage.name} ({stage.id}) needs unknown stage \"{reference}\" - only previously declared stages can be referenced")
+                if len(candidates) > 1:
+                    raise Exception(f"Stage {stage.name} ({stage.id}) needs ambiguous stage \"{reference}\" - use stage id ({', '.join(s.id for s in candidates)})")
+                resolved_needs.append(candidates[0].uuid)
+            stage.needs = list(dict.fromkeys(resolved_needs))
+
+    @staticmethod
+    def _calculate_stage_resources(stage: Stage, resources: dict, vars_obj: PipelineVars) -> dict:
+        if not isinstance(resources, dict):
+            raise Exception(f"Invalid 'resources' format (in stage {stage.name} - {stage.id}): expected dict with 'cpu' and/or 'memory'")
+        calculated_resources = {}
+        try:
+            if (cpu := resources.get('cpu')) is not None:
+                calculated_resources['cpu'] = StringUtils.cpu_str_to_cores(vars_obj.calculate_expression_safe(cpu) if isinstance(cpu, str) else cpu)
+            if (memory := resources.get('memory')) is not None:
+                calculated_resources['memory'] = StringUtils.memory_str_to_megabytes(vars_obj.calculate_expression_safe(memory) if isinstance(memory, str) else memory)
+        except ValueError as e:
+            raise Exception(f"Invalid 'resources' value (in stage {stage.name} - {stage.id}): {e}")
+        return calculated_resources
+
+    @staticmethod
+    def _split_matrix_stage_data(stage: Stage, stage_data: dict) -> dict:
+        """Stores item stage template and matrix axes in stage, returns data of parallel block which will contain expanded items"""
+        if 'matrix' in stage_data and 'for_each' in stage_data:
+            raise Exception(f"Stage {stage_data.get('name')} can't have both 'matrix' and 'for_each'")
+        if any(key in stage_data for key in ['parallel', 'stages']):
+            raise Exception(f"Stage {stage_data.get('name')} can't have both 'matrix'/'for_each' and 'parallel'/'stages' - use nested pipeline as matrix item instead")
+        if 'for_each' in stage_data:
+            axes = {stage_data.get('as') or PipelineOrchestrator.MATRIX_DEFAULT_ITEM_VAR: stage_data['for_each']}
+        else:
+            axes = stage_data['matrix']
+        if not isinstance(axes, dict) or not axes or not all(isinstance(axis, str) and axis.isidentifier() for axis in axes):
+            raise Exception(f"Invalid 'matrix' format (in stage {stage_data.get('name')}): expected dict of variable names and their values")
+        stage.matrix = axes
+        stage.matrix_template = {key: value for key, value in stage_data.items() if key not in PipelineOrchestrator.MATRIX_BLOCK_KEYS}
+        block_data = {key: value for key, value in stage_data.items() if key in PipelineOrchestrator.MATRIX_BLOCK_KEYS}
+        item_placeholders = {axis: PipelineOrchestrator.MATRIX_NAME_PLACEHOLDER for axis in axes}
+        block_data['name'] = PipelineOrchestrator._substitute_matrix_vars(stage_data.get('name') or "Nameless Stage", item_placeholders)
+        if when_statuses := (stage_data.get('when') or {}).get('statuses'):
+            block_data['when'] = {'statuses': when_statuses}  # condition might use item vars - so it's checked by each item
+        return block_data
+
+    @staticmethod
+    def expand_matrix_stage(stage: Stage, vars_obj: PipelineVars) -> list[Stage]:
+        """Creates item stages of matrix stage, evaluating its axes with current pipeline vars"""
+        axes_values = [PipelineOrchestrator._calculate_matrix_values(stage, axis_value, vars_obj) for axis_value in stage.matrix.values()]
+        template_name = stage.matrix_template.get('name') or "Nameless Stage"
+        names_item = any(axis in {braced or plain for braced, plain in StringUtils.VAR_PATTERN.findall(template_name)} for axis in stage.matrix)
+        item_stages = []
+        for item_index, item_values in enumerate(itertools.product(*axes_values)):
+            item_vars = dict(zip(stage.matrix, item_values))
+            item_data = PipelineOrchestrator._substitute_matrix_vars(copy.deepcopy(stage.matrix_template), item_vars)
+            if not names_item:
+                item_data['name'] = f"{template_name} [{', '.join(item_values)}]"
+            item_stages.append(PipelineOrchestrator._create_stage(item_index, item_data, {}, vars_obj))
+        return item_stages
+
+    @staticmethod
+    def _calculate_matrix_values(stage: Stage, axis_value, vars_obj: PipelineVars) -> list[str]:
+        if isinstance(axis_value, str):
+            if (var_match := StringUtils.VAR_PATTERN.fullmatch(axis_value.strip())) and (var_name := var_match[1] or var_match[2]) in vars_obj.all_vars():
+                axis_value = vars_obj.all_vars()[var_name]  # keep list values of variables as-is, instead of their string representation
+            if isinstance(axis_value, str):
+                calculated_value = vars_obj.calculate_expression_safe(axis_value)
+                try:
+                    axis_value = yaml.safe_load(calculated_value)
+                except yaml.YAMLError:
+                    axis_value = calculated_value
+                if not isinstance(axis_value, list):
+                    axis_value = [item for item in re.split(r'[,\n]', calculated_value) if item.strip()]
+        if not isinstance(axis_value, list):
+            raise Exception(f"Invalid matrix values (in stage {stage.name} - {stage.id}): expected list or comma-separated string, got '{axis_value}'")
+        return [StringUtils.cast_to_string(item).strip() for item in axis_value]
+
+    @staticmethod
+    def _substitute_matrix_vars(value, item_vars: dict):
+        # only item vars are substituted here, the rest of references are evaluated by stage at runtime as usual
+        if isinstance(value, str):
+            return StringUtils.VAR_PATTERN.sub(lambda m: item_vars.get(m[1] or m[2], m[0]), value)
+        if isinstance(value, dict):
+            return {PipelineOrchestrator._substitute_matrix_vars(key, item_vars): PipelineOrchestrator._substitute_matrix_vars(nested_value, item_vars)
+                    for key, nested_value in value.items()}
+        if isinstance(value, list):
+            return [PipelineOrchestrator._substitute_matrix_vars(nested_value, item_vars) for nested_value in value]
+        return value
+
+    @staticmethod
+    def _calculate_max_parallel(stage: Stage, max_parallel, vars_obj: PipelineVars) -> int:
+        try:
+            max_parallel = int(vars_obj.calculate_expression_safe(max_parallel) if isinstance(max_parallel, str) else max_parallel)
+        except (TypeError, ValueError):
+            max_parallel = 0
+        if max_parallel < 1:
+            raise Exception(f"Invalid 'max_parallel' value (in stage {stage.name} - {stage.id}): expected positive integer")
+        return max_parallel
+
     @staticmethod
     def _validate_stage_retry_config(stage: Stage):
         if not isinstance(stage.retry, dict):
@@ -2,13 +2,15 @@ import logging
 from datetime import datetime
 from pathlib import Path
 
+from pipelines_declarative_executor.executor.execution_journal import ExecutionJournal
+from pipelines_declarative_executor.executor.execution_store import ExecutionStore
 from pipelines_declarative_executor.executor.params_processor import ParamsProcessor
 from pipelines_declarative_executor.model.pipeline import PipelineExecution, PipelineVars, Pipeline
-from pipelines_declarative_executor.model.stage import ExecutionStatus, StageType, Stage, When
+from pipelines_declarative_executor.model.stage import ExecutionStatus, StageType, Stage
 from pipelines_declarative_executor.utils.archive_utils import ArchiveUtils
-from pipelines_declarative_executor.utils.common_utils import CommonUtils
 from pipelines_declarative_executor.utils.constants import Constants
 from pipelines_declarative_executor.utils.env_var_utils import EnvVar
+from pipelines_declarative_executor.utils.state_serializer import StateSerializer
 from pipelines_declarative_executor.utils.string_utils import StringUtils
 
 
@@ -26,10 +28,7 @@ class PipelineRetryOrchestrator:
                 raise
 
         try:
-            pipeline_state_dir = Path(pipeline_dir).joinpath(Constants.PIPELINE_STATE_DIR_NAME)
-            old_execution = CommonUtils.load_json_file(pipeline_state_dir.joinpath(Constants.STATE_EXECUTION_FILE_NAME))
-            old_pipeline = CommonUtils.load_json_file(pipeline_state_dir.joinpath(Constants.STATE_PIPELINE_FILE_NAME))
-            old_vars = CommonUtils.load_json_file(pipeline_state_dir.joinpath(Constants.STATE_VARS_FILE_NAME))
+            old_execution, old_pipeline, old_vars = PipelineRetryOrchestrator.load_state_dicts(Path(pipeline_dir), compact=True)
             PipelineRetryOrchestrator._validate_execution(old_execution)
             PipelineRetryOrchestrator._validate_pipeline(old_pipeline)
             PipelineRetryOrchestrator._validate_vars(old_vars)
@@ -38,6 +37,7 @@ class PipelineRetryOrchestrator:
             raise
 
         pipeline_execution = PipelineRetryOrchestrator.create_execution_from_dict(old_execution, pipeline_dir, retry_vars)
+        pipeline_execution.state_store = ExecutionStore.find(pipeline_dir)  # retried execution keeps using store it was written to
 
         pipeline_execution.pipeline = PipelineRetryOrchestrator.load_pipeline_from_dict(old_pipeline)
         found_failed = PipelineRetryOrchestrator._update_pipeline_state(pipeline_execution.pipeline)
@@ -60,6 +60,7 @@ class PipelineRetryOrchestrator:
             existing_execution.status = ExecutionStatus.NOT_STARTED
             existing_execution.code = None
             existing_execution.is_retry = True
+            existing_execution.state_store = pipeline_execution.state_store
             return existing_execution
 
         return pipeline_execution
@@ -94,54 +95,44 @@ class PipelineRetryOrchestrator:
         pipeline_execution.previous_executions.insert(0, old_execution)
         return pipeline_execution
 
+    @staticmethod
+    def load_state_dicts(exec_dir: Path, compact: bool = False) -> tuple[dict, dict, dict]:
+        """Returns (execution, pipeline, vars) state of execution in given directory - from execution store if it's there, otherwise from state files.
+        With 'compact', journaled events are applied to state files first"""
+        if (state_store := ExecutionStore.find(exec_dir)) is not None:
+            return state_store.load_state(exec_dir)
+        state_dir = Path(exec_dir).joinpath(Constants.PIPELINE_STATE_DIR_NAME)
+        if compact:
+            ExecutionJournal.compact(state_dir)
+        return ExecutionJournal.load_state(state_dir)
+
     @staticmethod
     def load_pipeline_state_from_dir(state_dir: Path) -> PipelineExecution:
-        execution_json = CommonUtils.load_json_file(state_dir.joinpath(Constants.STATE_EXECUTION_FILE_NAME))
-        pipeline_json = CommonUtils.load_json_file(state_dir.joinpath(Constants.STATE_PIPELINE_FILE_NAME))
-        vars_json = CommonUtils.load_json_file(state_dir.joinpath(Constants.STATE_VARS_FILE_NAME))
+        # doesn't modify state, so it's safe to use on currently running execution
+        execution_json, pipeline_json, vars_json = PipelineRetryOrchestrator.load_state_dicts(state_dir.parent)
         pipeline_execution = PipelineExecution(**execution_json)
         if pipeline_execution.exec_dir:
             pipeline_execution.exec_dir = Path(pipeline_execution.exec_dir)
+        if pipeline_execution.start_time:
+            pipeline_execution.start_time = datetime.fromisoformat(pipeline_execution.start_time)
+        if pipeline_execution.finish_time:
+            pipeline_execution.finish_time = datetime.fromisoformat(pipeline_execution.finish_time)
         pipeline_execution.pipeline = PipelineRetryOrchestrator.load_pipeline_from_dict(pipeline_json)
         pipeline_execution.vars = PipelineRetryOrchestrator.load_vars_from_dict(vars_json)
         return pipeline_execution
 
     @staticmethod
     def load_pipeline_from_dict(old_pipeline: dict) -> Pipeline:
-        loaded_pipeline = Pipeline(**old_pipeline)
-        loaded_pipeline.stages = []
-        for stage_dict in old_pipeline.get("stages", []):
-            loaded_pipeline.stages.append(PipelineRetryOrchestrator._load_stage_from_dict(stage_dict))
-        return loaded_pipeline
+        return Pipeline.from_dict(old_pipeline)
 
     @staticmethod
     def load_vars_from_dict(old_vars: dict, clear_stage_vars: bool = False) -> PipelineVars:
-        vars_obj = PipelineVars()
-        for vars_name in ["vars_pipeline", "vars_config", "vars_override", "vars_retry",
-                          "vars_stage_output", "files_info", "vars_source"]:
-            setattr(vars_obj, vars_name, old_vars.get(vars_name, {}))
-        vars_obj.secure_vars = set(old_vars.get("secure_vars", []))
+        vars_obj = PipelineVars.from_dict(old_vars)
         if clear_stage_vars:
             vars_obj.vars_stage_output.clear()
             vars_obj.files_info.clear()
         return vars_obj
 
-    @staticmethod
-    def _load_stage_from_dict(stage_dict: dict) -> Stage:
-        stage = Stage(**stage_dict)
-        stage.when = When(**stage_dict.get("when"))
-        if stage.exec_dir:
-            stage.exec_dir = Path(stage.exec_dir)
-        if nested_stage_dicts := stage_dict.get("nested_parallel_stages"):
-            stage.nested_parallel_stages = []
-            for nested_stage in nested_stage_dicts:
-                stage.nested_parallel_stages.append(PipelineRetryOrchestrator._load_stage_from_dict(nested_stage))
-        if start_time := stage_dict.get("start_time"):
-            stage.start_time = datetime.fromisoformat(start_time)
-        if finish_time := stage_dict.get("finish_time"):
-            stage.finish_time = datetime.fromisoformat(finish_time)
-        return stage
-
     @staticmethod
     def _update_pipeline_state(pipeline: Pipeline) -> bool:
         # would be nice to collect debug info about this process, what stages we consider failed and reset
@@ -150,11 +141,23 @@ class PipelineRetryOrchestrator:
 
     @staticmethod
     def _update_sequential_stages(stages: list[Stage]) -> bool:
+        if any(stage.needs is not None for stage in stages):
+            return PipelineRetryOrchestrator._update_stages_graph(stages)
         found_failed = False
         for stage in stages:
             found_failed = PipelineRetryOrchestrator._update_stage(stage, found_failed) or found_failed
         return found_failed
 
+    @staticmethod
+    def _update_stages_graph(stages: list[Stage]) -> bool:
+        # only failed stages and stages depending on them (via 'needs') are reset
+        reset_stages = set()
+        for stage in stages:
+            upstream_failed = any(uuid in reset_stages for uuid in stage.needs or [])
+            if PipelineRetryOrchestrator._update_stage(stage, upstream_failed):
+                reset_stages.add(stage.uuid)
+        return bool(reset_stages)
+
     @staticmethod
     def _update_stage(stage: Stage, found_failed: bool) -> bool:
         if stage.type == StageType.PARALLEL_BLOCK:
@@ -182,11 +185,19 @@ class PipelineRetryOrchestrator:
         else:
             found_failed_at_this_block = stage.status in PipelineRetryOrchestrator.FAILED_STATUSES
             if stage.exec_dir and found_failed_at_this_block: # we don't want to go inside if we see SUCCESS/SKIPPED, and this does it
-                nested_pipeline_json_path = stage.exec_dir.joinpath(Constants.PIPELINE_STATE_DIR_NAME).joinpath(Constants.STATE_PIPELINE_FILE_NAME)
-                if nested_pipeline_json_path.exists():
-                    nested_pipeline = PipelineRetryOrchestrator.load_pipeline_from_dict(CommonUtils.load_json_file(nested_pipeline_json_path))
+                nested_state_dir = stage.exec_dir.joinpath(Constants.PIPELINE_STATE_DIR_NAME)
+                if (state_store := ExecutionStore.find(stage.exec_dir)) is not None:
+                    nested_pipeline_dict = state_store.load_pipeline(stage.exec_dir)
+                else:
+                    ExecutionJournal.compact(nested_state_dir)
+                    nested_pipeline_dict = StateSerializer.load(nested_state_dir, Constants.STATE_PIPELINE_FILE_NAME)
+                if nested_pipeline_dict is not None:
+                    nested_pipeline = PipelineRetryOrchestrator.load_pipeline_from_dict(nested_pipeline_dict)
                     found_failed_at_this_block = PipelineRetryOrchestrator._update_pipeline_state(nested_pipeline) or found_failed_at_this_block
-                    CommonUtils.write_json(nested_pipeline, nested_pipeline_json_path)
+                    if state_store is not None:
+                        state_store.write_pipeline(stage.exec_dir, nested_pipeline.to_dict())
+                    else:
+                        StateSerializer.write(nested_pipeline, nested_state_dir, Constants.STATE_PIPELINE_FILE_NAME)
                     # PipelineRetryOrchestrator._update_nested_stage_report(stage) # FOR DEBUGGING ONLY
             if found_failed_at_this_block:
                 PipelineRetryOrchestrator._reset_stage(stage, reset_nested=False)
@@ -223,8 +234,10 @@ class PipelineRetryOrchestrator:
         stage.status = ExecutionStatus.NOT_STARTED
         stage.start_time = None
         stage.finish_time = None
-        stage.evaluated_params = {}
-        stage.custom_data = {}
-        if reset_nested and stage.nested_parallel_stages:
+        stage.evaluated_params = None
+        stage.custom_data = None
+        if reset_nested and stage.matrix is not None:
+            stage.nested_parallel_stages = []  # will be expanded again, with current values of matrix vars
+        elif reset_nested and stage.nested_parallel_stages:
             for nested in stage.nested_parallel_stages:
                 PipelineRetryOrchestrator._reset_stage(nested, reset_nested=True)
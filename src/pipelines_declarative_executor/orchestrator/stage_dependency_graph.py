@@ -0,0 +1,158 @@
+import ast, re
+
+from pipelines_declarative_executor.model.pipeline import Pipeline
+from pipelines_declarative_executor.model.stage import Stage, StageType, ExecutionStatus, When
+from pipelines_declarative_executor.utils.string_utils import StringUtils
+
+
+class StageDependencyGraph:
+    """Infers 'needs' of top-level stages from variables and files they reference and produce, and describes resulting graph"""
+
+    WILDCARD = "*"
+    FILES_PREFIX = "files:"
+    IDENTIFIER_PATTERN = re.compile(r'[a-zA-Z_]\w*')
+
+    @staticmethod
+    def infer_needs(stages: list[Stage], pipeline_vars: dict = None) -> dict[str, list[str]]:
+        """Returns uuids of previously declared stages which each top-level stage depends on.
+        Reads include vars referenced by values of read pipeline vars, as they are substituted at runtime"""
+        accesses = []
+        for stage in stages:
+            reads = StageDependencyGraph._expand_reads(StageDependencyGraph._collect_reads([stage]), pipeline_vars or {})
+            accesses.append((reads or set(), *StageDependencyGraph._collect_writes([stage]), reads is None))
+        inferred_needs = {}
+        for stage_index, stage in enumerate(stages):
+            if StageDependencyGraph._is_barrier(stage):
+                inferred_needs[stage.uuid] = [s.uuid for s in stages[:stage_index]]
+                continue
+            reads, writes, writes_wildcard, reads_unresolved = accesses[stage_index]
+            needs = []
+            for previous_index, previous_stage in enumerate(stages[:stage_index]):
+                previous_reads, previous_writes, previous_writes_wildcard, _ = accesses[previous_index]
+                if (reads_unresolved and (previous_writes or previous_writes_wildcard)
+                        or previous_writes_wildcard and reads
+                        or writes_wildcard and (previous_reads or previous_writes)
+                        or reads & previous_writes         # read after write
+                        or writes & previous_writes        # write after write
+                        or writes & previous_reads):       # write after read
+                    needs.append(previous_stage.uuid)
+            inferred_needs[stage.uuid] = needs
+        return inferred_needs
+
+    @staticmethod
+    def calculate_levels(stages: list[Stage]) -> dict[str, int]:
+        """Returns depth of each top-level stage in dependency graph (stages without 'needs' depend on previous stage)"""
+        levels = {}
+        for stage_index, stage in enumerate(stages):
+            needs = StageDependencyGraph._effective_needs(stages, stage_index)
+            levels[stage.uuid] = 1 + max((levels[uuid] for uuid in needs if uuid in levels), default=0)
+        return levels
+
+    @staticmethod
+    def describe(pipeline: Pipeline) -> str:
+        import tabulate
+        stages_by_uuid = {s.uuid: s for s in pipeline.stages}
+        levels = StageDependencyGraph.calculate_levels(pipeline.stages)
+        table_data = []
+        for stage_index, stage in enumerate(pipeline.stages):
+            needs = StageDependencyGraph._effective_needs(pipeline.stages, stage_index)
+            table_data.append([stage.id, stage.name, levels[stage.uuid], ", ".join(stages_by_uuid[uuid].id for uuid in needs)])
+        critical_path = max(levels.values(), default=0)
+        speed_up = len(pipeline.stages) / critical_path if critical_path else 1.0
+        lines = [
+            tabulate.tabulate(table_data, ["Stage ID", "Stage Name", "Level", "Needs"], tablefmt="github"),
+            f"Stages: {len(pipeline.stages)}",
+            f"Critical path: {critical_path} stages",
+            f"Theoretical speed-up (equal stage durations, unlimited concurrency): {speed_up:.2f}x",
+        ]
+        return "\n".join(lines)
+
+    @staticmethod
+    def _effective_needs(stages: list[Stage], stage_index: int) -> list[str]:
+        if (needs := stages[stage_index].needs) is not None:
+            return needs
+        return [stages[stage_index - 1].uuid] if stage_index > 0 else []
+
+    @staticmethod
+    def _is_barrier(stage: Stage) -> bool:
+        # stages reacting to failures or reporting on whole pipeline have to wait for everything declared before them
+        for s in StageDependencyGraph._walk([stage]):
+            if s.type == StageType.REPORT or ExecutionStatus.FAILED in s.when.statuses or ExecutionStatus.ANY in s.when.statuses:
+                return True
+        return False
+
+    @staticmethod
+    def _walk(stages: list[Stage]):
+        for stage in stages:
+            yield stage
+            if (template := stage.matrix_template) is not None:
+                # matrix items are expanded only at runtime - their template references the same vars
+                yield Stage(type=template.get('type'), command=template.get('command'), input=template.get('input'), output=template.get('output'),
+                            when=When(condition=(template.get('when') or {}).get('condition'), statuses=stage.when.statuses))
+            yield from StageDependencyGraph._walk(stage.nested_parallel_stages or [])
+
+    @staticmethod
+    def _collect_reads(stages: list[Stage]) -> set[str]:
+        reads = set()
+        for stage in StageDependencyGraph._walk(stages):
+            StageDependencyGraph._collect_var_refs(stage.command, reads)
+            StageDependencyGraph._collect_var_refs(stage.input, reads)
+            StageDependencyGraph._collect_var_refs(stage.output, reads)
+            reads.update(f"{StageDependencyGraph.FILES_PREFIX}{key}" for key in ((stage.input or {}).get('files') or {}))
+            StageDependencyGraph._collect_var_refs(stage.matrix, reads)
+            if condition := stage.when.condition:
+                StageDependencyGraph._collect_var_refs(condition, reads)
+                reads.update(StageDependencyGraph._condition_identifiers(condition))
+        return reads
+
+    @staticmethod
+    def _expand_reads(reads: set[str], pipeline_vars: dict) -> set[str] | None:
+        """Adds vars referenced by values of read pipeline vars (transitively) - returns None when they can't be resolved statically
+        (references are nested deeper than substitution would follow)"""
+        expanded, pending = set(reads), set(reads)
+        for _ in range(StringUtils.VAR_MAX_NESTING_LEVEL):
+            referenced = set()
+            for var_name in pending:
+                if var_name in pipeline_vars:
+                    StageDependencyGraph._collect_var_refs(pipeline_vars[var_name], referenced)
+            if not (pending := referenced - expanded):
+                return expanded
+            expanded |= pending
+        return None
+
+    @staticmethod
+    def _collect_writes(stages: list[Stage]) -> tuple[set[str], bool]:
+        writes, is_wildcard = set(), False
+        for stage in StageDependencyGraph._walk(stages):
+            output = stage.output or {}
+            for var_name, var_path in (output.get('params') or {}).items():
+                if var_path == StageDependencyGraph.WILDCARD or StringUtils.VAR_PATTERN.search(var_name):
+                    is_wildcard = True
+                else:
+                    writes.add(var_name)
+            for file_key in output.get('files') or {}:
+                if StringUtils.VAR_PATTERN.search(file_key):
+                    is_wildcard = True
+                writes.add(f"{StageDependencyGraph.FILES_PREFIX}{file_key}")
+        return writes, is_wildcard
+
+    @staticmethod
+    def _collect_var_refs(value, refs: set[str]):
+        if isinstance(value, str):
+            refs.update(braced or plain for braced, plain in StringUtils.VAR_PATTERN.findall(value))
+        elif isinstance(value, dict):
+            for key, nested_value in value.items():
+                StageDependencyGraph._collect_var_refs(key, refs)
+                StageDependencyGraph._collect_var_refs(nested_value, refs)
+        elif isinstance(value, list):
+            for nested_value in value:
+                StageDependencyGraph._collect_var_refs(nested_value, refs)
+
+    @staticmethod
+    def _condition_identifiers(condition: str) -> set[str]:
+        # conditions are evaluated with pipeline vars as globals - so any name in them might be a variable
+        try:
+            tree = ast.parse(StringUtils.VAR_PATTERN.sub("None", condition), mode="eval")
+            return {node.id for node in ast.walk(tree) if isinstance(node, ast.Name)}
+        except SyntaxError:
+            return set(StageDependencyGraph.IDENTIFIER_PATTERN.findall(condition))
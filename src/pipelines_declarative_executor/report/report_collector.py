@@ -1,10 +1,12 @@
-import copy
+import copy, hashlib, logging
 
 from typing import Any
+from pipelines_declarative_executor.executor.execution_store import ExecutionStore
 from pipelines_declarative_executor.executor.params_processor import ParamsProcessor
 from pipelines_declarative_executor.executor.resource_manager import ResourceManager
 from pipelines_declarative_executor.model.pipeline import PipelineExecution
 from pipelines_declarative_executor.model.stage import Stage, StageType, ExecutionStatus
+from pipelines_declarative_executor.report.report_fragment_cache import ReportFragmentCache
 from pipelines_declarative_executor.utils.common_utils import CommonUtils
 from pipelines_declarative_executor.utils.constants import Constants
 from pipelines_declarative_executor.utils.env_var_utils import EnvVar
@@ -15,9 +17,12 @@ class ReportCollector:
 
     NESTED_PIPELINE = "nestedPipeline"
     PARALLEL_STAGES = "parallelStages"
-    __FINISHED_STAGES: dict[str, dict] = {}
-    __FINAL_STATUSES = [ExecutionStatus.SKIPPED, ExecutionStatus.SUCCESS,
-                        ExecutionStatus.FAILED, ExecutionStatus.CANCELLED]
+    MODULE_REPORT = "moduleReport"
+    MODULE_REPORT_REF = "moduleReportRef"
+    # callbacks notified about stage transitions (e.g. ReportUploader in ON_CHANGE mode)
+    __CHANGE_LISTENERS: list = []
+    # hashes of externalized module reports, by (path, size, mtime) - so unchanged files aren't re-read with every report
+    __MODULE_REPORT_HASHES: dict[tuple, str] = {}
 
     @staticmethod
     def prepare_ui_view(execution: PipelineExecution) -> dict:
@@ -29,13 +34,65 @@ class ReportCollector:
             "config": ReportCollector._prepare_config(execution),
             "stages": [],
         }
+        # report fragments of stages, reused until stage is marked as changed (running stages are always rebuilt)
+        if execution.report_fragments is None:
+            execution.report_fragments = ReportFragmentCache()
         for stage in execution.pipeline.stages:
-            ui_view["stages"].append(ReportCollector._prepare_stage_data(stage))
+            ui_view["stages"].append(ReportCollector._prepare_stage_data(execution, stage))
         return ui_view
 
     @staticmethod
     def reset_stages_cache(execution: PipelineExecution):
-        ReportCollector.__FINISHED_STAGES.clear()
+        if execution.report_fragments is not None:
+            execution.report_fragments.clear()
+
+    @staticmethod
+    def mark_stage_changed(execution: PipelineExecution, stage: Stage, with_nested: bool = False):
+        """Called on every stage transition. Parallel blocks don't need to be marked when their stages change -
+        they are in progress while that happens, so they are rebuilt anyway (reusing fragments of unchanged stages)"""
+        if execution.report_fragments is not None:
+            ReportCollector._forget_stage_fragment(execution.report_fragments, stage, with_nested)
+        for listener in ReportCollector.__CHANGE_LISTENERS:
+            listener()
+
+    @staticmethod
+    def add_change_listener(listener):
+        ReportCollector.__CHANGE_LISTENERS.append(listener)
+
+    @staticmethod
+    def remove_change_listener(listener):
+        if listener in ReportCollector.__CHANGE_LISTENERS:
+            ReportCollector.__CHANGE_LISTENERS.remove(listener)
+
+    @staticmethod
+    def _forget_stage_fragment(fragments: ReportFragmentCache, stage: Stage, with_nested: bool = False):
+        fragments.remove(stage.uuid)
+        if with_nested:
+            for nested_stage in stage.nested_parallel_stages or []:
+                ReportCollector._forget_stage_fragment(fragments, nested_stage, with_nested=True)
+
+    @staticmethod
+    def forget_module_report_refs(execution: PipelineExecution, blob_hashes: set[str]):
+        """Called when externalized module report changed or disappeared since it was referenced -
+        fragments referencing it are rebuilt (with fresh reference) in next report"""
+        for key, report_hash in list(ReportCollector.__MODULE_REPORT_HASHES.items()):
+            if report_hash in blob_hashes:
+                del ReportCollector.__MODULE_REPORT_HASHES[key]
+        if execution.report_fragments is None:
+            return
+        stages = list(execution.pipeline.stages)
+        while stages:
+            stage = stages.pop()
+            stages.extend(stage.nested_parallel_stages or [])
+            if (stage_data := execution.report_fragments.get(stage.uuid)) and ReportCollector._references_module_reports(stage_data, blob_hashes):
+                execution.report_fragments.remove(stage.uuid)
+
+    @staticmethod
+    def _references_module_reports(stage_data: dict, blob_hashes: set[str]) -> bool:
+        if (stage_data.get(ReportCollector.MODULE_REPORT_REF) or {}).get("sha256") in blob_hashes:
+            return True
+        nested_stages = (stage_data.get(ReportCollector.PARALLEL_STAGES) or []) + ((stage_data.get(ReportCollector.NESTED_PIPELINE) or {}).get("stages") or [])
+        return any(ReportCollector._references_module_reports(nested_stage_data, blob_hashes) for nested_stage_data in nested_stages)
 
     @staticmethod
     def _prepare_execution(execution: PipelineExecution) -> dict:
@@ -50,7 +107,7 @@ class ReportCollector:
             "url": EnvVar.EXECUTION_URL,
             "user": EnvVar.EXECUTION_USER,
             "email": EnvVar.EXECUTION_EMAIL,
-            "customData": execution.custom_data,
+            "customData": dict(execution.custom_data),  # report might be serialized in another thread
         }
         return data
 
@@ -74,8 +131,9 @@ class ReportCollector:
         ]
 
     @staticmethod
-    def _prepare_stage_data(stage: Stage) -> dict:
-        if stage_data := ReportCollector.__FINISHED_STAGES.get(stage.uuid):
+    def _prepare_stage_data(execution: PipelineExecution, stage: Stage) -> dict:
+        fragments = execution.report_fragments
+        if stage_data := fragments.get(stage.uuid):
             return stage_data
 
         stage_data: dict[str, Any] = {"id": stage.uuid}
@@ -85,7 +143,8 @@ class ReportCollector:
             stage_data[report_field] = getattr(stage, model_field, None)
         stage_data["time"] = StringUtils.get_duration_str(stage.start_time, stage.finish_time)
 
-        if stage.evaluated_params:
+        is_started = stage.status != ExecutionStatus.NOT_STARTED  # not started stages have no runtime data yet
+        if is_started and stage.evaluated_params:
             stage_data.update(copy.deepcopy(stage.evaluated_params))
             for params_type in ["input", "output"]:
                 if params_secure := stage_data.get(params_type, {}).get("params_secure", {}):
@@ -93,29 +152,56 @@ class ReportCollector:
             stage_data.pop("retry", None)
 
         stage_data["command"] = StringUtils.shorten_command(stage.command) # show non-evaluated value
+        if stage.needs is not None:
+            stage_data["needs"] = stage.needs
+        if stage.matrix is not None:
+            stage_data["matrix"] = list(stage.matrix)
 
         if stage.type == StageType.PARALLEL_BLOCK:
             stage_data[ReportCollector.PARALLEL_STAGES] = []
             for nested_stage in stage.nested_parallel_stages:
-                stage_data[ReportCollector.PARALLEL_STAGES].append(ReportCollector._prepare_stage_data(nested_stage))
+                stage_data[ReportCollector.PARALLEL_STAGES].append(ReportCollector._prepare_stage_data(execution, nested_stage))
         elif stage.type == StageType.ATLAS_PIPELINE_TRIGGER:
-            stage_data[ReportCollector.NESTED_PIPELINE] = ReportCollector._extract_ui_view(stage)
+            stage_data[ReportCollector.NESTED_PIPELINE] = ReportCollector._extract_ui_view(execution, stage)
 
-        if moduleReport := ReportCollector._extract_module_report(stage):
-            stage_data["moduleReport"] = moduleReport
+        if module_report := ReportCollector._extract_module_report(stage):
+            stage_data[module_report[0]] = module_report[1]
 
-        if stage.custom_data:
+        if is_started and stage.custom_data:
             # stage_data["customData"] = copy.deepcopy(stage.custom_data)
             if stage.custom_data.get("peak_memory_mb"):
                 stage_data["performance"] = {
                     "peakMemory": stage.custom_data.get("peak_memory_mb"),
                     "avgCpu": stage.custom_data.get("avg_cpu"),
                 }
+            if stage.custom_data.get("reserved_memory_mb") is not None:
+                stage_data["reservedMemory"] = f"{stage.custom_data.get('reserved_memory_mb'):.1f} MB"
+            if stage.custom_data.get("queue_wait") is not None:
+                stage_data["queueWait"] = stage.custom_data.get("queue_wait")
+            if stage.custom_data.get("cache"):
+                stage_data["cache"] = stage.custom_data.get("cache")
 
-        if stage.status in ReportCollector.__FINAL_STATUSES:
-            ReportCollector.__FINISHED_STAGES[stage.uuid] = stage_data
+        if stage.status != ExecutionStatus.IN_PROGRESS:  # params, custom data and module report of running stage change without transitions
+            fragments.put(stage.uuid, stage_data)
+            if fragments.get(stage.uuid) is not None and isinstance(execution.nested_reports.get(stage.uuid), dict):
+                del execution.nested_reports[stage.uuid]  # final report of nested pipeline is kept in fragment now
         return stage_data
 
+    @staticmethod
+    def publish_nested_execution(execution: PipelineExecution, stage: Stage, nested_execution: PipelineExecution, is_finished: bool = False):
+        """Reports of nested executions run by this process are built in memory instead of being re-read from disk.
+        Once nested execution finishes, only its final report is kept - until fragment of stage which started it is cached, or parent execution finishes"""
+        if is_finished:
+            execution.nested_reports[stage.uuid] = ReportCollector.prepare_ui_view(nested_execution)
+            nested_execution.report_fragments = None  # its final report is kept instead
+            ReportCollector.release_nested_reports(nested_execution)
+        else:
+            execution.nested_reports[stage.uuid] = nested_execution
+
+    @staticmethod
+    def release_nested_reports(execution: PipelineExecution):
+        execution.nested_reports.clear()
+
     @staticmethod
     def _mask_secure_params(key = None, data = None):
         if isinstance(data, dict):
@@ -123,24 +209,55 @@ class ReportCollector:
         return StringUtils.mask_value(key=key, value=data)
 
     @staticmethod
-    def _extract_ui_view(stage: Stage):
-        if stage.exec_dir:
-            nested_ui_view_path = stage.exec_dir.joinpath(Constants.PIPELINE_STATE_DIR_NAME).joinpath(Constants.PIPELINE_REPORT_FILE_NAME)
+    def _extract_ui_view(execution: PipelineExecution, stage: Stage):
+        if (nested_report := execution.nested_reports.get(stage.uuid)) is not None:
+            return nested_report if isinstance(nested_report, dict) else ReportCollector.prepare_ui_view(nested_report)
+        if stage.exec_dir:  # nested pipeline wasn't run by this process (e.g. it's skipped during retry)
+            nested_state_dir = stage.exec_dir.joinpath(Constants.PIPELINE_STATE_DIR_NAME)
+            if ExecutionStore.find(stage.exec_dir) is not None or nested_state_dir.joinpath(Constants.STATE_JOURNAL_FILE_NAME).exists():
+                # only rows of nested pipeline are read from execution store,
+                # and when nested pipeline is still running - its report file might be behind journaled transitions
+                from pipelines_declarative_executor.orchestrator.retry_orchestrator import PipelineRetryOrchestrator
+                return ReportCollector.prepare_ui_view(PipelineRetryOrchestrator.load_pipeline_state_from_dir(nested_state_dir))
+            nested_ui_view_path = nested_state_dir.joinpath(Constants.PIPELINE_REPORT_FILE_NAME)
             if nested_ui_view_path.exists():
                 return CommonUtils.load_json_file(nested_ui_view_path)
         return {}
 
     @staticmethod
-    def _extract_module_report(stage: Stage):
+    def _extract_module_report(stage: Stage) -> tuple[str, Any] | None:
+        """Returns report field and its value - module reports bigger than REPORT_MODULE_REPORT_INLINE_MAX_SIZE_KB are not parsed,
+        and are replaced by reference to their file (uploaded separately by ReportUploader)"""
         if stage.exec_dir:
             try:
-                report_path = stage.exec_dir.joinpath(Constants.STAGE_LOGS_DIR_NAME).joinpath(Constants.STAGE_REPORT_JSON_FILE_NAME)
-                if report_path.exists():
-                    return CommonUtils.load_json_file(report_path)
-                report_path = stage.exec_dir.joinpath(Constants.STAGE_LOGS_DIR_NAME).joinpath(Constants.STAGE_REPORT_YAML_FILE_NAME)
-                if report_path.exists():
-                    return CommonUtils.load_yaml_file(report_path)
+                logs_dir = stage.exec_dir.joinpath(Constants.STAGE_LOGS_DIR_NAME)
+                for file_name, content_type, load_file in [
+                    (Constants.STAGE_REPORT_JSON_FILE_NAME, "application/json", CommonUtils.load_json_file),
+                    (Constants.STAGE_REPORT_YAML_FILE_NAME, "application/yaml", CommonUtils.load_yaml_file),
+                ]:
+                    report_path = logs_dir.joinpath(file_name)
+                    if not report_path.exists():
+                        continue
+                    file_stat = report_path.stat()
+                    if file_stat.st_size > EnvVar.REPORT_MODULE_REPORT_INLINE_MAX_SIZE_KB * 1024:
+                        return ReportCollector.MODULE_REPORT_REF, {
+                            "path": report_path.as_posix(),
+                            "size": file_stat.st_size,
+                            "sha256": ReportCollector._module_report_hash(report_path, file_stat),
+                            "contentType": content_type,
+                        }
+                    if module_report := load_file(report_path):
+                        return ReportCollector.MODULE_REPORT, module_report
+                    return None
             except Exception as e:
-                import logging
                 logging.warning(f"Exception when collecting moduleReport from \"{stage.id}\" - [{type(e)} - {str(e)}]")
         return None
+
+    @staticmethod
+    def _module_report_hash(report_path, file_stat) -> str:
+        key = (str(report_path), file_stat.st_size, file_stat.st_mtime_ns)
+        if (report_hash := ReportCollector.__MODULE_REPORT_HASHES.get(key)) is None:
+            with open(report_path, "rb") as f:
+                report_hash = hashlib.file_digest(f, "sha256").hexdigest()
+            ReportCollector.__MODULE_REPORT_HASHES[key] = report_hash
+        return report_hash
@@ -0,0 +1,106 @@
+import hashlib, json
+
+from pipelines_declarative_executor.utils.string_utils import StringUtils
+
+
+class ReportDelta:
+    """JSON-Patch (RFC 6902) style diffs between consecutive uploaded reports (only 'add', 'remove' and 'replace' operations are produced).
+    Content hash is calculated over canonical report JSON (sorted keys, compact separators), so receiver can verify patched report"""
+
+    PATCH_CONTENT_TYPE = "application/json-patch+json"
+    SEQ_HEADER = "X-Report-Seq"
+    BASE_SEQ_HEADER = "X-Report-Base-Seq"
+    HASH_HEADER = "X-Report-Hash"
+    # status receiver responds with when it can't apply patch (e.g. it was restarted) and needs full snapshot instead
+    RESYNC_STATUS = 409
+
+    @staticmethod
+    def to_canonical_json(report) -> str:
+        return ReportDelta.encode(report)[0]
+
+    @staticmethod
+    def encode(report, with_plain: bool = False) -> tuple[str, dict | None]:
+        """Returns canonical JSON of report, and (if requested) report as plain JSON values, as receiver would load it.
+        Stages are encoded one by one - so thread encoding big report regularly lets other threads (e.g. event loop) run"""
+        if not isinstance(report, dict) or not isinstance(report.get("stages"), list):
+            report_json = ReportDelta._dumps(report)
+            return report_json, json.loads(report_json) if with_plain else None
+        stage_jsons = [ReportDelta._dumps(stage) for stage in report["stages"]]
+        # only scalar fields are sorted after "stages", so its last occurrence belongs to report itself
+        head, _, tail = ReportDelta._dumps({**report, "stages": []}).rpartition('"stages":[]')
+        report_json = f'{head}"stages":[{",".join(stage_jsons)}]{tail}'
+        plain_report = None
+        if with_plain:
+            plain_report = json.loads(head + '"stages":[]' + tail)
+            plain_report["stages"] = [json.loads(stage_json) for stage_json in stage_jsons]
+        return report_json, plain_report
+
+    @staticmethod
+    def _dumps(value) -> str:
+        return json.dumps(value, default=StringUtils.json_encode, sort_keys=True, separators=(",", ":"))
+
+    @staticmethod
+    def content_hash(canonical_json: str) -> str:
+        return hashlib.sha256(canonical_json.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def diff(old, new) -> list[dict]:
+        """Expects plain JSON values (dicts, lists, scalars) - e.g. reports loaded back from their JSON"""
+        operations = []
+        ReportDelta._diff(old, new, "", operations)
+        return operations
+
+    @staticmethod
+    def _diff(old, new, path: str, operations: list):
+        if isinstance(old, dict) and isinstance(new, dict):
+            for key in old:
+                if key not in new:
+                    operations.append({"op": "remove", "path": f"{path}/{ReportDelta._escape(key)}"})
+            for key, value in new.items():
+                if key not in old:
+                    operations.append({"op": "add", "path": f"{path}/{ReportDelta._escape(key)}", "value": value})
+                else:
+                    ReportDelta._diff(old[key], value, f"{path}/{ReportDelta._escape(key)}", operations)
+        elif isinstance(old, list) and isinstance(new, list):
+            common_length = min(len(old), len(new))
+            for index in range(common_length):
+                ReportDelta._diff(old[index], new[index], f"{path}/{index}", operations)
+            for index in range(common_length, len(new)):
+                operations.append({"op": "add", "path": f"{path}/{index}", "value": new[index]})
+            for index in reversed(range(common_length, len(old))):
+                operations.append({"op": "remove", "path": f"{path}/{index}"})
+        elif type(old) is not type(new) or old != new:
+            operations.append({"op": "replace", "path": path, "value": new})
+
+    @staticmethod
+    def apply(document, operations: list[dict]):
+        """Applies patch in place (except for operations on whole document) and returns resulting document"""
+        for operation in operations:
+            if not operation["path"]:
+                document = operation.get("value")
+                continue
+            *parent_tokens, last_token = [ReportDelta._unescape(token) for token in operation["path"].split("/")[1:]]
+            parent = document
+            for token in parent_tokens:
+                parent = parent[int(token)] if isinstance(parent, list) else parent[token]
+            if isinstance(parent, list):
+                index = len(parent) if last_token == "-" else int(last_token)
+                if operation["op"] == "add":
+                    parent.insert(index, operation["value"])
+                elif operation["op"] == "remove":
+                    del parent[index]
+                else:
+                    parent[index] = operation["value"]
+            elif operation["op"] == "remove":
+                del parent[last_token]
+            else:
+                parent[last_token] = operation["value"]
+        return document
+
+    @staticmethod
+    def _escape(key) -> str:
+        return str(key).replace("~", "~0").replace("/", "~1")
+
+    @staticmethod
+    def _unescape(token: str) -> str:
+        return token.replace("~1", "/").replace("~0", "~")
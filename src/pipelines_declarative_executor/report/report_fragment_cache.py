@@ -0,0 +1,39 @@
+import json
+
+from pipelines_declarative_executor.utils.env_var_utils import EnvVar
+from pipelines_declarative_executor.utils.string_utils import StringUtils
+
+
+class ReportFragmentCache:
+    """Report fragments of one execution's stages, by stage uuid. Least recently used fragments are evicted
+    once their total (approximate, as JSON) size exceeds REPORT_FRAGMENT_CACHE_MAX_SIZE_MB.
+    Every report reads all cached fragments, so reads don't say anything about recency - it's tracked by (re)builds of fragments"""
+
+    def __init__(self, max_bytes: int = None):
+        self.max_bytes = EnvVar.REPORT_FRAGMENT_CACHE_MAX_SIZE_MB * 1024 * 1024 if max_bytes is None else max_bytes
+        self.total_bytes = 0
+        self._fragments: dict[str, tuple[dict, int]] = {}  # in order of last build
+
+    def __len__(self):
+        return len(self._fragments)
+
+    def get(self, uuid: str) -> dict | None:
+        return entry[0] if (entry := self._fragments.get(uuid)) is not None else None
+
+    def put(self, uuid: str, fragment: dict):
+        self.remove(uuid)
+        size = len(json.dumps(fragment, default=StringUtils.json_encode))
+        if size > self.max_bytes:  # would evict everything else, and then itself
+            return
+        self._fragments[uuid] = (fragment, size)
+        self.total_bytes += size
+        while self.total_bytes > self.max_bytes:
+            self.remove(next(iter(self._fragments)))
+
+    def remove(self, uuid: str):
+        if (entry := self._fragments.pop(uuid, None)) is not None:
+            self.total_bytes -= entry[1]
+
+    def clear(self):
+        self._fragments.clear()
+        self.total_bytes = 0
@@ -0,0 +1,115 @@
+import asyncio, gzip, hashlib, logging, random, time
+
+from pathlib import Path
+
+from pipelines_declarative_executor.report.report_delta import ReportDelta
+from pipelines_declarative_executor.utils.common_utils import CommonUtils
+from pipelines_declarative_executor.utils.constants import Constants
+from pipelines_declarative_executor.utils.env_var_utils import EnvVar
+
+
+class ReportSpool:
+    """Latest report that wasn't delivered to one endpoint yet - it's kept on disk (so it outlives process), and retried with exponential backoff.
+    Newer report supersedes pending one, so spool never holds more than one report per endpoint. Also collects endpoint's health/latency stats"""
+
+    def __init__(self, endpoint_name: str):
+        self.endpoint_name = endpoint_name
+        self.spool_path: Path = None
+        self.pending: dict = None
+        self.retry_task: asyncio.Task = None
+        self._spooled: dict = None
+        self._write_lock = asyncio.Lock()
+        self.failed_attempts = 0
+        self.unavailable_since: float = None
+        self.stats = {"uploads": 0, "failures": 0, "superseded": 0, "bytes": 0, "latency_total": 0.0, "latency_max": 0.0}
+
+    def attach(self, state_dir: Path, use_compression: bool = False) -> bool:
+        """Called once state dir is known, returns True when there is a report left undelivered by previous process"""
+        if self.spool_path is not None:
+            return False
+        file_name = hashlib.sha256(self.endpoint_name.encode("utf-8")).hexdigest()[:16] + ".json"
+        self.spool_path = state_dir.joinpath(Constants.REPORT_SPOOL_DIR_NAME, file_name)
+        if not self.spool_path.exists():
+            return False
+        try:
+            body = self.spool_path.read_bytes()
+            self.pending = {
+                "hash": ReportDelta.content_hash(body.decode("utf-8")),
+                "body": body,
+                "gzip_body": gzip.compress(body) if use_compression else None,
+                "plain": None,
+            }
+            self._spooled = self.pending
+            return True
+        except Exception as e:
+            logging.warning(f"Can't read spooled report of {self.endpoint_name} - [{type(e)} - {str(e)}]")
+            return False
+
+    def is_retrying(self) -> bool:
+        return self.retry_task is not None and not self.retry_task.done()
+
+    async def put(self, encoded_report: dict):
+        """Replaces pending report on event loop - only writing of spool file is done in thread"""
+        if self.pending is not None:
+            if self.pending["hash"] == encoded_report["hash"]:
+                return
+            self.stats["superseded"] += 1
+        self.pending = encoded_report
+        await self._write_spool_file()
+
+    async def _write_spool_file(self):
+        async with self._write_lock:  # so slower write of older report can't overwrite newer one
+            encoded_report = self.pending
+            if self.spool_path is None or encoded_report is None or encoded_report is self._spooled:
+                return
+            try:
+                await asyncio.to_thread(self._write_file, encoded_report["body"])
+            except Exception as e:
+                logging.warning(f"Can't spool report of {self.endpoint_name} to '{self.spool_path}' - [{type(e)} - {str(e)}]")
+                return
+            self._spooled = encoded_report
+            if self.pending is None:  # delivered while it was being written - it mustn't be retried by next process
+                self.spool_path.unlink(missing_ok=True)
+
+    def _write_file(self, body: bytes):
+        self.spool_path.parent.mkdir(parents=True, exist_ok=True)
+        CommonUtils.write_file_atomically(body, self.spool_path)
+
+    def clear(self):
+        """Write of spool file that is still in progress removes it once finished"""
+        self.pending = None
+        self._spooled = None
+        if self.spool_path is not None:
+            self.spool_path.unlink(missing_ok=True)
+
+    def record_attempt(self, sent_bytes: int | None, latency: float):
+        """'sent_bytes' is None for failed attempt"""
+        if sent_bytes is None:
+            self.stats["failures"] += 1
+            self.failed_attempts += 1
+            if self.unavailable_since is None:
+                self.unavailable_since = time.monotonic()
+                logging.warning(f"Report endpoint {self.endpoint_name} is unavailable - report will be retried with backoff (spooled to '{self.spool_path}')")
+            return
+        self.stats["uploads"] += 1
+        self.stats["bytes"] += sent_bytes
+        self.stats["latency_total"] += latency
+        self.stats["latency_max"] = max(self.stats["latency_max"], latency)
+        if self.unavailable_since is not None:
+            logging.info(f"Report endpoint {self.endpoint_name} is available again after {self.failed_attempts} failed attempt(s) "
+                         f"({time.monotonic() - self.unavailable_since:.1f}s)")
+        self.failed_attempts = 0
+        self.unavailable_since = None
+
+    def next_retry_delay(self) -> float:
+        # exponential, with jitter - so endpoints (and executors sharing a receiver) don't retry in lockstep
+        delay = min(EnvVar.REPORT_UPLOAD_RETRY_MAX_DELAY, EnvVar.REPORT_UPLOAD_RETRY_BASE_DELAY * 2 ** max(0, self.failed_attempts - 1))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def log_stats(self):
+        if not (attempts := self.stats["uploads"] + self.stats["failures"]):
+            return
+        average_latency = self.stats["latency_total"] / self.stats["uploads"] * 1000 if self.stats["uploads"] else 0
+        logging.info(f"Report endpoint {self.endpoint_name}: {attempts} upload attempt(s), {self.stats['failures']} failed, "
+                     f"{self.stats['superseded']} superseded while pending, {self.stats['bytes']} bytes sent, "
+                     f"latency avg={average_latency:.0f}ms max={self.stats['latency_max'] * 1000:.0f}ms")
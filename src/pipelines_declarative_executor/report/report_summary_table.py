@@ -1,6 +1,6 @@
 from datetime import datetime
+from logging import Logger
 
-import tabulate
 from pipelines_declarative_executor.model.pipeline import PipelineExecution
 from pipelines_declarative_executor.model.stage import ExecutionStatus, StageType
 from pipelines_declarative_executor.utils.color_utils import ColorUtils
@@ -12,175 +12,181 @@ from pipelines_declarative_executor.utils.string_utils import StringUtils
 class ReportSummaryTable:
 
     TABLE_BORDER_LINE_WIDTH = 120
-    TABULATE_TABLE_FORMAT = "github"
+    LOG_CHUNK_LINES = 1000
     UNKNOWN_VALUE = "N/A"
 
     BLANK_GUIDE = "    "
     NESTED_PIPELINE_TRIGGER_MARKER = "▶ "
+    MATRIX_MARKER = "⊞ "
     PIPES          = ("│   ", "├─ ", "└─ ")
     PIPES_PARALLEL = ("║   ", "╠═ ", "╚═ ")
 
     @staticmethod
     def generate_summary_table(generated_report: dict = None, execution: PipelineExecution = None) -> str:
-        if generated_report:
-            report = generated_report
-        elif execution:
-            from pipelines_declarative_executor.report.report_collector import ReportCollector
-            report = ReportCollector.prepare_ui_view(execution)
-        else:
+        if not (report := ReportSummaryTable._get_report(generated_report, execution)):
             return "[No data for report provided]"
+        return "\n".join(ReportSummaryTable.iter_summary_lines(report))
 
-        all_rows = []
-        ReportSummaryTable._transform_stages_to_rows(report.get('stages', []), all_rows)
-        return ReportSummaryTable._build_table_with_header(
-            report=report,
-            rows=all_rows
-        )
+    @staticmethod
+    def log_summary_table(logger: Logger, generated_report: dict = None, execution: PipelineExecution = None):
+        """Writes summary table to logger by LOG_CHUNK_LINES lines, instead of building it as one string"""
+        if not (report := ReportSummaryTable._get_report(generated_report, execution)):
+            logger.info("[No data for report provided]")
+            return
+        chunk = []
+        for line in ReportSummaryTable.iter_summary_lines(report):
+            chunk.append(line)
+            if len(chunk) == ReportSummaryTable.LOG_CHUNK_LINES:
+                logger.info("\n" + "\n".join(chunk))
+                chunk.clear()
+        if chunk:
+            logger.info("\n" + "\n".join(chunk))
 
     @staticmethod
-    def _transform_stages_to_rows(stages: list, rows: list, level: int = 0, ancestor_guides: list = None, parent_is_parallel: bool = False) -> None:
-        if ancestor_guides is None:
-            ancestor_guides = []
+    def _get_report(generated_report: dict = None, execution: PipelineExecution = None) -> dict | None:
+        if generated_report:
+            return generated_report
+        if execution:
+            from pipelines_declarative_executor.report.report_collector import ReportCollector
+            return ReportCollector.prepare_ui_view(execution)  # fragments of finished stages are cached by now
+        return None
 
-        for i, stage in enumerate(stages):
-            is_current_last = (i == len(stages) - 1)
+    @staticmethod
+    def iter_summary_lines(report: dict):
+        """Cells of all rows are collected (and column widths calculated) in one pass over report stages, then rows are formatted one by one"""
+        headers = ["Stage ID", "Stage Name", "Status", "Duration", "Type", "Command"]
+        if EnvVar.ENABLE_STAGE_RESOURCE_USAGE_PROFILING:
+            headers.extend(["Peak Mem", "Avg Cpu", "Queue Wait"])
+        headers.append("Needs")
+        if EnvVar.ENABLE_STAGE_CACHE:
+            headers.append("Cache")
+        needs_column = headers.index("Needs")
+
+        # columns are at least 2 characters wider than their headers (as 'github' format of tabulate draws them)
+        entries, widths, stats = [], [len(header) + 2 for header in headers], {"stages": 0, "has_needs": False}
+        ReportSummaryTable._collect_rows(report.get('stages', []), entries, widths, stats)
+        if not stats["has_needs"]:
+            del headers[needs_column], widths[needs_column]
+
+        def format_line(cells: list) -> str:
+            if not stats["has_needs"]:
+                cells = cells[:needs_column] + cells[needs_column + 1:]
+            return "| " + " | ".join(cell.ljust(width) for cell, width in zip(cells, widths)) + " |"
+
+        yield "=" * ReportSummaryTable.TABLE_BORDER_LINE_WIDTH
+        yield format_line(headers)
+        yield "|" + "|".join("-" * (width + 2) for width in widths) + "|"
+        for cells, status, section_id in entries:
+            if cells is None:
+                yield LoggingUtils.ci_section_end(section_id=section_id)
+                continue
+            line = format_line(cells)
+            if status == ExecutionStatus.FAILED:
+                line = ColorUtils.with_color(line, ColorUtils.FAILURE_COLOR)
+            yield LoggingUtils.ci_section_start(header=line, section_id=section_id) if section_id else line
+        yield "=" * ReportSummaryTable.TABLE_BORDER_LINE_WIDTH
+        yield f"PIPELINE SUMMARY: {ReportSummaryTable._get_or_default(report, 'name')}"
+        yield f"ID: {ReportSummaryTable._get_or_default(report, 'id')}"
+        yield f"Total Duration: {ReportSummaryTable._get_precise_duration_str(report.get('startedAt'), report.get('finishedAt'))}"
+        yield f"Total Stages: {stats['stages']}"
+        yield f"Retry attempts: {report.get('customData', {}).get('retry_attempt', 0)}"
+        yield f"Status: {ColorUtils.colorize_status(ReportSummaryTable._get_or_default(report, 'status'))}"
+        if EnvVar.ENABLE_PEAK_RESOURCE_USAGE_PROFILING:
+            yield from ReportSummaryTable._build_peak_usage_section()
+        yield "=" * ReportSummaryTable.TABLE_BORDER_LINE_WIDTH
 
-            nesting_prefix = ""
-            if level > 0:
-                if parent_is_parallel:
-                    connector = ReportSummaryTable.PIPES_PARALLEL[2] if is_current_last else ReportSummaryTable.PIPES_PARALLEL[1]
-                else:
-                    connector = ReportSummaryTable.PIPES[2] if is_current_last else ReportSummaryTable.PIPES[1]
-                nesting_prefix = "".join(ancestor_guides) + connector
-
-            row_index = len(rows)
-            rows.append({
-                'prefix': nesting_prefix,
-                'name': ReportSummaryTable._get_or_default(stage, 'name'),
-                'id': ReportSummaryTable._get_or_default(stage, 'id'),
-                'status': ReportSummaryTable._get_or_default(stage, 'status'),
-                'time': ReportSummaryTable._get_precise_duration_str(stage.get('startedAt'), stage.get('finishedAt')),
-                'type': ReportSummaryTable._get_or_default(stage, 'type'),
-                'command': stage.get('command', ""),
-                'level': level,
-                'peakMem': stage.get('performance', {}).get('peakMemory'),
-                'avgCpu': stage.get('performance', {}).get('avgCpu'),
-                'opens_collapse': False,
-                'descendant_count': 0,
-            })
-
-            if is_current_last:
-                my_guide = ReportSummaryTable.BLANK_GUIDE
-            else:
-                my_guide = ReportSummaryTable.PIPES_PARALLEL[0] if parent_is_parallel else ReportSummaryTable.PIPES[0]
-            child_guides = ancestor_guides + [my_guide]
-
-            children_start = len(rows)
+    @staticmethod
+    def _collect_rows(stages: list, entries: list, widths: list, stats: dict, level: int = 0, ancestor_guides: str = "", parent_is_parallel: bool = False) -> None:
+        """Appends (cells, status, section_id) entries - with (None, None, section_id) closing collapsible sections.
+        Only SUMMARY_TABLE_MAX_ROWS_PER_LEVEL first stages of each level are shown, the rest is replaced by a single row"""
+        pipes = ReportSummaryTable.PIPES_PARALLEL if parent_is_parallel else ReportSummaryTable.PIPES
+        max_rows = EnvVar.SUMMARY_TABLE_MAX_ROWS_PER_LEVEL
+        shown_stages = stages[:max_rows] if 0 < max_rows < len(stages) else stages
+        collapsible = ReportSummaryTable._collapsible_summary_enabled()
+
+        for i, stage in enumerate(shown_stages):
+            is_current_last = (i == len(stages) - 1)
+            nesting_prefix = ancestor_guides + (pipes[2] if is_current_last else pipes[1]) if level > 0 else ""
+            cells = ReportSummaryTable._get_row_cells(stage, nesting_prefix)
+            ReportSummaryTable._add_entry(entries, widths, cells, stage.get('status'))
+            stats["stages"] += 1
+            stats["has_needs"] = stats["has_needs"] or stage.get('needs') is not None
+
+            entry_index = len(entries) - 1
+            child_guides = ancestor_guides + (ReportSummaryTable.BLANK_GUIDE if is_current_last else pipes[0])
             if parallel_stages := stage.get('parallelStages', []):
-                ReportSummaryTable._transform_stages_to_rows(parallel_stages, rows, level + 1, child_guides, parent_is_parallel=True)
-
+                ReportSummaryTable._collect_rows(parallel_stages, entries, widths, stats, level + 1, child_guides, parent_is_parallel=True)
             if nested_stages := stage.get('nestedPipeline', {}).get('stages', []):
-                ReportSummaryTable._transform_stages_to_rows(nested_stages, rows, level + 1, child_guides, parent_is_parallel=False)
-
-            descendant_count = len(rows) - children_start
-            if descendant_count > 0:
-                rows[row_index]['opens_collapse'] = True
-                rows[row_index]['descendant_count'] = descendant_count
+                ReportSummaryTable._collect_rows(nested_stages, entries, widths, stats, level + 1, child_guides, parent_is_parallel=False)
+            if collapsible and len(entries) - 1 > entry_index:
+                section_id = str(ReportSummaryTable._get_or_default(stage, 'id'))
+                entries[entry_index] = (cells, stage.get('status'), section_id)
+                entries.append((None, None, section_id))
+
+        if omitted_stages := stages[len(shown_stages):]:
+            statuses = {}
+            for stage in omitted_stages:
+                statuses[str(stage.get('status'))] = statuses.get(str(stage.get('status')), 0) + 1
+                stats["stages"] += ReportSummaryTable._count_stages(stage)
+            nesting_prefix = ancestor_guides + pipes[2] if level > 0 else ""
+            summary = ", ".join(f"{status}: {count}" for status, count in statuses.items())
+            cells = ["", f"{nesting_prefix}... {len(omitted_stages)} more stage(s) ({summary})", *[""] * (len(widths) - 2)]
+            ReportSummaryTable._add_entry(entries, widths, cells, ExecutionStatus.FAILED if ExecutionStatus.FAILED in statuses else None)
 
     @staticmethod
-    def _collapsible_summary_enabled() -> bool:
-        return EnvVar.ENABLE_COLLAPSIBLE_SUMMARY_TABLE_ROWS and EnvVar.IS_GITLAB
+    def _add_entry(entries: list, widths: list, cells: list, status):
+        for i, cell in enumerate(cells):
+            if len(cell) > widths[i]:
+                widths[i] = len(cell)
+        entries.append((cells, status, None))
 
     @staticmethod
-    def _should_collapse_row(row: dict) -> bool:
-        return bool(row.get('opens_collapse'))
-
-    @staticmethod
-    def _build_table_with_header(report: dict, rows: list) -> str:
-        headers = ["Stage ID", "Stage Name", "Status", "Duration", "Type", "Command"]
-        table_data = []
-        for row in rows:
-            marker = ReportSummaryTable.NESTED_PIPELINE_TRIGGER_MARKER if row['type'] == StageType.ATLAS_PIPELINE_TRIGGER else ""
-            table_data.append([
-                ReportSummaryTable._format_stage_id(row['id']),
-                f"{row['prefix']}{marker}{row['name']}",
-                row['status'],
-                row['time'],
-                row['type'],
-                row['command'],
-            ])
-
+    def _get_row_cells(stage: dict, nesting_prefix: str) -> list:
+        truncate = ReportSummaryTable._truncate
+        performance = stage.get('performance', {})
+        marker = ReportSummaryTable._get_row_marker(stage)
+        cells = [
+            truncate(ReportSummaryTable._format_stage_id(ReportSummaryTable._get_or_default(stage, 'id'))),
+            nesting_prefix + truncate(f"{marker}{ReportSummaryTable._get_or_default(stage, 'name')}"),  # nesting guides are never cut
+            truncate(ReportSummaryTable._get_or_default(stage, 'status')),
+            ReportSummaryTable._get_precise_duration_str(stage.get('startedAt'), stage.get('finishedAt')),
+            truncate(ReportSummaryTable._get_or_default(stage, 'type')),
+            truncate(stage.get('command', "")),
+        ]
         if EnvVar.ENABLE_STAGE_RESOURCE_USAGE_PROFILING:
-            headers.extend(["Peak Mem", "Avg Cpu"])
-            for i, row in enumerate(rows):
-                table_data[i].extend([row['peakMem'], row['avgCpu']])
-
-        tabulate.PRESERVE_WHITESPACE = True  # to keep our stage-name indentation/nesting prefixes
-        table_str = tabulate.tabulate(table_data, headers, tablefmt=ReportSummaryTable.TABULATE_TABLE_FORMAT)
-        table_lines = table_str.split("\n")
-        header_offset = 2
-        header_lines = table_lines[:header_offset]
-        data_lines = table_lines[header_offset:]
-
-        if ReportSummaryTable._collapsible_summary_enabled():
-            body_lines = ReportSummaryTable._emit_collapsible_data_lines(rows, data_lines)
-        else:
-            body_lines = ReportSummaryTable._colorize_data_lines(rows, data_lines)
-
-        lines = []
-        lines.append("=" * ReportSummaryTable.TABLE_BORDER_LINE_WIDTH)
-        lines.extend(header_lines)
-        lines.extend(body_lines)
-        lines.append("=" * ReportSummaryTable.TABLE_BORDER_LINE_WIDTH)
-        lines.append(f"PIPELINE SUMMARY: {ReportSummaryTable._get_or_default(report, 'name')}")
-        lines.append(f"ID: {ReportSummaryTable._get_or_default(report, 'id')}")
-        lines.append(f"Total Duration: {ReportSummaryTable._get_precise_duration_str(report.get('startedAt'), report.get('finishedAt'))}")
-        lines.append(f"Total Stages: {len(rows)}")
-        lines.append(f"Retry attempts: {report.get('customData', {}).get('retry_attempt', 0)}")
-        lines.append(f"Status: {ColorUtils.colorize_status(ReportSummaryTable._get_or_default(report, 'status'))}")
-        if EnvVar.ENABLE_PEAK_RESOURCE_USAGE_PROFILING:
-            lines.extend(ReportSummaryTable._build_peak_usage_section())
-        lines.append("=" * ReportSummaryTable.TABLE_BORDER_LINE_WIDTH)
+            queue_wait = stage.get('queueWait')
+            cells.extend([truncate(performance.get('peakMemory')), truncate(performance.get('avgCpu')),
+                          f"{queue_wait:.3f}s" if queue_wait is not None else ""])
+        needs = stage.get('needs')
+        cells.append(truncate(", ".join(ReportSummaryTable._format_stage_id(uuid) for uuid in needs) if needs else ""))
+        if EnvVar.ENABLE_STAGE_CACHE:
+            cells.append(truncate(stage.get('cache')))
+        return cells
 
-        return "\n".join(lines)
+    @staticmethod
+    def _truncate(value) -> str:
+        value = "" if value is None else str(value)
+        max_width = EnvVar.SUMMARY_TABLE_MAX_CELL_WIDTH
+        if 0 < max_width < len(value):
+            return value[:max(max_width - 3, 0)] + "..."
+        return value
 
     @staticmethod
-    def _colorize_line_if_failed(line: str, row: dict) -> str:
-        if row['status'] == ExecutionStatus.FAILED:
-            return ColorUtils.with_color(line, ColorUtils.FAILURE_COLOR)
-        return line
+    def _count_stages(stage: dict) -> int:
+        return 1 + sum(ReportSummaryTable._count_stages(nested_stage) for nested_stage in
+                       [*stage.get('parallelStages', []), *stage.get('nestedPipeline', {}).get('stages', [])])
 
     @staticmethod
-    def _colorize_data_lines(rows: list, data_lines: list) -> list:
-        colored = []
-        for i, row in enumerate(rows):
-            if i < len(data_lines):
-                colored.append(ReportSummaryTable._colorize_line_if_failed(data_lines[i], row))
-        return colored
+    def _collapsible_summary_enabled() -> bool:
+        return EnvVar.ENABLE_COLLAPSIBLE_SUMMARY_TABLE_ROWS and EnvVar.IS_GITLAB
 
     @staticmethod
-    def _emit_collapsible_data_lines(rows: list, data_lines: list, start: int = 0, end: int = None) -> list:
-        if end is None:
-            end = len(rows)
-        emitted = []
-        i = start
-        while i < end:
-            row = rows[i]
-            line = data_lines[i] if i < len(data_lines) else ""
-            line = ReportSummaryTable._colorize_line_if_failed(line, row)
-
-            if ReportSummaryTable._should_collapse_row(row):
-                section_id = str(row['id'])
-                emitted.append(LoggingUtils.ci_section_start(header=line, section_id=section_id))
-                desc_start = i + 1
-                desc_end = i + 1 + row['descendant_count']
-                emitted.extend(ReportSummaryTable._emit_collapsible_data_lines(rows, data_lines, desc_start, desc_end))
-                emitted.append(LoggingUtils.ci_section_end(section_id=section_id))
-                i = desc_end
-            else:
-                emitted.append(line)
-                i += 1
-        return emitted
+    def _get_row_marker(stage: dict) -> str:
+        if stage.get('type') == StageType.ATLAS_PIPELINE_TRIGGER:
+            return ReportSummaryTable.NESTED_PIPELINE_TRIGGER_MARKER
+        if stage.get('matrix') is not None:
+            return ReportSummaryTable.MATRIX_MARKER
+        return ""
 
     @staticmethod
     def _format_stage_id(stage_id: str) -> str:
@@ -1,4 +1,4 @@
-import asyncio, aiohttp, logging, json, gzip, io
+import asyncio, aiohttp, hashlib, logging, json, gzip, io, time
 
 from aiohttp import BasicAuth
 from miniopy_async import Minio
@@ -6,14 +6,19 @@ from miniopy_async import Minio
 from pipelines_declarative_executor.model.pipeline import PipelineExecution
 from pipelines_declarative_executor.model.report import RemoteEndpointConfig, HttpEndpointConfig, S3EndpointConfig, ReportUploadMode, ReportUploadType
 from pipelines_declarative_executor.report.report_collector import ReportCollector
+from pipelines_declarative_executor.report.report_delta import ReportDelta
+from pipelines_declarative_executor.report.report_spool import ReportSpool
 from pipelines_declarative_executor.utils.env_var_utils import EnvVar, EnvVarUtils
-from pipelines_declarative_executor.utils.string_utils import StringUtils
 
 
 class ReportUploader:
+    BLOB_HASH_HEADER = "X-Blob-Hash"
+
     def __init__(self, execution: PipelineExecution, configs: list[RemoteEndpointConfig], **kwargs):
         self.execution = execution
         self._periodic_task = None
+        self._change_event = None
+        self._loop = None
         self.http_sessions = []
         self.s3_clients = []
         for config in configs:
@@ -25,7 +30,13 @@ class ReportUploader:
                 self.http_sessions.append({
                     "session": aiohttp.ClientSession(auth=config.auth, headers=headers),
                     "endpoint": config.endpoint,
+                    "blob_endpoint": config.blob_endpoint,
+                    "spool": ReportSpool(config.endpoint),
+                    "uploaded_blobs": set(),
+                    "stale_blobs": set(),
                     "use_compression": config.use_compression,
+                    "use_delta": config.use_delta and EnvVar.REPORT_SEND_MODE != ReportUploadMode.ON_COMPLETION,
+                    **ReportUploader._initial_upload_state(),
                 })
             elif isinstance(config, S3EndpointConfig):
                 self.s3_clients.append({
@@ -38,6 +49,10 @@ class ReportUploader:
                     "bucket_name": config.bucket_name,
                     "object_name": config.object_name,
                     "use_compression": config.use_compression,
+                    "spool": ReportSpool(f"s3://{config.host}/{config.bucket_name}/{config.object_name}"),
+                    "uploaded_blobs": set(),
+                    "stale_blobs": set(),
+                    **ReportUploader._initial_upload_state(),
                 })
             else:
                 logging.error(f"Unknown report RemoteEndpointConfig type: {type(config)}")
@@ -46,9 +61,16 @@ class ReportUploader:
         if self.http_sessions or self.s3_clients:
             if EnvVar.REPORT_SEND_MODE == ReportUploadMode.PERIODIC:
                 self._periodic_task = asyncio.create_task(self._periodic_send())
+            elif EnvVar.REPORT_SEND_MODE == ReportUploadMode.ON_CHANGE:
+                self._loop = asyncio.get_running_loop()
+                self._change_event = asyncio.Event()
+                ReportCollector.add_change_listener(self._on_change)
+                self._periodic_task = asyncio.create_task(self._send_on_change())
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
+        if self._change_event:
+            ReportCollector.remove_change_listener(self._on_change)
         if self._periodic_task:
             self._periodic_task.cancel()
             try:
@@ -56,6 +78,7 @@ class ReportUploader:
             except asyncio.CancelledError:
                 pass
         await self._send_report()
+        await self._flush_spooled_reports()
         await self.close()
 
     async def close(self):
@@ -76,42 +99,251 @@ class ReportUploader:
         except asyncio.CancelledError:
             pass
 
+    def _on_change(self):
+        # stage transitions might be stored outside of event loop's thread
+        self._loop.call_soon_threadsafe(self._change_event.set)
+
+    async def _send_on_change(self):
+        """Uploads report after stage transitions - waits REPORT_SEND_DEBOUNCE_INTERVAL after first one (so bursts of transitions are sent together),
+        and keeps at least REPORT_SEND_MIN_INTERVAL between uploads"""
+        last_sent_at = None
+        try:
+            while True:
+                await self._change_event.wait()
+                await asyncio.sleep(EnvVar.REPORT_SEND_DEBOUNCE_INTERVAL)
+                if last_sent_at is not None and (remaining := EnvVar.REPORT_SEND_MIN_INTERVAL - (time.monotonic() - last_sent_at)) > 0:
+                    await asyncio.sleep(remaining)
+                self._change_event.clear()
+                await self._send_report()
+                last_sent_at = time.monotonic()
+        except asyncio.CancelledError:
+            pass
+
     async def _send_report(self):
         try:
-            report = self._get_report().encode("utf-8")
+            report = self._get_report()
+            targets = self.http_sessions + self.s3_clients
+            for target in targets:
+                if target["spool"].attach(self.execution.state_dir, target.get("use_compression")):
+                    # report left undelivered by previous process - blobs it references are uploaded before it as well
+                    target["spool"].pending["blobs"] = ReportUploader._collect_blobs(json.loads(target["spool"].pending["body"]))
+                    self._start_retrying(target)
+            # serialization/compression of big reports would stall event loop (and running stages with it)
+            encoded_report = await asyncio.to_thread(ReportUploader._encode_report, report, targets)
+            if encoded_report is None:  # nothing changed since previous upload to any endpoint
+                return
             upload_tasks = []
-            for session_data in self.http_sessions:
-                upload_tasks.append(self._upload_via_http(session_data, report))
-            for s3_data in self.s3_clients:
-                upload_tasks.append(self._upload_via_s3(s3_data, report))
+            for target in targets:
+                if target["sent_hash"] == encoded_report["hash"]:
+                    continue
+                if target["spool"].is_retrying():
+                    # endpoint is unavailable - newer report replaces pending one, and is sent with next retry
+                    await target["spool"].put(encoded_report)
+                else:
+                    upload_tasks.append(self._deliver_or_spool(target, encoded_report))
             await asyncio.gather(*upload_tasks, return_exceptions=True)
         except FileNotFoundError as e:
             logging.debug(e)
         except Exception as e:
             logging.error(f"Exception during sending report: [{type(e)} - {str(e)}]")
 
-    def _get_report(self) -> str:
+    def _get_report(self) -> dict:
         if self.execution.state_dir and self.execution.state_dir.exists():
-            report = ReportCollector.prepare_ui_view(self.execution)
-            return json.dumps(report, default=StringUtils.json_encode)
+            return ReportCollector.prepare_ui_view(self.execution)
         raise FileNotFoundError("Report not found/not ready yet")
 
     @staticmethod
-    async def _upload_via_http(session_data: dict, report: bytes):
+    async def _deliver(target: dict, encoded_report: dict) -> bool:
+        upload = ReportUploader._upload_via_http if "session" in target else ReportUploader._upload_via_s3
+        start_time = time.monotonic()
+        # blobs go first, so receiver never gets report referencing blob it doesn't have
+        if (sent_bytes := await ReportUploader._upload_blobs(target, encoded_report.get("blobs"))) is not None:
+            report_bytes = await upload(target, encoded_report)
+            sent_bytes = None if report_bytes is None else sent_bytes + report_bytes
+        target["spool"].record_attempt(sent_bytes, time.monotonic() - start_time)
+        return sent_bytes is not None
+
+    async def _deliver_or_spool(self, target: dict, encoded_report: dict):
+        if not await self._deliver(target, encoded_report):
+            await target["spool"].put(encoded_report)
+            self._start_retrying(target)
+
+    def _start_retrying(self, target: dict):
+        if not target["spool"].is_retrying():
+            target["spool"].retry_task = asyncio.create_task(self._retry_spooled_report(target))
+
+    async def _retry_spooled_report(self, target: dict):
+        spool = target["spool"]
+        while spool.pending is not None:
+            if spool.failed_attempts:
+                await asyncio.sleep(spool.next_retry_delay())
+            if target["stale_blobs"]:
+                await self._refresh_spooled_report(target)
+            encoded_report = spool.pending
+            if await self._deliver(target, encoded_report) and spool.pending["hash"] == encoded_report["hash"]:
+                spool.clear()
+
+    async def _refresh_spooled_report(self, target: dict):
+        """Module report referenced by pending report changed or disappeared - pending report is replaced by rebuilt one"""
+        ReportCollector.forget_module_report_refs(self.execution, target["stale_blobs"])
+        target["stale_blobs"].clear()
+        try:
+            if encoded_report := await asyncio.to_thread(ReportUploader._encode_report, self._get_report(), [target]):
+                await target["spool"].put(encoded_report)
+            else:  # endpoint already has current report
+                target["spool"].clear()
+        except Exception as e:
+            logging.error(f"Exception during rebuilding report for {target['spool'].endpoint_name}: [{type(e)} - {str(e)}]")
+
+    async def _flush_spooled_reports(self):
+        """Gives endpoints that are unavailable REPORT_UPLOAD_FLUSH_TIMEOUT seconds to receive final report - it stays in spool file otherwise"""
+        spools = [target["spool"] for target in self.http_sessions + self.s3_clients]
+        if retry_tasks := [spool.retry_task for spool in spools if spool.is_retrying()]:
+            logging.info(f"Waiting up to {EnvVar.REPORT_UPLOAD_FLUSH_TIMEOUT}s for report delivery to {len(retry_tasks)} unavailable endpoint(s)")
+            _, unfinished_tasks = await asyncio.wait(retry_tasks, timeout=EnvVar.REPORT_UPLOAD_FLUSH_TIMEOUT)
+            for task in unfinished_tasks:
+                task.cancel()
+            await asyncio.gather(*unfinished_tasks, return_exceptions=True)
+        for spool in spools:
+            if spool.pending is not None:
+                logging.warning(f"Final report wasn't delivered to {spool.endpoint_name}, it's kept in '{spool.spool_path}'")
+            spool.log_stats()
+
+    @staticmethod
+    def _encode_report(report: dict, targets: list[dict]) -> dict | None:
+        """Runs in worker thread - encodes (and compresses) report once for all endpoints it has to be uploaded to, returns None if there are none"""
+        # patches are calculated against plain JSON values, same as receiver has
+        report_json, plain_report = ReportDelta.encode(report, with_plain=any(target.get("use_delta") for target in targets))
+        report_hash = ReportDelta.content_hash(report_json)
+        pending_targets = [target for target in targets if target["sent_hash"] != report_hash]
+        if not pending_targets:
+            return None
+        body = report_json.encode("utf-8")
+        return {
+            "hash": report_hash,
+            "body": body,
+            "gzip_body": gzip.compress(body) if any(target.get("use_compression") for target in pending_targets) else None,
+            "plain": plain_report,
+            "blobs": ReportUploader._collect_blobs(report),
+        }
+
+    @staticmethod
+    def _collect_blobs(report: dict) -> list[dict]:
+        """Returns references to externalized module reports of all stages (including parallel and nested ones)"""
+        blobs, pending = {}, list(report.get("stages") or [])
+        while pending:
+            stage = pending.pop()
+            if blob := stage.get(ReportCollector.MODULE_REPORT_REF):
+                blobs[blob["sha256"]] = blob
+            pending.extend(stage.get(ReportCollector.PARALLEL_STAGES) or [])
+            pending.extend((stage.get(ReportCollector.NESTED_PIPELINE) or {}).get("stages") or [])
+        return list(blobs.values())
+
+    @staticmethod
+    def _read_blob(blob: dict, use_compression: bool) -> bytes | None:
+        """Runs in worker thread - returns None if file was changed since it was referenced (newer report will reference it again)"""
+        with open(blob["path"], "rb") as f:
+            body = f.read()
+        if hashlib.sha256(body).hexdigest() != blob["sha256"]:
+            return None
+        return gzip.compress(body) if use_compression else body
+
+    @staticmethod
+    def _encode_patch(base_report: dict, encoded_report: dict, use_compression: bool) -> bytes | None:
+        """Runs in worker thread - returns None when patch isn't smaller than full report"""
+        patch = json.dumps(ReportDelta.diff(base_report, encoded_report["plain"]), separators=(",", ":")).encode("utf-8")
+        if len(patch) >= len(encoded_report["body"]):
+            return None
+        return gzip.compress(patch) if use_compression else patch
+
+    @staticmethod
+    def _initial_upload_state() -> dict:
+        # 'seq' is incremented with every upload attempt, 'base_report'/'base_seq' are last report acknowledged by receiver (diffs are calculated against it)
+        return {"seq": 0, "sent_hash": None, "base_report": None, "base_seq": None}
+
+    @staticmethod
+    async def _upload_blobs(target: dict, blobs: list[dict] | None) -> int | None:
+        """Uploads blobs that weren't uploaded to this endpoint yet - returns number of bytes sent, or None if upload failed.
+        HTTP endpoints without 'blob_endpoint' only receive references"""
+        sent_bytes = 0
+        if "session" in target and not target.get("blob_endpoint"):
+            return sent_bytes
+        for blob in blobs or []:
+            if blob["sha256"] in target["uploaded_blobs"]:
+                continue
+            try:
+                body = await asyncio.to_thread(ReportUploader._read_blob, blob, target.get("use_compression"))
+            except Exception as e:
+                logging.warning(f"Can't read module report '{blob['path']}' - [{type(e)} - {str(e)}]")
+                body = None
+            if body is None:
+                # report referencing it mustn't be delivered - it's replaced by rebuilt one before next retry
+                target["stale_blobs"].add(blob["sha256"])
+                return None
+            try:
+                if "session" in target:
+                    headers = {"Content-Type": blob["contentType"], ReportUploader.BLOB_HASH_HEADER: blob["sha256"]}
+                    async with target["session"].post(target["blob_endpoint"], data=body, headers=headers) as response:
+                        response.raise_for_status()
+                else:
+                    await target["client"].put_object(
+                        bucket_name=target.get("bucket_name"),
+                        object_name=ReportUploader._blob_object_name(target.get("object_name"), blob["sha256"]),
+                        data=io.BytesIO(body),
+                        length=len(body),
+                        content_type=blob["contentType"],
+                        metadata={"Content-Encoding": 'gzip'} if target.get("use_compression") else None,
+                    )
+            except Exception as e:
+                logging.error(f"Exception during uploading module report '{blob['path']}': [{type(e)} - {str(e)}]")
+                return None
+            target["uploaded_blobs"].add(blob["sha256"])
+            sent_bytes += len(body)
+        return sent_bytes
+
+    @staticmethod
+    def _blob_object_name(object_name: str, blob_hash: str) -> str:
+        return f"{object_name}.blobs/{blob_hash}"
+
+    @staticmethod
+    async def _upload_via_http(session_data: dict, encoded_report: dict) -> int | None:
+        """Returns number of bytes sent, or None if upload failed"""
         try:
             logging.debug(f"Uploading execution report via HTTP to {session_data.get('endpoint')}")
-            report_body = gzip.compress(report) if session_data.get("use_compression") else report
-            async with session_data.get("session").post(session_data.get("endpoint"), data=report_body) as response:
+            report_body = encoded_report["gzip_body"] if session_data.get("use_compression") else encoded_report["body"]
+            headers = None
+            if session_data.get("use_delta"):
+                session_data["seq"] += 1
+                headers = {ReportDelta.SEQ_HEADER: str(session_data["seq"]), ReportDelta.HASH_HEADER: encoded_report["hash"]}
+                if session_data["base_report"] is not None and encoded_report["plain"] is not None:
+                    patch_body = await asyncio.to_thread(ReportUploader._encode_patch, session_data["base_report"], encoded_report,
+                                                         session_data.get("use_compression"))
+                    if patch_body is not None:
+                        report_body = patch_body
+                        headers[ReportDelta.BASE_SEQ_HEADER] = str(session_data["base_seq"])
+                        headers["Content-Type"] = ReportDelta.PATCH_CONTENT_TYPE
+            async with session_data.get("session").post(session_data.get("endpoint"), data=report_body, headers=headers) as response:
+                if response.status == ReportDelta.RESYNC_STATUS and headers and ReportDelta.BASE_SEQ_HEADER in headers:
+                    logging.debug(f"{session_data.get('endpoint')} requested full report instead of patch")
+                    session_data.update(sent_hash=None, base_report=None, base_seq=None)
+                    return await ReportUploader._upload_via_http(session_data, encoded_report)
                 response.raise_for_status()
+                session_data["sent_hash"] = encoded_report["hash"]
+                if session_data.get("use_delta"):
+                    session_data.update(base_report=encoded_report["plain"], base_seq=session_data["seq"])
                 logging.debug(f"Upload via HTTP to {session_data.get('endpoint')} finished")
+                return len(report_body)
         except Exception as e:
+            # receiver's state is unknown now - next upload is a full report
+            session_data.update(sent_hash=None, base_report=None, base_seq=None)
             logging.error(f"Exception during uploading report via HTTP: [{type(e)} - {str(e)}]")
+            return None
 
     @staticmethod
-    async def _upload_via_s3(s3_data: dict, report: bytes):
+    async def _upload_via_s3(s3_data: dict, encoded_report: dict) -> int | None:
         try:
             logging.debug(f"Uploading execution report via S3 to bucket {s3_data.get('bucket_name')}")
-            report_body = gzip.compress(report) if s3_data.get("use_compression") else report
+            report_body = encoded_report["gzip_body"] if s3_data.get("use_compression") else encoded_report["body"]
             metadata = {"Content-Encoding": 'gzip'} if s3_data.get("use_compression") else None
             await s3_data.get("client").put_object(
                 bucket_name=s3_data.get("bucket_name"),
@@ -121,9 +353,12 @@ class ReportUploader:
                 content_type='application/json',
                 metadata=metadata,
             )
+            s3_data["sent_hash"] = encoded_report["hash"]
             logging.debug(f"Upload via S3 to bucket '{s3_data.get('bucket_name')}' finished")
+            return len(report_body)
         except Exception as e:
             logging.error(f"Exception during uploading report via S3: [{type(e)} - {str(e)}]")
+            return None
 
     @staticmethod
     def load_endpoint_configs() -> list[RemoteEndpointConfig]:
@@ -165,6 +400,8 @@ class ReportUploader:
                     auth=ReportUploader._get_basic_auth(config_item),
                     headers=ReportUploader._get_headers(config_item),
                     use_compression=config_item.get("use_compression", EnvVar.REPORT_UPLOAD_USE_COMPRESSION_DEFAULT),
+                    use_delta=config_item.get("use_delta", EnvVar.REPORT_UPLOAD_USE_DELTA_DEFAULT),
+                    blob_endpoint=config_item.get("blob_endpoint"),
                 )
 
             elif config_type == ReportUploadType.S3:
@@ -1,7 +1,7 @@
 # ruff: noqa: F821
 from __future__ import annotations
 
-import json, yaml, copy, shutil
+import os, json, yaml, copy, shutil, threading
 
 from pathlib import Path
 from typing import Any
@@ -18,9 +18,21 @@ class CommonUtils:
 
     @staticmethod
     def write_json(obj, file: str | Path, pretty: bool = False):
-        with open(file, 'w') as fs:
-            from pipelines_declarative_executor.utils.string_utils import StringUtils
-            fs.write(json.dumps(obj, indent=(2 if pretty else None), default=StringUtils.json_encode))
+        from pipelines_declarative_executor.utils.string_utils import StringUtils
+        CommonUtils.write_file_atomically(json.dumps(obj, indent=(2 if pretty else None), default=StringUtils.json_encode), file)
+
+    @staticmethod
+    def write_file_atomically(content: str | bytes, file: str | Path):
+        # written to temp file and renamed, so readers (e.g. UI polling pipeline_report.json) never see half-written file
+        file = Path(file)
+        tmp_file = file.with_name(f".{file.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            with open(tmp_file, 'wb' if isinstance(content, bytes) else 'w') as fs:
+                fs.write(content)
+            os.replace(tmp_file, file)
+        except BaseException:
+            tmp_file.unlink(missing_ok=True)
+            raise
 
     @staticmethod
     def dump_json(obj, pretty: bool = False) -> str:
@@ -62,6 +74,18 @@ class CommonUtils:
                 source[key] = value
         return source
 
+    @staticmethod
+    def merge_shared(source_dict: dict, target_dict: dict) -> dict:
+        """Same as 'recursive_merge', but values are not copied - result shares them with both dicts (so they must not be mutated).
+        Only dicts present in both are merged into new dicts"""
+        merged = dict(source_dict or {})
+        for key, value in (target_dict or {}).items():
+            if isinstance(merged.get(key), dict) and isinstance(value, dict):
+                merged[key] = CommonUtils.merge_shared(merged[key], value)
+            else:
+                merged[key] = value
+        return merged
+
     @staticmethod
     def create_exec_dir(execution_folder_path: str | Path, exists_ok: bool = False) -> Path:
         exec_dir = Path(execution_folder_path)
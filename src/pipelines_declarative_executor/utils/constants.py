@@ -9,12 +9,17 @@ class Constants:
     STATE_PIPELINE_FILE_NAME = "pipeline.json"
     STATE_VARS_FILE_NAME = "vars.json"
     PIPELINE_REPORT_FILE_NAME = "pipeline_report.json"
+    STATE_JOURNAL_FILE_NAME = "journal.jsonl"
+    STATE_STORE_FILE_NAME = "state.db"
+    REPORT_SPOOL_DIR_NAME = "report_spool"
 
     STAGE_INPUT_FILES_DIR_NAME = "input_files"
     STAGE_OUTPUT_FILES_DIR_NAME = "output_files"
     STAGE_LOGS_DIR_NAME = "logs"
     STAGE_REPORT_JSON_FILE_NAME = "module_report.json"
     STAGE_REPORT_YAML_FILE_NAME = "module_report.yaml"
+    STAGE_STDOUT_LOG_FILE_NAME = "stdout.log"
+    STAGE_STDERR_LOG_FILE_NAME = "stderr.log"
     PIPELINE_REPORT_FOR_REPORT_STAGE_FILE_NAME = "pipeline_report.json"
 
     DEFAULT_MASKED_VALUE = "[MASKED]"
@@ -1,5 +1,6 @@
 import os, logging, multiprocessing
 
+from pipelines_declarative_executor.model.executor import ModuleExecutionMode, StateFileFormat
 from pipelines_declarative_executor.model.report import ReportUploadMode
 from pipelines_declarative_executor.utils.string_utils import StringUtils
 
@@ -12,6 +13,7 @@ class EnvVar:
     AUTH_RULES_NAME = "PIPELINES_DECLARATIVE_EXECUTOR_AUTH_RULES"
     PYTHON_MODULE_PATH = os.getenv('PIPELINES_DECLARATIVE_EXECUTOR_PYTHON_MODULE_PATH', None)
     PREPARE_PYTHON_MODULE = StringUtils.to_bool(os.getenv('PIPELINES_DECLARATIVE_EXECUTOR_PREPARE_PYTHON_MODULE', True))
+    INFER_STAGE_DEPENDENCIES = StringUtils.to_bool(os.getenv('PIPELINES_DECLARATIVE_EXECUTOR_INFER_STAGE_DEPENDENCIES', False))
 
     # DEBUG
     IS_LOCAL_DEBUG = StringUtils.to_bool(os.getenv('PIPELINES_DECLARATIVE_EXECUTOR_IS_LOCAL_DEBUG', False))
@@ -20,6 +22,8 @@ class EnvVar:
     ENABLE_DEBUG_DATA_COLLECTOR = StringUtils.to_bool(os.getenv('PIPELINES_DECLARATIVE_EXECUTOR_ENABLE_DEBUG_DATA_COLLECTOR', True))
     ENABLE_COLLAPSIBLE_CI_LOGS = StringUtils.to_bool(os.getenv('PIPELINES_DECLARATIVE_EXECUTOR_ENABLE_COLLAPSIBLE_CI_LOGS', True))
     ENABLE_COLLAPSIBLE_SUMMARY_TABLE_ROWS = StringUtils.to_bool(os.getenv('PIPELINES_DECLARATIVE_EXECUTOR_ENABLE_COLLAPSIBLE_SUMMARY_TABLE_ROWS', True))
+    SUMMARY_TABLE_MAX_CELL_WIDTH = int(os.getenv('PIPELINES_DECLARATIVE_EXECUTOR_SUMMARY_TABLE_MAX_CELL_WIDTH', 100))
+    SUMMARY_TABLE_MAX_ROWS_PER_LEVEL = int(os.getenv('PIPELINES_DECLARATIVE_EXECUTOR_SUMMARY_TABLE_MAX_ROWS_PER_LEVEL', 0))
     USE_COMPACT_LOGGED_NAMES = StringUtils.to_bool(os.getenv('PIPELINES_DECLARATIVE_EXECUTOR_USE_COMPACT_LOGGED_NAMES', True))
     ENABLE_BACKUP_BEFORE_RETRY = StringUtils.to_bool(os.getenv('PIPELINES_DECLARATIVE_EXECUTOR_ENABLE_BACKUP_BEFORE_RETRY', False))
 
@@ -27,8 +31,16 @@ class EnvVar:
     REPORT_REMOTE_ENDPOINTS_NAME = "PIPELINES_DECLARATIVE_EXECUTOR_REPORT_REMOTE_ENDPOINTS"
     REPORT_SEND_MODE = ReportUploadMode(os.getenv('PIPELINES_DECLARATIVE_EXECUTOR_REPORT_SEND_MODE', ReportUploadMode.ON_COMPLETION))
     REPORT_SEND_INTERVAL = float(os.getenv('PIPELINES_DECLARATIVE_EXECUTOR_REPORT_SEND_INTERVAL', 5))
+    REPORT_SEND_DEBOUNCE_INTERVAL = float(os.getenv('PIPELINES_DECLARATIVE_EXECUTOR_REPORT_SEND_DEBOUNCE_INTERVAL', 0.2))
+    REPORT_SEND_MIN_INTERVAL = float(os.getenv('PIPELINES_DECLARATIVE_EXECUTOR_REPORT_SEND_MIN_INTERVAL', 1))
     REPORT_STATUS_POLL_INTERVAL = float(os.getenv('PIPELINES_DECLARATIVE_EXECUTOR_REPORT_STATUS_POLL_INTERVAL', 0.5))
     REPORT_UPLOAD_USE_COMPRESSION_DEFAULT = StringUtils.to_bool(os.getenv('PIPELINES_DECLARATIVE_EXECUTOR_REPORT_UPLOAD_USE_COMPRESSION_DEFAULT', True))
+    REPORT_UPLOAD_USE_DELTA_DEFAULT = StringUtils.to_bool(os.getenv('PIPELINES_DECLARATIVE_EXECUTOR_REPORT_UPLOAD_USE_DELTA_DEFAULT', False))
+    REPORT_UPLOAD_RETRY_BASE_DELAY = float(os.getenv('PIPELINES_DECLARATIVE_EXECUTOR_REPORT_UPLOAD_RETRY_BASE_DELAY', 1))
+    REPORT_UPLOAD_RETRY_MAX_DELAY = float(os.getenv('PIPELINES_DECLARATIVE_EXECUTOR_REPORT_UPLOAD_RETRY_MAX_DELAY', 30))
+    REPORT_UPLOAD_FLUSH_TIMEOUT = float(os.getenv('PIPELINES_DECLARATIVE_EXECUTOR_REPORT_UPLOAD_FLUSH_TIMEOUT', 30))
+    REPORT_FRAGMENT_CACHE_MAX_SIZE_MB = int(os.getenv('PIPELINES_DECLARATIVE_EXECUTOR_REPORT_FRAGMENT_CACHE_MAX_SIZE_MB', 64))
+    REPORT_MODULE_REPORT_INLINE_MAX_SIZE_KB = int(os.getenv('PIPELINES_DECLARATIVE_EXECUTOR_REPORT_MODULE_REPORT_INLINE_MAX_SIZE_KB', 256))
 
     # ENCRYPTION
     ENCRYPT_OUTPUT_PARAMS = StringUtils.to_bool(os.getenv('PIPELINES_DECLARATIVE_EXECUTOR_ENCRYPT_OUTPUT_SECURE_PARAMS', True))
@@ -38,6 +50,21 @@ class EnvVar:
     # SUBPROCESSES
     SHELL_PROCESS_TIMEOUT = int(os.getenv('PIPELINES_DECLARATIVE_EXECUTOR_SHELL_PROCESS_TIMEOUT', 30))
     SOPS_PROCESS_TIMEOUT = int(os.getenv('PIPELINES_DECLARATIVE_EXECUTOR_SOPS_PROCESS_TIMEOUT', 10))
+    PYTHON_MODULE_EXECUTION_MODE = ModuleExecutionMode(os.getenv('PIPELINES_DECLARATIVE_EXECUTOR_PYTHON_MODULE_EXECUTION_MODE', ModuleExecutionMode.SUBPROCESS))
+    MODULE_WORKER_MAX_STAGES = max(1, int(os.getenv('PIPELINES_DECLARATIVE_EXECUTOR_MODULE_WORKER_MAX_STAGES', 50)))
+    STAGE_OUTPUT_TAIL_LINES = max(1, int(os.getenv('PIPELINES_DECLARATIVE_EXECUTOR_STAGE_OUTPUT_TAIL_LINES', 500)))
+
+    # STAGE CACHE
+    ENABLE_STAGE_CACHE = StringUtils.to_bool(os.getenv('PIPELINES_DECLARATIVE_EXECUTOR_ENABLE_STAGE_CACHE', False))
+    STAGE_CACHE_DIR = os.getenv('PIPELINES_DECLARATIVE_EXECUTOR_STAGE_CACHE_DIR', os.path.join(os.path.expanduser("~"), ".cache", "pipelines_declarative_executor", "stage_cache"))
+    STAGE_CACHE_MAX_SIZE_MB = int(os.getenv('PIPELINES_DECLARATIVE_EXECUTOR_STAGE_CACHE_MAX_SIZE_MB', 1024))
+
+    # EXECUTION STATE
+    ENABLE_EXECUTION_JOURNAL = StringUtils.to_bool(os.getenv('PIPELINES_DECLARATIVE_EXECUTOR_ENABLE_EXECUTION_JOURNAL', True))
+    EXECUTION_JOURNAL_SNAPSHOT_INTERVAL = max(1, int(os.getenv('PIPELINES_DECLARATIVE_EXECUTOR_EXECUTION_JOURNAL_SNAPSHOT_INTERVAL', 100)))
+    STATE_WRITE_INTERVAL = max(0, int(os.getenv('PIPELINES_DECLARATIVE_EXECUTOR_STATE_WRITE_INTERVAL', 500)))
+    STATE_FILE_FORMAT = StateFileFormat(os.getenv('PIPELINES_DECLARATIVE_EXECUTOR_STATE_FILE_FORMAT', StateFileFormat.JSON))
+    ENABLE_SQLITE_STATE_STORE = StringUtils.to_bool(os.getenv('PIPELINES_DECLARATIVE_EXECUTOR_ENABLE_SQLITE_STATE_STORE', False))
 
     # RESOURCE MANAGEMENT
     ENABLE_RESOURCE_MANAGER = StringUtils.to_bool(os.getenv('PIPELINES_DECLARATIVE_EXECUTOR_ENABLE_RESOURCE_MANAGER', True))
@@ -45,6 +72,11 @@ class EnvVar:
     REQUIRED_MEMORY_PER_SUBPROCESS = int(os.getenv('PIPELINES_DECLARATIVE_EXECUTOR_REQUIRED_MEMORY_PER_SUBPROCESS', 100))
     RESOURCE_MANAGER_QUEUE_TIMEOUT = int(os.getenv('PIPELINES_DECLARATIVE_EXECUTOR_RESOURCE_MANAGER_QUEUE_TIMEOUT', 360))
     RECURSION_LIMIT = int(os.getenv('PIPELINES_DECLARATIVE_EXECUTOR_RECURSION_LIMIT', 1000))
+    ENABLE_STAGE_FOOTPRINT_STORE = StringUtils.to_bool(os.getenv('PIPELINES_DECLARATIVE_EXECUTOR_ENABLE_STAGE_FOOTPRINT_STORE', False))
+    STAGE_FOOTPRINT_STORE_PATH = os.getenv('PIPELINES_DECLARATIVE_EXECUTOR_STAGE_FOOTPRINT_STORE_PATH', os.path.join(os.path.expanduser("~"), ".cache", "pipelines_declarative_executor", "stage_footprints.json"))
+    STAGE_FOOTPRINT_HISTORY_SIZE = max(1, int(os.getenv('PIPELINES_DECLARATIVE_EXECUTOR_STAGE_FOOTPRINT_HISTORY_SIZE', 20)))
+    HOST_SLOTS_DIR = os.getenv('PIPELINES_DECLARATIVE_EXECUTOR_HOST_SLOTS_DIR', None)
+    HOST_MAX_CONCURRENT_STAGES = max(1, int(os.getenv('PIPELINES_DECLARATIVE_EXECUTOR_HOST_MAX_CONCURRENT_STAGES', max(1, multiprocessing.cpu_count()))))
 
     # PROFILING
     ENABLE_PROFILER_STATS = StringUtils.to_bool(os.getenv('PIPELINES_DECLARATIVE_EXECUTOR_ENABLE_PROFILER_STATS', False))
@@ -58,27 +58,43 @@ class LoggingUtils:
     def log_env_vars():
         logged_vars = {
             "GENERAL": [
-                "PDE_VERSION", "GLOBAL_CONFIGS_PREFIX", "PYTHON_MODULE_PATH", "PREPARE_PYTHON_MODULE"
+                "PDE_VERSION", "GLOBAL_CONFIGS_PREFIX", "PYTHON_MODULE_PATH", "PREPARE_PYTHON_MODULE",
+                "INFER_STAGE_DEPENDENCIES"
             ],
             "DEBUG": [
                 "IS_LOCAL_DEBUG", "ENABLE_FULL_EXECUTION_LOG",
                 "ENABLE_MODULE_STDOUT_LOG", "ENABLE_DEBUG_DATA_COLLECTOR",
                 "ENABLE_COLLAPSIBLE_CI_LOGS", "ENABLE_COLLAPSIBLE_SUMMARY_TABLE_ROWS",
+                "SUMMARY_TABLE_MAX_CELL_WIDTH", "SUMMARY_TABLE_MAX_ROWS_PER_LEVEL",
                 "USE_COMPACT_LOGGED_NAMES", "ENABLE_BACKUP_BEFORE_RETRY"
             ],
             "REMOTE REPORT": [
-                "REPORT_SEND_MODE", "REPORT_SEND_INTERVAL", "REPORT_STATUS_POLL_INTERVAL",
-                "REPORT_UPLOAD_USE_COMPRESSION_DEFAULT"
+                "REPORT_SEND_MODE", "REPORT_SEND_INTERVAL", "REPORT_SEND_DEBOUNCE_INTERVAL",
+                "REPORT_SEND_MIN_INTERVAL", "REPORT_STATUS_POLL_INTERVAL",
+                "REPORT_UPLOAD_USE_COMPRESSION_DEFAULT", "REPORT_UPLOAD_USE_DELTA_DEFAULT",
+                "REPORT_UPLOAD_RETRY_BASE_DELAY", "REPORT_UPLOAD_RETRY_MAX_DELAY", "REPORT_UPLOAD_FLUSH_TIMEOUT",
+                "REPORT_FRAGMENT_CACHE_MAX_SIZE_MB", "REPORT_MODULE_REPORT_INLINE_MAX_SIZE_KB"
             ],
             "ENCRYPTION": [
                 "ENCRYPT_OUTPUT_PARAMS", "FAIL_ON_MISSING_SOPS", "STRICT_MODE"
             ],
             "SUBPROCESSES": [
-                "SHELL_PROCESS_TIMEOUT", "SOPS_PROCESS_TIMEOUT"
+                "SHELL_PROCESS_TIMEOUT", "SOPS_PROCESS_TIMEOUT",
+                "PYTHON_MODULE_EXECUTION_MODE", "MODULE_WORKER_MAX_STAGES",
+                "STAGE_OUTPUT_TAIL_LINES"
+            ],
+            "STAGE CACHE": [
+                "ENABLE_STAGE_CACHE", "STAGE_CACHE_DIR", "STAGE_CACHE_MAX_SIZE_MB"
+            ],
+            "EXECUTION STATE": [
+                "ENABLE_EXECUTION_JOURNAL", "EXECUTION_JOURNAL_SNAPSHOT_INTERVAL", "STATE_WRITE_INTERVAL",
+                "STATE_FILE_FORMAT", "ENABLE_SQLITE_STATE_STORE"
             ],
             "RESOURCE MANAGEMENT": [
                 "ENABLE_RESOURCE_MANAGER", "MAX_CONCURRENT_STAGES",
-                "REQUIRED_MEMORY_PER_SUBPROCESS", "RESOURCE_MANAGER_QUEUE_TIMEOUT", "RECURSION_LIMIT"
+                "REQUIRED_MEMORY_PER_SUBPROCESS", "RESOURCE_MANAGER_QUEUE_TIMEOUT", "RECURSION_LIMIT",
+                "ENABLE_STAGE_FOOTPRINT_STORE", "STAGE_FOOTPRINT_STORE_PATH", "STAGE_FOOTPRINT_HISTORY_SIZE",
+                "HOST_SLOTS_DIR", "HOST_MAX_CONCURRENT_STAGES"
             ],
             "PROFILING": [
                 "ENABLE_PROFILER_STATS",
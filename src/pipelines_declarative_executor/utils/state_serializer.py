@@ -0,0 +1,78 @@
+import logging
+
+from pathlib import Path
+
+from pipelines_declarative_executor.model.executor import StateFileFormat
+from pipelines_declarative_executor.utils.common_utils import CommonUtils
+from pipelines_declarative_executor.utils.env_var_utils import EnvVar
+from pipelines_declarative_executor.utils.string_utils import StringUtils
+
+try:
+    import msgpack
+except ImportError:  # optional dependency, only needed for MSGPACK state files
+    msgpack = None
+
+
+class StateSerializer:
+    """Reads/writes execution state files (execution, pipeline, vars) in configured STATE_FILE_FORMAT.
+    Files are always looked up in all formats, so state written with other format can still be retried"""
+
+    FILE_EXTENSIONS = {
+        StateFileFormat.JSON: ".json",
+        StateFileFormat.MSGPACK: ".msgpack",
+    }
+
+    _fallback_logged = False
+
+    @staticmethod
+    def get_format() -> StateFileFormat:
+        if EnvVar.STATE_FILE_FORMAT == StateFileFormat.MSGPACK and msgpack is None:
+            if not StateSerializer._fallback_logged:
+                logging.warning("STATE_FILE_FORMAT is MSGPACK, but 'msgpack' package is not installed - falling back to JSON")
+                StateSerializer._fallback_logged = True
+            return StateFileFormat.JSON
+        return EnvVar.STATE_FILE_FORMAT
+
+    @staticmethod
+    def get_path(state_dir: Path, file_name: str, state_format: StateFileFormat = None) -> Path:
+        return state_dir.joinpath(Path(file_name).stem + StateSerializer.FILE_EXTENSIONS[state_format or StateSerializer.get_format()])
+
+    @staticmethod
+    def write(obj, state_dir: Path, file_name: str):
+        state_format = StateSerializer.get_format()
+        target_path = StateSerializer.get_path(state_dir, file_name, state_format)
+        if state_format == StateFileFormat.MSGPACK:
+            CommonUtils.write_file_atomically(msgpack.packb(obj, default=StringUtils.json_encode), target_path)
+        else:
+            CommonUtils.write_json(obj, target_path)
+        for other_format in StateSerializer.FILE_EXTENSIONS:
+            if other_format != state_format:  # so stale file in other format won't be read instead
+                StateSerializer.get_path(state_dir, file_name, other_format).unlink(missing_ok=True)
+
+    @staticmethod
+    def remove(state_dir: Path, file_name: str):
+        for state_format in StateSerializer.FILE_EXTENSIONS:
+            StateSerializer.get_path(state_dir, file_name, state_format).unlink(missing_ok=True)
+
+    @staticmethod
+    def exists(state_dir: Path, file_name: str) -> bool:
+        return StateSerializer._find(state_dir, file_name) is not None
+
+    @staticmethod
+    def load(state_dir: Path, file_name: str) -> dict | None:
+        """Returns None if there is no such state file"""
+        if (found := StateSerializer._find(state_dir, file_name)) is None:
+            return None
+        state_format, file_path = found
+        if state_format == StateFileFormat.MSGPACK:
+            if msgpack is None:
+                raise Exception(f"Can't read '{file_path}' - 'msgpack' package is not installed")
+            return msgpack.unpackb(file_path.read_bytes(), strict_map_key=False)
+        return CommonUtils.load_json_file(file_path)
+
+    @staticmethod
+    def _find(state_dir: Path, file_name: str) -> tuple[StateFileFormat, Path] | None:
+        for state_format in StateSerializer.FILE_EXTENSIONS:
+            if (file_path := StateSerializer.get_path(state_dir, file_name, state_format)).exists():
+                return state_format, file_path
+        return None
@@ -70,6 +70,25 @@ class StringUtils:
         multipliers = {'s': 1, 'm': 60, 'h': 3600}
         return value * multipliers[unit]
 
+    @staticmethod
+    def memory_str_to_megabytes(memory_str) -> float:
+        memory_str = str(memory_str).strip()
+        match = re.match(r'^(\d+(?:\.\d+)?)\s*(Ki|Mi|Gi|K|M|G)?$', memory_str)
+        if not match:
+            raise ValueError(f"Invalid memory format: {memory_str}")
+        value = float(match.group(1))
+        unit = match.group(2) if match.group(2) else 'Mi'
+        multipliers = {'Ki': 1 / 1024, 'Mi': 1, 'Gi': 1024, 'K': 1e3 / 1024 ** 2, 'M': 1e6 / 1024 ** 2, 'G': 1e9 / 1024 ** 2}
+        return value * multipliers[unit]
+
+    @staticmethod
+    def cpu_str_to_cores(cpu_str) -> float:
+        cpu_str = str(cpu_str).strip()
+        match = re.match(r'^(\d+(?:\.\d+)?)\s*(m)?$', cpu_str)
+        if not match or float(match.group(1)) <= 0:
+            raise ValueError(f"Invalid cpu format: {cpu_str}")
+        return float(match.group(1)) / (1000 if match.group(2) else 1)
+
     UNSAFE_FILENAME_CHARS_PATTERN = re.compile(r'[^\w\-.]')
     @staticmethod
     def get_safe_filename(s: str) -> str:
@@ -77,7 +96,9 @@ class StringUtils:
 
     @staticmethod
     def json_encode(value):
-        if dataclasses.is_dataclass(value):
+        if hasattr(value, "to_dict"):
+            return value.to_dict()
+        elif dataclasses.is_dataclass(value):
             return dataclasses.asdict(value)
         elif isinstance(value, datetime):
             return value.isoformat()
@@ -0,0 +1,70 @@
+import os, signal, subprocess, sys, tempfile, unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from pipelines_declarative_executor.executor.host_slot_pool import HostSlotPool, fcntl
+from pipelines_declarative_executor.utils.env_var_utils import EnvVar
+
+# other executor process on the same host - holds slots until its stdin is closed (or it is killed)
+HOLDER_SCRIPT = """
+import sys
+from pipelines_declarative_executor.executor.host_slot_pool import HostSlotPool
+slots = HostSlotPool.try_acquire(int(sys.argv[1]))
+print("acquired" if slots else "not acquired", flush=True)
+sys.stdin.read()
+"""
+
+
+@unittest.skipUnless(fcntl, "host-wide slot pool needs fcntl")
+@patch.object(EnvVar, "HOST_MAX_CONCURRENT_STAGES", 3)
+class TestHostSlotPool(unittest.TestCase):
+
+    def setUp(self):
+        self.slots_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.slots_dir.cleanup)
+        slots_dir_patch = patch.object(EnvVar, "HOST_SLOTS_DIR", self.slots_dir.name)
+        slots_dir_patch.start()
+        self.addCleanup(slots_dir_patch.stop)
+
+    def _start_holder(self, count: int) -> subprocess.Popen:
+        env = {**os.environ, "PIPELINES_DECLARATIVE_EXECUTOR_HOST_SLOTS_DIR": self.slots_dir.name,
+               "PIPELINES_DECLARATIVE_EXECUTOR_HOST_MAX_CONCURRENT_STAGES": "3"}
+        holder = subprocess.Popen([sys.executable, "-c", HOLDER_SCRIPT, str(count)], env=env, text=True,
+                                  stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        self.addCleanup(holder.stdout.close)
+        self.addCleanup(holder.kill)
+        self.assertEqual("acquired", holder.stdout.readline().strip())
+        return holder
+
+    def test_cap_is_enforced_across_executor_processes(self):
+        holder = self._start_holder(2)
+        self.assertIsNone(HostSlotPool.try_acquire(2))
+        slots = HostSlotPool.try_acquire(1)
+        self.assertEqual(1, len(slots))
+        self.assertIsNone(HostSlotPool.try_acquire(1))
+        self.assertEqual(3, len(list(Path(self.slots_dir.name).glob(f"{HostSlotPool.SLOT_FILE_PREFIX}*"))))
+
+        # holder exits without releasing its slots explicitly
+        holder.stdin.close()
+        holder.wait(timeout=10)
+        other_slots = HostSlotPool.try_acquire(2)
+        self.assertEqual(2, len(other_slots))
+        HostSlotPool.release(slots + other_slots)
+
+    def test_slots_of_crashed_executor_are_freed(self):
+        holder = self._start_holder(3)
+        self.assertIsNone(HostSlotPool.try_acquire(1))
+        holder.send_signal(signal.SIGKILL)
+        holder.wait(timeout=10)
+        # slot files are left behind, but their locks are gone
+        slots = HostSlotPool.try_acquire(3)
+        self.assertEqual(3, len(slots))
+        HostSlotPool.release(slots)
+
+    def test_released_slots_can_be_acquired_again(self):
+        slots = HostSlotPool.try_acquire(5)  # limited to HOST_MAX_CONCURRENT_STAGES
+        self.assertEqual(3, len(slots))
+        self.assertIsNone(HostSlotPool.try_acquire(1))
+        HostSlotPool.release(slots[:1])
+        self.assertEqual(1, len(other_slots := HostSlotPool.try_acquire(1)))
+        HostSlotPool.release(slots[1:] + other_slots)
@@ -0,0 +1,67 @@
+import asyncio, os, tempfile, unittest
+from pathlib import Path
+
+from pipelines_declarative_executor.executor.module_fork_server import ModuleForkServer
+
+MODULE_SCRIPT = """
+import sys, time
+
+if __name__ == "__main__":
+    time.sleep(float(sys.argv[1]))
+    print("slept", sys.argv[1])
+    sys.exit(int(sys.argv[2]))
+"""
+
+
+@unittest.skipUnless(hasattr(os, "fork"), "fork server needs os.fork")
+class TestModuleForkServer(unittest.TestCase):
+
+    def setUp(self):
+        work_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(work_dir.cleanup)
+        self.work_dir = Path(work_dir.name)
+        self.module_path = self.work_dir.joinpath("module.py")
+        self.module_path.write_text(MODULE_SCRIPT)
+
+    def _run(self, scenario):
+        async def _with_server():
+            server = await ModuleForkServer._start(self.module_path.as_posix())
+            try:
+                return await scenario(server)
+            finally:
+                await server.stop()
+        return asyncio.run(_with_server())
+
+    def test_child_exit_is_reported_without_polling(self):
+        async def _scenario(server):
+            process = await server.spawn(["0", "3"], self.work_dir.joinpath("stdout.log"), self.work_dir.joinpath("stderr.log"))
+            return_code = await asyncio.wait_for(process.wait(), timeout=5)
+            # idle zygote is blocked in select until request comes or child exits
+            status_path = Path(f"/proc/{server.process.pid}/status")
+            if status_path.exists():
+                switches = self._context_switches(status_path)
+                await asyncio.sleep(0.5)
+                self.assertLessEqual(self._context_switches(status_path) - switches, 2)
+            return return_code
+
+        self.assertEqual(3, self._run(_scenario))
+        self.assertEqual("slept 0\n", self.work_dir.joinpath("stdout.log").read_text())
+
+    def test_child_of_cancelled_spawn_is_killed(self):
+        async def _scenario(server):
+            spawn_task = asyncio.create_task(server.spawn(["30", "0"], self.work_dir.joinpath("stdout.log"), self.work_dir.joinpath("stderr.log")))
+            await asyncio.sleep(0)  # request is sent, stage waits for pid
+            return_code = next(iter(server._return_codes.values()))
+            spawn_task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await spawn_task
+            return await asyncio.wait_for(asyncio.shield(return_code), timeout=5)
+
+        self.assertEqual(-9, self._run(_scenario))
+
+    @staticmethod
+    def _context_switches(status_path: Path) -> int:
+        for line in status_path.read_text().splitlines():
+            if line.startswith("voluntary_ctxt_switches"):
+                return int(line.split()[1])
+        return 0
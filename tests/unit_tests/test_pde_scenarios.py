@@ -1,5 +1,6 @@
-import os, re, json, yaml, logging, unittest, time
+import os, re, json, yaml, shutil, sqlite3, logging, unittest, time, importlib.util
 from pathlib import Path
+from datetime import datetime
 
 from common import ExecutorTestCase
 with_exec_dir = ExecutorTestCase.with_exec_dir
@@ -39,6 +40,32 @@ class TestPipelinesDeclarativeExecutor(ExecutorTestCase):
             self.assertTrue(is_encrypted)
             self.assertEqual('19', yaml_dict['params']['CALC_RESULT_SECURE'])
 
+    @with_exec_dir
+    def test_run_calculator_pipeline_in_worker_pool(self):
+        pipeline_data = "pipeline_configs/calc/config_calculator.yaml;pipeline_configs/calc/pipeline_calculator.yaml;"
+        env = os.environ.copy()
+        env["PIPELINES_DECLARATIVE_EXECUTOR_PYTHON_MODULE_EXECUTION_MODE"] = "WORKER_POOL"
+        output = self._run_and_log([*self.PDE_CLI, "run",
+                                    f"--pipeline_data={pipeline_data}",
+                                    f"--pipeline_dir={self.exec_dir}"], env=env)
+        self.assertEqual(output.returncode, 0)
+        with open(f'{self.exec_dir}/pipeline_output/output_params.yaml', 'r', encoding='utf-8') as file:
+            result = yaml.safe_load(file)
+            self.assertEqual('19',  result['params']['CALC_RESULT'])
+
+    @with_exec_dir
+    def test_run_calculator_pipeline_in_fork_server(self):
+        pipeline_data = "pipeline_configs/calc/config_calculator.yaml;pipeline_configs/calc/pipeline_calculator.yaml;"
+        env = os.environ.copy()
+        env["PIPELINES_DECLARATIVE_EXECUTOR_PYTHON_MODULE_EXECUTION_MODE"] = "FORK_SERVER"
+        output = self._run_and_log([*self.PDE_CLI, "run",
+                                    f"--pipeline_data={pipeline_data}",
+                                    f"--pipeline_dir={self.exec_dir}"], env=env)
+        self.assertEqual(output.returncode, 0)
+        with open(f'{self.exec_dir}/pipeline_output/output_params.yaml', 'r', encoding='utf-8') as file:
+            result = yaml.safe_load(file)
+            self.assertEqual('19',  result['params']['CALC_RESULT'])
+
     @with_exec_dir
     def test_run_file_ops_pipeline(self):
         pipeline_data = "pipeline_configs/files/pipeline_files.yaml"
@@ -160,6 +187,168 @@ class TestPipelinesDeclarativeExecutor(ExecutorTestCase):
             result = yaml.safe_load(file)
             self.assertEqual('42',  result['params']['FINAL_RESULT'])
 
+    @with_exec_dir
+    def test_run_shell_output_pipeline_with_stage_cache(self):
+        pipeline_data = "pipeline_configs/shell/pipeline_shell_output_linux.yaml"
+        env = os.environ.copy()
+        env["PIPELINES_DECLARATIVE_EXECUTOR_ENABLE_STAGE_CACHE"] = "true"
+        env["PIPELINES_DECLARATIVE_EXECUTOR_STAGE_CACHE_DIR"] = f"{self.exec_dir}/stage_cache"
+        shutil.rmtree(self.exec_dir, ignore_errors=True)
+        for pipeline_dir, expected_cache_status in [(f"{self.exec_dir}/first", "MISS"), (f"{self.exec_dir}/second", "HIT")]:
+            output = self._run_and_log([*self.PDE_CLI, "run",
+                                        f"--pipeline_data={pipeline_data}",
+                                        f"--pipeline_dir={pipeline_dir}"], env=env)
+            self.assertEqual(output.returncode, 0)
+            with open(f'{pipeline_dir}/pipeline_state/pipeline_report.json', 'r', encoding='utf-8') as report_json_file:
+                report = json.load(report_json_file)
+            self.assertEqual([expected_cache_status] * 2, [stage["cache"] for stage in report["stages"]])
+            with open(f'{pipeline_dir}/pipeline_output/output_params.yaml', 'r', encoding='utf-8') as file:
+                result = yaml.safe_load(file)
+                self.assertEqual('42',  result['params']['FINAL_RESULT'])
+
+    @with_exec_dir
+    def test_run_shell_output_pipeline_with_execution_journal(self):
+        pipeline_data = "pipeline_configs/shell/pipeline_shell_output_linux.yaml"
+        env = os.environ.copy()
+        env["PIPELINES_DECLARATIVE_EXECUTOR_EXECUTION_JOURNAL_SNAPSHOT_INTERVAL"] = "3"
+        output = self._run_and_log([*self.PDE_CLI, "run",
+                                    f"--pipeline_data={pipeline_data}",
+                                    f"--pipeline_dir={self.exec_dir}"], env=env)
+        self.assertEqual(output.returncode, 0)
+        self.assertFalse(os.path.exists(f'{self.exec_dir}/pipeline_state/journal.jsonl'))
+        with open(f'{self.exec_dir}/pipeline_state/vars.json', 'r', encoding='utf-8') as vars_json_file:
+            self.assertEqual({'NUMBER': 21, 'RESULT': 42}, json.load(vars_json_file)['vars_stage_output'])
+        with open(f'{self.exec_dir}/pipeline_output/output_params.yaml', 'r', encoding='utf-8') as file:
+            result = yaml.safe_load(file)
+            self.assertEqual('42',  result['params']['FINAL_RESULT'])
+
+    @with_exec_dir
+    def test_run_shell_matrix_pipeline_with_background_state_writer(self):
+        pipeline_data = "pipeline_configs/shell/pipeline_shell_matrix_linux.yaml"
+        env = os.environ.copy()
+        env["PIPELINES_DECLARATIVE_EXECUTOR_ENABLE_EXECUTION_JOURNAL"] = "false"
+        env["PIPELINES_DECLARATIVE_EXECUTOR_STATE_WRITE_INTERVAL"] = "50"
+        output = self._run_and_log([*self.PDE_CLI, "run",
+                                    f"--pipeline_data={pipeline_data}",
+                                    f"--pipeline_dir={self.exec_dir}"], env=env)
+        self.assertEqual(output.returncode, 0)
+        self.assertEqual(["execution.json", "pipeline.json", "pipeline_report.json", "vars.json"],
+                         sorted(os.listdir(f'{self.exec_dir}/pipeline_state')))
+        with open(f'{self.exec_dir}/pipeline_state/pipeline_report.json', 'r', encoding='utf-8') as report_json_file:
+            report = json.load(report_json_file)
+        self.assertEqual("SUCCESS", report["status"])
+        self.assertTrue(all(stage["status"] in ["SUCCESS", "SKIPPED"] for stage in report["stages"]))
+
+    @with_exec_dir
+    def test_run_shell_matrix_pipeline_with_sqlite_state_store(self):
+        pipeline_data = "pipeline_configs/shell/pipeline_shell_matrix_linux.yaml"
+        env = os.environ.copy()
+        env["PIPELINES_DECLARATIVE_EXECUTOR_ENABLE_SQLITE_STATE_STORE"] = "true"
+        output = self._run_and_log([*self.PDE_CLI, "run",
+                                    f"--pipeline_data={pipeline_data}",
+                                    f"--pipeline_dir={self.exec_dir}"], env=env)
+        self.assertEqual(output.returncode, 0)
+        self.assertEqual(["pipeline_report.json", "state.db"], sorted(os.listdir(f'{self.exec_dir}/pipeline_state')))
+        with open(f'{self.exec_dir}/pipeline_state/pipeline_report.json', 'r', encoding='utf-8') as report_json_file:
+            report = json.load(report_json_file)
+        with sqlite3.connect(f'{self.exec_dir}/pipeline_state/state.db') as connection:
+            self.assertEqual("SUCCESS", connection.execute("SELECT status FROM executions WHERE execution = '.'").fetchone()[0])
+            stage_statuses = dict(connection.execute("SELECT uuid, status FROM stages WHERE execution = '.' AND parent_uuid IS NULL"))
+        self.assertEqual({stage["id"]: stage["status"] for stage in report["stages"]}, stage_statuses)
+
+    @unittest.skipUnless(importlib.util.find_spec("msgpack"), "'msgpack' package is not installed")
+    @with_exec_dir
+    def test_run_failure_into_retry_success_with_msgpack_state_files(self):
+        pipeline_data = "pipeline_configs/shell/pipeline_shell_retry_linux.yaml"
+        env = os.environ.copy()
+        env["PIPELINES_DECLARATIVE_EXECUTOR_STATE_FILE_FORMAT"] = "MSGPACK"
+        shutil.rmtree(self.exec_dir, ignore_errors=True)
+        output_direct = self._run_and_log([*self.PDE_CLI, "run",
+                                           f"--pipeline_data={pipeline_data}",
+                                           f"--pipeline_dir={self.exec_dir}"], env=env)
+        self.assertEqual(output_direct.returncode, 1)
+        self.assertEqual(["execution.msgpack", "pipeline.msgpack", "pipeline_report.json", "vars.msgpack"],
+                         sorted(os.listdir(f'{self.exec_dir}/pipeline_state')))
+
+        output_retry = self._run_and_log([*self.PDE_CLI, "retry",
+                                          "--retry_vars=DIVISOR=2",
+                                          f"--pipeline_dir={self.exec_dir}"], env=env)
+        self.assertEqual(output_retry.returncode, 0)
+        self.assertEqual(["execution.msgpack", "pipeline.msgpack", "pipeline_report.json", "vars.msgpack"],
+                         sorted(os.listdir(f'{self.exec_dir}/pipeline_state')))
+        with open(f'{self.exec_dir}/pipeline_output/output_params.yaml', 'r', encoding='utf-8') as file:
+            result = yaml.safe_load(file)
+            self.assertEqual('42',  result['params']['FINAL_RESULT'])
+
+    @with_exec_dir
+    def test_run_shell_needs_pipeline(self):
+        pipeline_data = "pipeline_configs/shell/pipeline_shell_needs_linux.yaml"
+        env = os.environ.copy()
+        env["PIPELINES_DECLARATIVE_EXECUTOR_MAX_CONCURRENT_STAGES"] = "4"
+        output = self._run_and_log([*self.PDE_CLI, "run",
+                                    f"--pipeline_data={pipeline_data}",
+                                    f"--pipeline_dir={self.exec_dir}"], env=env)
+        self.assertEqual(output.returncode, 1)
+        with open(f'{self.exec_dir}/pipeline_state/pipeline_report.json', 'r', encoding='utf-8') as report_json_file:
+            report = json.load(report_json_file)
+        stages = {stage["name"]: stage for stage in report["stages"]}
+        self.assertEqual("FAILED", report["status"])
+        self.assertEqual("SKIPPED", stages["After Broken"]["status"])
+        self.assertEqual("SUCCESS", stages["Join"]["status"])
+        self.assertEqual([stages["Left"]["id"], stages["Right"]["id"]], stages["Join"]["needs"])
+        # independent branches run concurrently, dependent stage waits for both
+        self.assertLess(stages["Right"]["startedAt"], stages["Left"]["finishedAt"])
+        self.assertGreaterEqual(stages["Join"]["startedAt"], max(stages["Left"]["finishedAt"], stages["Right"]["finishedAt"]))
+        with open(f'{self.exec_dir}/pipeline_output/output_params.yaml', 'r', encoding='utf-8') as file:
+            result = yaml.safe_load(file)
+            self.assertEqual('42',  result['params']['FINAL_RESULT'])
+
+    @with_exec_dir
+    def test_run_shell_parallel_fail_fast_pipeline(self):
+        pipeline_data = "pipeline_configs/shell/pipeline_shell_parallel_fail_fast_linux.yaml"
+        env = os.environ.copy()
+        env["PIPELINES_DECLARATIVE_EXECUTOR_MAX_CONCURRENT_STAGES"] = "4"
+        output = self._run_and_log([*self.PDE_CLI, "run",
+                                    f"--pipeline_data={pipeline_data}",
+                                    f"--pipeline_dir={self.exec_dir}"], env=env)
+        self.assertEqual(output.returncode, 1)
+        with open(f'{self.exec_dir}/pipeline_state/pipeline_report.json', 'r', encoding='utf-8') as report_json_file:
+            report = json.load(report_json_file)
+        limited_block, fail_fast_block = report["stages"]
+        limited = {stage["name"]: stage for stage in limited_block["parallelStages"]}
+        self.assertEqual("SUCCESS", limited_block["status"])
+        # third stage waits for one of the first two
+        self.assertGreaterEqual(limited["Limited 3"]["startedAt"], min(limited["Limited 1"]["finishedAt"], limited["Limited 2"]["finishedAt"]))
+        fail_fast = {stage["name"]: stage for stage in fail_fast_block["parallelStages"]}
+        self.assertEqual("FAILED", fail_fast_block["status"])
+        self.assertEqual("FAILED", fail_fast["Broken"]["status"])
+        self.assertEqual("CANCELLED", fail_fast["Slow"]["status"])
+        started_at = datetime.fromisoformat(fail_fast_block["startedAt"])
+        self.assertLess((datetime.fromisoformat(fail_fast_block["finishedAt"]) - started_at).total_seconds(), 15)
+
+    @with_exec_dir
+    def test_run_shell_matrix_pipeline(self):
+        pipeline_data = "pipeline_configs/shell/pipeline_shell_matrix_linux.yaml"
+        env = os.environ.copy()
+        env["PIPELINES_DECLARATIVE_EXECUTOR_MAX_CONCURRENT_STAGES"] = "4"
+        output = self._run_and_log([*self.PDE_CLI, "run",
+                                    f"--pipeline_data={pipeline_data}",
+                                    f"--pipeline_dir={self.exec_dir}"], env=env)
+        self.assertEqual(output.returncode, 0)
+        with open(f'{self.exec_dir}/pipeline_state/pipeline_report.json', 'r', encoding='utf-8') as report_json_file:
+            report = json.load(report_json_file)
+        _, check_block, deploy_block = report["stages"]
+        self.assertEqual(["CLUSTER"], check_block["matrix"])
+        self.assertEqual(["Check east", "Check west", "Check north"], [stage["name"] for stage in check_block["parallelStages"]])
+        # max_parallel: 2 - third item waits for one of the first two
+        first, second, third = check_block["parallelStages"]
+        self.assertGreaterEqual(third["startedAt"], min(first["finishedAt"], second["finishedAt"]))
+        self.assertEqual(["Deploy [dev, api]", "Deploy [dev, ui]", "Deploy [prod, api]", "Deploy [prod, ui]"],
+                         [stage["name"] for stage in deploy_block["parallelStages"]])
+        with open(f'{self.exec_dir}/pipeline_output/output_params.yaml', 'r', encoding='utf-8') as file:
+            result = yaml.safe_load(file)
+            self.assertEqual('checked-west', result['params']['WEST_RESULT'])
+
     @with_exec_dir
     def test_run_conditions_pipeline(self):
         pipeline_data = "pipeline_configs/conditions/pipeline_conditions.yaml"
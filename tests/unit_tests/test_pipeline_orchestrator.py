@@ -1,11 +1,16 @@
-import os
+import os, json, dataclasses
 import unittest
+from datetime import datetime
+from pathlib import Path
 from unittest.mock import patch, MagicMock
 
-from pipelines_declarative_executor.model.stage import StageType, ExecutionStatus
+from pipelines_declarative_executor.model.stage import Stage, StageType, ExecutionStatus
 from pipelines_declarative_executor.orchestrator.pipeline_orchestrator import PipelineOrchestrator
+from pipelines_declarative_executor.orchestrator.stage_dependency_graph import StageDependencyGraph
 from pipelines_declarative_executor.utils.auth_utils import AuthConfig, AuthType
+from pipelines_declarative_executor.utils.common_utils import CommonUtils
 from pipelines_declarative_executor.utils.http_utils import HttpUtils
+from pipelines_declarative_executor.utils.string_utils import StringUtils
 
 
 class TestPipelineOrchestrator(unittest.TestCase):
@@ -40,6 +45,52 @@ class TestPipelineOrchestrator(unittest.TestCase):
         self.assertEqual(len(pipeline_execution.pipeline.stages), 5)
         self.assertEqual(len(pipeline_execution.pipeline.stages[4].nested_parallel_stages), 4)
 
+    def test_inferred_stage_dependencies(self):
+        pipeline_execution = PipelineOrchestrator.prepare_pipeline_execution("pipeline_configs/syntax/inferred_needs.yaml", infer_stage_dependencies=True)
+        stages = pipeline_execution.pipeline.stages
+        needs_by_name = {stage.name: [s.name for s in stages if s.uuid in stage.needs] for stage in stages}
+        self.assertEqual([], needs_by_name["Produce A"])
+        self.assertEqual([], needs_by_name["Produce B"])
+        self.assertEqual(["Produce A"], needs_by_name["Use A"])
+        self.assertEqual(["Produce A", "Use A"], needs_by_name["Overwrite A"])
+        self.assertEqual(["Produce B"], needs_by_name["Use B Files"])
+        self.assertEqual(["Produce B"], needs_by_name["Check B"])
+        self.assertEqual([s.name for s in stages[:6]], needs_by_name["On Failure"])
+        self.assertEqual([], needs_by_name["Independent"])
+        self.assertEqual([], needs_by_name["Produce Host"])
+        # URL's value references HOST, which is written by stage
+        self.assertEqual(["Produce Host"], needs_by_name["Use URL"])
+
+    def test_inferred_stage_dependencies_of_unresolvable_vars(self):
+        stages = [Stage(name="Write", output={"params": {"X": "params.X"}}), Stage(name="Other", output={"params": {"Y": "params.Y"}}),
+                  Stage(name="Read", command="echo ${V0}")]
+        deep_vars = {f"V{i}": f"${{V{i + 1}}}" for i in range(StringUtils.VAR_MAX_NESTING_LEVEL + 1)}
+        for stage in stages:
+            stage.uuid = stage.name
+        self.assertEqual([], StageDependencyGraph.infer_needs(stages, {"V0": "plain"})["Read"])
+        self.assertEqual(["Write", "Other"], StageDependencyGraph.infer_needs(stages, deep_vars)["Read"])
+
+    def test_stage_resources_syntax(self):
+        pipeline_execution = PipelineOrchestrator.prepare_pipeline_execution("pipeline_configs/syntax/stage_resources.yaml")
+        stages = pipeline_execution.pipeline.stages
+        self.assertIsNone(stages[0].resources)
+        self.assertEqual({"cpu": 2.0, "memory": 1024.0}, stages[1].resources)
+        self.assertEqual({"cpu": 0.5, "memory": 64.0}, stages[2].resources)
+
+    def test_state_serialization_round_trip(self):
+        pipeline_execution = PipelineOrchestrator.prepare_pipeline_execution("pipeline_configs/syntax/stages_inside_stages.yaml")
+        pipeline_execution.pipeline.stages[0].start_time = datetime.now()
+        pipeline_execution.pipeline.stages[0].exec_dir = Path("stage_dir")
+        # same format as before 'to_dict' and slotted models - public dataclass fields, runtime dicts saved as empty dicts
+        vars_dict = {key: value for key, value in dataclasses.asdict(pipeline_execution.vars).items() if not key.startswith("_")}
+        self.assertEqual(CommonUtils.dump_json(vars_dict), CommonUtils.dump_json(pipeline_execution.vars.to_dict()))
+        stage_dict = pipeline_execution.pipeline.stages[0].to_dict()
+        self.assertEqual([f.name for f in dataclasses.fields(Stage) if f.init] + ["evaluated_params", "custom_data"], list(stage_dict))
+        self.assertEqual({}, stage_dict["evaluated_params"])
+        for model in [pipeline_execution.pipeline, pipeline_execution.vars]:
+            state_json = CommonUtils.dump_json(model.to_dict())
+            self.assertEqual(state_json, CommonUtils.dump_json(type(model).from_dict(json.loads(state_json))))
+
     def test_global_config_vars_parsed_correctly(self):
         with open('pipeline_configs/calc/config_calculator.yaml', 'r') as f:
             global_config_content = f.read()
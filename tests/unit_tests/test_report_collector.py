@@ -1,10 +1,16 @@
-import json, unittest
+import hashlib, json, logging, tempfile, unittest
 
 from datetime import datetime
-from pipelines_declarative_executor.model.stage import ExecutionStatus
+from pathlib import Path
+from unittest.mock import patch
+from pipelines_declarative_executor.model.stage import ExecutionStatus, StageType
 from pipelines_declarative_executor.orchestrator.pipeline_orchestrator import PipelineOrchestrator
 from pipelines_declarative_executor.report.report_collector import ReportCollector
+from pipelines_declarative_executor.report.report_fragment_cache import ReportFragmentCache
+from pipelines_declarative_executor.report.report_summary_table import ReportSummaryTable
+from pipelines_declarative_executor.utils.color_utils import ColorUtils
 from pipelines_declarative_executor.utils.common_utils import CommonUtils
+from pipelines_declarative_executor.utils.env_var_utils import EnvVar
 
 
 class TestReportCollector(unittest.TestCase):
@@ -25,6 +31,141 @@ class TestReportCollector(unittest.TestCase):
             self.assertEqual(expected_report["kind"], achieved_report["kind"])
             self.assertEqual(expected_report["apiVersion"], achieved_report["apiVersion"])
 
+    def test_ui_report_reuses_fragments_of_unchanged_stages(self):
+        pipeline_execution = PipelineOrchestrator.prepare_pipeline_execution("pipeline_configs/syntax/stages_inside_stages.yaml")
+        ReportCollector.reset_stages_cache(pipeline_execution)
+        parallel_block = pipeline_execution.pipeline.stages[-1]
+        nested_stage = parallel_block.nested_parallel_stages[0]
+        report = ReportCollector.prepare_ui_view(pipeline_execution)
+
+        parallel_block.status = ExecutionStatus.IN_PROGRESS
+        nested_stage.status = ExecutionStatus.SUCCESS
+        ReportCollector.mark_stage_changed(pipeline_execution, parallel_block)
+        ReportCollector.mark_stage_changed(pipeline_execution, nested_stage)
+        updated_report = ReportCollector.prepare_ui_view(pipeline_execution)
+
+        updated_block_data = updated_report["stages"][-1]
+        self.assertEqual(ExecutionStatus.IN_PROGRESS, updated_block_data["status"])
+        self.assertEqual(ExecutionStatus.SUCCESS, updated_block_data[ReportCollector.PARALLEL_STAGES][0]["status"])
+        for stage_data, updated_stage_data in zip(report["stages"][:-1], updated_report["stages"][:-1]):
+            self.assertIs(stage_data, updated_stage_data)
+        for stage_data, updated_stage_data in zip(report["stages"][-1][ReportCollector.PARALLEL_STAGES][1:], updated_block_data[ReportCollector.PARALLEL_STAGES][1:]):
+            self.assertIs(stage_data, updated_stage_data)
+
+    def test_ui_report_includes_nested_execution_from_memory(self):
+        pipeline_execution = PipelineOrchestrator.prepare_pipeline_execution("pipeline_configs/retry/pipeline_retry_1.yaml")
+        nested_execution = PipelineOrchestrator.prepare_pipeline_execution("pipeline_configs/retry/pipeline_retry_2.yaml")
+        nested_stage = next(stage for stage in pipeline_execution.pipeline.stages if stage.type == StageType.ATLAS_PIPELINE_TRIGGER)
+        nested_stage.status = ExecutionStatus.IN_PROGRESS
+        ReportCollector.publish_nested_execution(pipeline_execution, nested_stage, nested_execution)
+
+        nested_execution.pipeline.stages[0].status = ExecutionStatus.SUCCESS
+        ReportCollector.mark_stage_changed(nested_execution, nested_execution.pipeline.stages[0])
+        nested_stage_data = next(stage_data for stage_data in ReportCollector.prepare_ui_view(pipeline_execution)["stages"] if stage_data["id"] == nested_stage.uuid)
+        self.assertEqual(nested_execution.pipeline.name, nested_stage_data[ReportCollector.NESTED_PIPELINE]["name"])
+        self.assertEqual(ExecutionStatus.SUCCESS, nested_stage_data[ReportCollector.NESTED_PIPELINE]["stages"][0]["status"])
+
+        ReportCollector.publish_nested_execution(pipeline_execution, nested_stage, nested_execution, is_finished=True)
+        self.assertIsNone(nested_execution.report_fragments)
+
+    def test_nested_report_is_released_once_cached_in_fragment(self):
+        pipeline_execution = PipelineOrchestrator.prepare_pipeline_execution("pipeline_configs/retry/pipeline_retry_1.yaml")
+        nested_execution = PipelineOrchestrator.prepare_pipeline_execution("pipeline_configs/retry/pipeline_retry_2.yaml")
+        nested_stage = next(stage for stage in pipeline_execution.pipeline.stages if stage.type == StageType.ATLAS_PIPELINE_TRIGGER)
+        nested_stage.status = ExecutionStatus.IN_PROGRESS
+        ReportCollector.publish_nested_execution(pipeline_execution, nested_stage, nested_execution)
+        ReportCollector.prepare_ui_view(pipeline_execution)
+        self.assertIs(nested_execution, pipeline_execution.nested_reports[nested_stage.uuid])
+
+        ReportCollector.publish_nested_execution(pipeline_execution, nested_stage, nested_execution, is_finished=True)
+        nested_stage.status = ExecutionStatus.SUCCESS
+        ReportCollector.mark_stage_changed(pipeline_execution, nested_stage)
+        nested_stage_data = next(stage_data for stage_data in ReportCollector.prepare_ui_view(pipeline_execution)["stages"] if stage_data["id"] == nested_stage.uuid)
+        self.assertEqual({}, pipeline_execution.nested_reports)
+        self.assertEqual(nested_execution.pipeline.name, nested_stage_data[ReportCollector.NESTED_PIPELINE]["name"])
+        self.assertIs(nested_stage_data, pipeline_execution.report_fragments.get(nested_stage.uuid))
+
+    def test_nested_reports_are_released_when_parent_execution_finishes(self):
+        pipeline_execution = PipelineOrchestrator.prepare_pipeline_execution("pipeline_configs/retry/pipeline_retry_1.yaml")
+        nested_execution = PipelineOrchestrator.prepare_pipeline_execution("pipeline_configs/retry/pipeline_retry_2.yaml")
+        nested_stage = next(stage for stage in pipeline_execution.pipeline.stages if stage.type == StageType.ATLAS_PIPELINE_TRIGGER)
+        ReportCollector.publish_nested_execution(pipeline_execution, nested_stage, nested_execution, is_finished=True)
+        self.assertIn(nested_stage.uuid, pipeline_execution.nested_reports)
+
+        ReportCollector.release_nested_reports(pipeline_execution)
+        self.assertEqual({}, pipeline_execution.nested_reports)
+
+    def test_ui_report_fragments_are_cached_per_execution(self):
+        first_execution = PipelineOrchestrator.prepare_pipeline_execution("pipeline_configs/syntax/stages_inside_stages.yaml")
+        second_execution = PipelineOrchestrator.prepare_pipeline_execution("pipeline_configs/syntax/stages_inside_stages.yaml")
+        ReportCollector.prepare_ui_view(first_execution)
+        ReportCollector.prepare_ui_view(second_execution)
+        cached_fragments_count = len(second_execution.report_fragments)
+        self.assertGreater(cached_fragments_count, 0)
+
+        ReportCollector.reset_stages_cache(first_execution)
+        self.assertEqual(0, len(first_execution.report_fragments))
+        self.assertEqual(cached_fragments_count, len(second_execution.report_fragments))
+
+    def test_report_fragment_cache_evicts_least_recently_built_fragments(self):
+        fragment_size = len(json.dumps({"id": "a", "name": "x" * 20}))
+        fragments = ReportFragmentCache(max_bytes=fragment_size * 3)
+        for uuid in ["a", "b", "c"]:
+            fragments.put(uuid, {"id": uuid, "name": "x" * 20})
+        fragments.put("a", {"id": "a", "name": "y" * 20})  # rebuilt - most recent now
+        fragments.put("d", {"id": "d", "name": "x" * 20})
+        self.assertEqual(["a", "c", "d"], [uuid for uuid in ["a", "b", "c", "d"] if fragments.get(uuid)])
+        self.assertEqual(fragment_size * 3, fragments.total_bytes)
+        fragments.put("e", {"id": "e", "name": "x" * fragment_size * 3})  # bigger than whole cache
+        self.assertIsNone(fragments.get("e"))
+        self.assertEqual(3, len(fragments))
+
+    def test_ui_report_references_big_module_reports(self):
+        pipeline_execution = PipelineOrchestrator.prepare_pipeline_execution("pipeline_configs/retry/pipeline_retry_1.yaml")
+        stage = pipeline_execution.pipeline.stages[0]
+        with tempfile.TemporaryDirectory() as exec_dir:
+            stage.exec_dir = Path(exec_dir)
+            module_report_path = stage.exec_dir.joinpath("logs", "module_report.json")
+            module_report_path.parent.mkdir()
+            module_report_path.write_text(json.dumps({"items": ["x" * 100] * 20}))
+            self.assertEqual({"items": ["x" * 100] * 20}, ReportCollector.prepare_ui_view(pipeline_execution)["stages"][0][ReportCollector.MODULE_REPORT])
+
+            with patch.object(EnvVar, "REPORT_MODULE_REPORT_INLINE_MAX_SIZE_KB", 1):
+                ReportCollector.reset_stages_cache(pipeline_execution)
+                stage_data = ReportCollector.prepare_ui_view(pipeline_execution)["stages"][0]
+            self.assertNotIn(ReportCollector.MODULE_REPORT, stage_data)
+            self.assertEqual({
+                "path": module_report_path.as_posix(),
+                "size": module_report_path.stat().st_size,
+                "sha256": hashlib.sha256(module_report_path.read_bytes()).hexdigest(),
+                "contentType": "application/json",
+            }, stage_data[ReportCollector.MODULE_REPORT_REF])
+
+    def test_summary_table_caps_rows_per_level_and_truncates_cells(self):
+        stages = [{"id": f"stage-{i}", "name": f"Stage {i}", "status": "FAILED" if i == 4 else "SUCCESS", "type": "SHELL_COMMAND", "command": "x" * 50}
+                  for i in range(5)]
+        stages[0]["parallelStages"] = [{"id": f"nested-{i}", "name": f"Nested {i}", "status": "SUCCESS"} for i in range(3)]
+        report = {"name": "Summary", "stages": stages}
+        with patch.object(EnvVar, "SUMMARY_TABLE_MAX_ROWS_PER_LEVEL", 2), patch.object(EnvVar, "SUMMARY_TABLE_MAX_CELL_WIDTH", 20), \
+                patch.object(EnvVar, "ENABLE_STAGE_RESOURCE_USAGE_PROFILING", False), patch.object(EnvVar, "ENABLE_PEAK_RESOURCE_USAGE_PROFILING", False):
+            lines = ReportSummaryTable.generate_summary_table(generated_report=report).split("\n")
+        table_lines = [ColorUtils.strip_ansi(line) for line in lines if "|" in line]
+        self.assertEqual(1, len({len(line) for line in table_lines}))
+        rows = table_lines[2:]
+        self.assertEqual(6, len(rows))
+        self.assertIn("╠═ Nested 1", rows[2])
+        self.assertIn("╚═ ... 1 more stage(s) (SUCCESS: 1)", rows[3])
+        self.assertIn("... 3 more stage(s) (SUCCESS: 2, FAILED: 1)", rows[5])
+        self.assertIn(f"| {'x' * 17}... |", rows[0])
+        self.assertIn("Total Stages: 8", lines)
+
+    def test_summary_table_is_logged_in_chunks(self):
+        report = {"name": "Summary", "stages": [{"id": f"stage-{i}", "name": f"Stage {i}", "status": "SUCCESS"} for i in range(10)]}
+        with self.assertLogs("summary_test", level="INFO") as logs, patch.object(ReportSummaryTable, "LOG_CHUNK_LINES", 4):
+            ReportSummaryTable.log_summary_table(logging.getLogger("summary_test"), generated_report=report)
+        self.assertGreater(len(logs.records), 1)
+        self.assertEqual("\n" + ReportSummaryTable.generate_summary_table(generated_report=report),
+                         "".join(record.getMessage() for record in logs.records))
 
 if __name__ == '__main__':
     unittest.main()
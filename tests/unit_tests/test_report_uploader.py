@@ -1,8 +1,19 @@
-import asyncio, json, gzip, os, signal, subprocess, threading, time
+import asyncio, hashlib, json, gzip, os, signal, subprocess, tempfile, threading, time
 from base64 import b64decode
+from pathlib import Path
+from unittest.mock import patch
 from aiohttp import web
 
 from common import ExecutorTestCase
+from pipelines_declarative_executor.model.report import HttpEndpointConfig, ReportUploadMode
+from pipelines_declarative_executor.model.stage import ExecutionStatus
+from pipelines_declarative_executor.orchestrator.pipeline_orchestrator import PipelineOrchestrator
+from pipelines_declarative_executor.report.report_collector import ReportCollector
+from pipelines_declarative_executor.report.report_delta import ReportDelta
+from pipelines_declarative_executor.report.report_spool import ReportSpool
+from pipelines_declarative_executor.report.report_uploader import ReportUploader
+from pipelines_declarative_executor.utils.common_utils import CommonUtils
+from pipelines_declarative_executor.utils.env_var_utils import EnvVar
 with_exec_dir = ExecutorTestCase.with_exec_dir
 
 TEST_USER = "test_user"
@@ -13,6 +24,9 @@ TEST_TOKEN = "test_token"
 class _ReportTestServer:
     def __init__(self):
         self.received_reports = []
+        self.received_headers = []
+        self.received_blobs = {}
+        self.failing_requests = 0
         self.port = None
         self._thread = None
         self._started = threading.Event()
@@ -21,6 +35,7 @@ class _ReportTestServer:
 
     def start(self):
         self.received_reports.clear()
+        self.received_headers.clear()
         self._thread = threading.Thread(target=self._run, daemon=True)
         self._thread.start()
         if not self._started.wait(timeout=10):
@@ -35,6 +50,7 @@ class _ReportTestServer:
     async def _serve(self):
         app = web.Application()
         app.router.add_post("/report", self._handle_post)
+        app.router.add_post("/blob", self._handle_blob_post)
         self._runner = web.AppRunner(app, auto_decompress=False)
         await self._runner.setup()
         site = web.TCPSite(self._runner, "localhost", 0)
@@ -63,12 +79,24 @@ class _ReportTestServer:
         else:
             return web.Response(text="Authentication required", status=401)
 
+        if self.failing_requests > 0:
+            self.failing_requests -= 1
+            return web.Response(text="Unavailable", status=503)
+
         body = await request.read()
         if request.headers.get("Content-Encoding", "") == "gzip":
             body = gzip.decompress(body)
 
         report = json.loads(body.decode("utf-8"))
         self.received_reports.append(report)
+        self.received_headers.append(dict(request.headers))
+        return web.Response(text="OK", status=200)
+
+    async def _handle_blob_post(self, request):
+        body = await request.read()
+        if request.headers.get("Content-Encoding", "") == "gzip":
+            body = gzip.decompress(body)
+        self.received_blobs[request.headers.get(ReportUploader.BLOB_HASH_HEADER)] = (body, len(self.received_reports))
         return web.Response(text="OK", status=200)
 
     def stop(self):
@@ -182,6 +210,291 @@ class TestReportUploader(ExecutorTestCase):
         finally:
             server.stop()
 
+    @with_exec_dir
+    def test_report_upload_periodic_delta(self):
+        server = _ReportTestServer()
+        server.start()
+        try:
+            endpoint = f"http://localhost:{server.port}/report"
+            env = os.environ.copy()
+            env["PIPELINES_DECLARATIVE_EXECUTOR_REPORT_REMOTE_ENDPOINTS"] = json.dumps([
+                {
+                    "type": "http",
+                    "endpoint": endpoint,
+                    "token_value": TEST_TOKEN,
+                    "headers": {
+                        "Authorization": "Bearer {token}",
+                    },
+                    "use_delta": True,
+                },
+            ])
+            env["PIPELINES_DECLARATIVE_EXECUTOR_REPORT_SEND_MODE"] = "PERIODIC"
+            env["PIPELINES_DECLARATIVE_EXECUTOR_REPORT_SEND_INTERVAL"] = "0.5"
+
+            pipeline_data = "pipeline_configs/report/pipeline_report_upload_test.yaml"
+            pipeline_vars = "SLEEP_TIME=3"
+            output = self._run_and_log(
+                [*self.PDE_CLI, "run", f"--pipeline_data={pipeline_data}",
+                 f"--pipeline_vars={pipeline_vars}", f"--pipeline_dir={self.exec_dir}"],
+                env=env,
+            )
+            self.assertEqual(output.returncode, 0)
+
+            time.sleep(0.5)
+
+            self.assertGreaterEqual(len(server.received_reports), 2)
+            # unchanged reports are not sent, so there are fewer uploads than intervals
+            self.assertLess(len(server.received_reports), 3 / 0.5)
+            report, seq = None, None
+            for body, headers in zip(server.received_reports, server.received_headers):
+                if headers.get("Content-Type") == ReportDelta.PATCH_CONTENT_TYPE:
+                    self.assertEqual(seq, headers[ReportDelta.BASE_SEQ_HEADER])
+                    report = ReportDelta.apply(report, body)
+                else:
+                    report = body
+                self.assertEqual(headers[ReportDelta.HASH_HEADER], ReportDelta.content_hash(ReportDelta.to_canonical_json(report)))
+                seq = headers[ReportDelta.SEQ_HEADER]
+            self.assertNotEqual(ReportDelta.PATCH_CONTENT_TYPE, server.received_headers[0].get("Content-Type"))
+            self.assertEqual(ReportDelta.PATCH_CONTENT_TYPE, server.received_headers[-1].get("Content-Type"))
+            self.assertEqual(report["status"], "SUCCESS")
+            for stage in report["stages"]:
+                self.assertEqual(stage["status"], "SUCCESS")
+        finally:
+            server.stop()
+
+    def test_report_delta_patch_reproduces_report(self):
+        old_report = {"status": "IN_PROGRESS", "stages": [{"id": "a", "status": "SUCCESS"}, {"id": "b/c", "status": "IN_PROGRESS", "url": None}]}
+        new_report = {"status": "SUCCESS", "time": "5s", "stages": [{"id": "a", "status": "SUCCESS"}, {"id": "b/c", "status": "SUCCESS"},
+                                                                     {"id": "d~e", "status": "SKIPPED"}]}
+        patch = ReportDelta.diff(old_report, new_report)
+        self.assertEqual(5, len(patch))
+        self.assertEqual(new_report, ReportDelta.apply(json.loads(json.dumps(old_report)), patch))
+        self.assertEqual([], ReportDelta.diff(new_report, json.loads(json.dumps(new_report))))
+
+    def test_report_upload_on_change(self):
+        server = _ReportTestServer()
+        server.start()
+        execution = PipelineOrchestrator.prepare_pipeline_execution("pipeline_configs/report/pipeline_report_upload_test.yaml")
+        endpoint_config = HttpEndpointConfig(endpoint=f"http://localhost:{server.port}/report", headers={"Authorization": f"Bearer {TEST_TOKEN}"})
+
+        async def _run_stages():
+            async with ReportUploader(execution=execution, configs=[endpoint_config]):
+                await asyncio.sleep(0.3)
+                self.assertEqual(0, len(server.received_reports))  # nothing changed yet
+                for status in [ExecutionStatus.IN_PROGRESS, ExecutionStatus.SUCCESS]:
+                    for stage in execution.pipeline.stages:
+                        stage.status = status
+                        ReportCollector.mark_stage_changed(execution, stage)
+                    await asyncio.sleep(0.3)
+                # transitions within debounce interval are sent together, and next upload waits for min interval
+                self.assertEqual(1, len(server.received_reports))
+                self.assertEqual(["IN_PROGRESS", "IN_PROGRESS"], [stage["status"] for stage in server.received_reports[0]["stages"]])
+                await asyncio.sleep(0.9)
+                self.assertEqual(2, len(server.received_reports))
+                self.assertEqual(["SUCCESS", "SUCCESS"], [stage["status"] for stage in server.received_reports[1]["stages"]])
+
+        try:
+            with tempfile.TemporaryDirectory() as state_dir, \
+                    patch.object(EnvVar, "REPORT_SEND_MODE", ReportUploadMode.ON_CHANGE), \
+                    patch.object(EnvVar, "REPORT_SEND_DEBOUNCE_INTERVAL", 0.1), \
+                    patch.object(EnvVar, "REPORT_SEND_MIN_INTERVAL", 1):
+                execution.state_dir = Path(state_dir)
+                asyncio.run(_run_stages())
+            # final report is unchanged, so it's not sent again on exit
+            self.assertEqual(2, len(server.received_reports))
+        finally:
+            server.stop()
+
+    def test_report_encoded_once_for_all_endpoints(self):
+        execution = PipelineOrchestrator.prepare_pipeline_execution("pipeline_configs/retry/pipeline_retry_1.yaml")
+        report = ReportCollector.prepare_ui_view(execution)
+        report["customData"] = {"stages": []}
+        targets = [{**ReportUploader._initial_upload_state(), "use_compression": use_compression, "use_delta": use_delta}
+                   for use_compression, use_delta in [(True, False), (False, True)]]
+
+        encoded_report = ReportUploader._encode_report(report, targets)
+        expected_json = json.dumps(report, default=str, sort_keys=True, separators=(",", ":"))
+        self.assertEqual(expected_json.encode("utf-8"), encoded_report["body"])
+        self.assertEqual(expected_json.encode("utf-8"), gzip.decompress(encoded_report["gzip_body"]))
+        self.assertEqual(json.loads(expected_json), encoded_report["plain"])
+
+        for target in targets:
+            target["sent_hash"] = encoded_report["hash"]
+        self.assertIsNone(ReportUploader._encode_report(report, targets))
+
+    def test_report_upload_retried_from_spool(self):
+        server = _ReportTestServer()
+        server.start()
+        execution = PipelineOrchestrator.prepare_pipeline_execution("pipeline_configs/report/pipeline_report_upload_test.yaml")
+        endpoint_config = HttpEndpointConfig(endpoint=f"http://localhost:{server.port}/report", headers={"Authorization": f"Bearer {TEST_TOKEN}"})
+
+        async def _run_uploader():
+            async with ReportUploader(execution=execution, configs=[endpoint_config]):
+                pass
+
+        try:
+            with tempfile.TemporaryDirectory() as state_dir, \
+                    patch.object(EnvVar, "REPORT_UPLOAD_RETRY_BASE_DELAY", 0.05), \
+                    patch.object(EnvVar, "REPORT_UPLOAD_FLUSH_TIMEOUT", 0.5):
+                execution.state_dir = Path(state_dir)
+                spool_dir = Path(state_dir).joinpath("report_spool")
+                server.failing_requests = 2
+                asyncio.run(_run_uploader())
+                self.assertEqual(1, len(server.received_reports))
+                self.assertEqual([], list(spool_dir.iterdir()))
+
+                # endpoint stays unavailable longer than flush timeout - final report is left in spool, and is delivered by next uploader
+                server.failing_requests = 1000
+                execution.status = ExecutionStatus.FAILED
+                asyncio.run(_run_uploader())
+                self.assertEqual(1, len(server.received_reports))
+                self.assertEqual("FAILED", json.loads(next(spool_dir.iterdir()).read_text())["status"])
+
+                server.failing_requests = 0
+                asyncio.run(_run_uploader())
+                self.assertEqual(2, len(server.received_reports))
+                self.assertEqual("FAILED", server.received_reports[-1]["status"])
+                self.assertEqual([], list(spool_dir.iterdir()))
+        finally:
+            server.stop()
+
+    def test_report_spool_tolerates_writes_finishing_late(self):
+        write_file_atomically = CommonUtils.write_file_atomically
+
+        def _slow_write(body, path):
+            time.sleep(0.2)
+            write_file_atomically(body, path)
+
+        def _encoded(status):
+            body = json.dumps({"status": status}).encode("utf-8")
+            return {"hash": ReportDelta.content_hash(body.decode("utf-8")), "body": body, "gzip_body": None, "plain": None}
+
+        async def _clear_while_written(spool):
+            put_task = asyncio.create_task(spool.put(_encoded("IN_PROGRESS")))
+            await asyncio.sleep(0.05)
+            spool.clear()  # report got delivered meanwhile
+            await put_task
+
+        async def _supersede_while_written(spool):
+            put_task = asyncio.create_task(spool.put(_encoded("IN_PROGRESS")))
+            await asyncio.sleep(0.05)
+            await spool.put(_encoded("SUCCESS"))
+            await put_task
+
+        with tempfile.TemporaryDirectory() as state_dir, patch.object(CommonUtils, "write_file_atomically", _slow_write):
+            spool = ReportSpool("http://localhost/report")
+            self.assertFalse(spool.attach(Path(state_dir)))
+            asyncio.run(_clear_while_written(spool))
+            self.assertIsNone(spool.pending)
+            self.assertFalse(spool.spool_path.exists())
+
+            asyncio.run(_supersede_while_written(spool))
+            self.assertEqual(1, spool.stats["superseded"])
+            self.assertEqual("SUCCESS", json.loads(spool.spool_path.read_text())["status"])
+
+    def test_report_upload_sends_big_module_reports_separately(self):
+        server = _ReportTestServer()
+        server.start()
+        execution = PipelineOrchestrator.prepare_pipeline_execution("pipeline_configs/report/pipeline_report_upload_test.yaml")
+        endpoint_config = HttpEndpointConfig(endpoint=f"http://localhost:{server.port}/report", headers={"Authorization": f"Bearer {TEST_TOKEN}"},
+                                             use_compression=True, blob_endpoint=f"http://localhost:{server.port}/blob")
+
+        async def _run_uploader():
+            async with ReportUploader(execution=execution, configs=[endpoint_config]) as uploader:
+                await uploader._send_report()
+                execution.status = ExecutionStatus.SUCCESS
+                ReportCollector.reset_stages_cache(execution)
+
+        try:
+            with tempfile.TemporaryDirectory() as exec_dir, patch.object(EnvVar, "REPORT_MODULE_REPORT_INLINE_MAX_SIZE_KB", 1):
+                execution.state_dir = Path(exec_dir)
+                stage = execution.pipeline.stages[0]
+                stage.exec_dir = Path(exec_dir)
+                module_report = json.dumps({"items": ["x" * 100] * 20}).encode("utf-8")
+                stage.exec_dir.joinpath("logs").mkdir()
+                stage.exec_dir.joinpath("logs", "module_report.json").write_bytes(module_report)
+                asyncio.run(_run_uploader())
+            self.assertEqual(2, len(server.received_reports))
+            blob_ref = server.received_reports[0]["stages"][0][ReportCollector.MODULE_REPORT_REF]
+            # uploaded once, before first report referencing it
+            self.assertEqual({blob_ref["sha256"]: (module_report, 0)}, server.received_blobs)
+            self.assertEqual(blob_ref, server.received_reports[1]["stages"][0][ReportCollector.MODULE_REPORT_REF])
+        finally:
+            server.stop()
+
+    def test_report_referencing_changed_module_report_is_rebuilt(self):
+        server = _ReportTestServer()
+        server.start()
+        execution = PipelineOrchestrator.prepare_pipeline_execution("pipeline_configs/report/pipeline_report_upload_test.yaml")
+        endpoint_config = HttpEndpointConfig(endpoint=f"http://localhost:{server.port}/report", headers={"Authorization": f"Bearer {TEST_TOKEN}"},
+                                             blob_endpoint=f"http://localhost:{server.port}/blob")
+        module_report = json.dumps({"items": ["x" * 100] * 20}).encode("utf-8")
+        changed_module_report = json.dumps({"items": ["y" * 100] * 30}).encode("utf-8")
+        read_blob = ReportUploader._read_blob
+
+        def _read_changed_blob(blob, use_compression):
+            Path(blob["path"]).write_bytes(changed_module_report)  # module report is rewritten after report referencing it was built
+            return read_blob(blob, use_compression)
+
+        async def _run_uploader():
+            async with ReportUploader(execution=execution, configs=[endpoint_config]) as uploader:
+                with patch.object(ReportUploader, "_read_blob", side_effect=_read_changed_blob):
+                    await uploader._send_report()
+
+        try:
+            with tempfile.TemporaryDirectory() as exec_dir, \
+                    patch.object(EnvVar, "REPORT_MODULE_REPORT_INLINE_MAX_SIZE_KB", 1), \
+                    patch.object(EnvVar, "REPORT_UPLOAD_RETRY_BASE_DELAY", 0.05), \
+                    patch.object(EnvVar, "REPORT_UPLOAD_FLUSH_TIMEOUT", 2):
+                execution.state_dir = Path(exec_dir)
+                stage = execution.pipeline.stages[0]
+                stage.exec_dir = Path(exec_dir)
+                stage.exec_dir.joinpath("logs").mkdir()
+                stage.exec_dir.joinpath("logs", "module_report.json").write_bytes(module_report)
+                asyncio.run(_run_uploader())
+            # stale reference isn't delivered - cached fragment is rebuilt, and report is delivered with fresh one
+            self.assertEqual(1, len(server.received_reports))
+            blob_ref = server.received_reports[0]["stages"][0][ReportCollector.MODULE_REPORT_REF]
+            self.assertEqual(hashlib.sha256(changed_module_report).hexdigest(), blob_ref["sha256"])
+            self.assertEqual({blob_ref["sha256"]: (changed_module_report, 0)}, server.received_blobs)
+        finally:
+            server.stop()
+
+    def test_spooled_report_is_delivered_with_its_module_reports(self):
+        server = _ReportTestServer()
+        server.start()
+        execution = PipelineOrchestrator.prepare_pipeline_execution("pipeline_configs/report/pipeline_report_upload_test.yaml")
+        endpoint_config = HttpEndpointConfig(endpoint=f"http://localhost:{server.port}/report", headers={"Authorization": f"Bearer {TEST_TOKEN}"},
+                                             blob_endpoint=f"http://localhost:{server.port}/blob")
+
+        async def _run_uploader():
+            async with ReportUploader(execution=execution, configs=[endpoint_config]):
+                pass
+
+        try:
+            with tempfile.TemporaryDirectory() as exec_dir, \
+                    patch.object(EnvVar, "REPORT_MODULE_REPORT_INLINE_MAX_SIZE_KB", 1), \
+                    patch.object(EnvVar, "REPORT_UPLOAD_RETRY_BASE_DELAY", 0.05), \
+                    patch.object(EnvVar, "REPORT_UPLOAD_FLUSH_TIMEOUT", 0.5):
+                execution.state_dir = Path(exec_dir)
+                stage = execution.pipeline.stages[0]
+                stage.exec_dir = Path(exec_dir)
+                stage.exec_dir.joinpath("logs").mkdir()
+                stage.exec_dir.joinpath("logs", "module_report.json").write_bytes(json.dumps({"items": ["x" * 100] * 20}).encode("utf-8"))
+                server.failing_requests = 1000
+                asyncio.run(_run_uploader())
+                self.assertEqual(0, len(server.received_reports))
+
+                # next process doesn't know which blobs were uploaded - they are re-collected from spooled report
+                server.received_blobs.clear()
+                server.failing_requests = 0
+                asyncio.run(_run_uploader())
+            self.assertEqual(1, len(server.received_reports))
+            blob_ref = server.received_reports[0]["stages"][0][ReportCollector.MODULE_REPORT_REF]
+            self.assertEqual(0, server.received_blobs[blob_ref["sha256"]][1])
+        finally:
+            server.stop()
+
     @with_exec_dir
     def test_report_upload_on_cancellation(self):
         server = _ReportTestServer()
@@ -0,0 +1,147 @@
+import asyncio, unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import psutil
+
+from pipelines_declarative_executor.executor.resource_manager import ResourceManager
+from pipelines_declarative_executor.utils.env_var_utils import EnvVar
+
+ONE_GB = 1024 * 1024 * 1024
+
+
+@patch.object(EnvVar, "ENABLE_RESOURCE_MANAGER", True)
+@patch.object(EnvVar, "HOST_SLOTS_DIR", None)
+@patch.object(EnvVar, "MAX_CONCURRENT_STAGES", 1)
+@patch.object(EnvVar, "RESOURCE_MANAGER_QUEUE_TIMEOUT", 5)
+@patch.object(ResourceManager, "_used_cpu", 0.0)
+@patch.object(ResourceManager, "_recheck_handle", None)
+@patch.dict(ResourceManager._queues, clear=True)
+@patch.dict(ResourceManager._served_cpu, clear=True)
+@patch.dict(ResourceManager._granted_count, clear=True)
+class TestResourceManager(unittest.TestCase):
+
+    def setUp(self):
+        self.memory = SimpleNamespace(available=ONE_GB)
+        memory_patch = patch.object(psutil, "virtual_memory", return_value=self.memory)
+        memory_patch.start()
+        self.addCleanup(memory_patch.stop)
+
+    @staticmethod
+    async def _acquire(name: str, granted: list, queue_key: str, cpu: float = 1, memory: float = 10):
+        request = await ResourceManager.acquire({"cpu": cpu, "memory": memory}, queue_key=queue_key)
+        granted.append((name, request))
+        return request
+
+    @staticmethod
+    async def _settle():
+        for _ in range(5):
+            await asyncio.sleep(0)
+
+    def _assert_idle(self):
+        self.assertEqual(0.0, ResourceManager._used_cpu)
+        self.assertEqual({}, ResourceManager._queues)
+        # entries of pipelines without queued or granted requests are dropped
+        self.assertEqual({}, ResourceManager._served_cpu)
+        self.assertEqual({}, ResourceManager._granted_count)
+
+    def _release_in_grant_order(self, granted: list, expected_count: int):
+        async def _release_all():
+            released = []
+            while len(released) < expected_count:
+                await self._settle()
+                self.assertEqual(len(released) + 1, len(granted), "exactly one request should be granted at a time")
+                name, request = granted[len(released)]
+                released.append(name)
+                await ResourceManager.release(request)
+            return released
+        return _release_all()
+
+    def test_requests_of_one_pipeline_are_admitted_in_fifo_order(self):
+        async def _scenario():
+            granted = []
+            tasks = [asyncio.create_task(self._acquire(name, granted, "pipeline")) for name in ["first", "second", "third", "fourth"]]
+            order = await self._release_in_grant_order(granted, len(tasks))
+            await asyncio.gather(*tasks)
+            return order
+
+        self.assertEqual(["first", "second", "third", "fourth"], asyncio.run(_scenario()))
+        self._assert_idle()
+
+    def test_least_served_pipeline_is_admitted_first(self):
+        async def _scenario():
+            granted = []
+            tasks = [asyncio.create_task(self._acquire(name, granted, name[0])) for name in ["H1", "A1", "A2", "A3", "B1", "B2"]]
+            order = await self._release_in_grant_order(granted, len(tasks))
+            await asyncio.gather(*tasks)
+            return order
+
+        # both pipelines start on par while H1 runs - then A2 waits for B1, though it arrived earlier, as pipeline A was already served once
+        self.assertEqual(["H1", "A1", "B1", "A2", "B2", "A3"], asyncio.run(_scenario()))
+        self._assert_idle()
+
+    def test_big_request_at_head_is_not_overtaken_by_smaller_ones(self):
+        async def _scenario():
+            granted = []
+            holder = await self._acquire("holder", granted, "other")
+            big_task = asyncio.create_task(self._acquire("big", granted, "big", cpu=2))
+            await self._settle()
+            small_task = asyncio.create_task(self._acquire("small", granted, "small"))
+            await self._settle()
+            self.assertEqual(["holder"], [name for name, _ in granted])  # one cpu is free, but small request waits behind big one
+
+            await ResourceManager.release(holder)
+            await self._settle()
+            self.assertEqual(["holder", "big"], [name for name, _ in granted])
+            await ResourceManager.release(await big_task)
+            await ResourceManager.release(await small_task)
+            return [name for name, _ in granted]
+
+        with patch.object(EnvVar, "MAX_CONCURRENT_STAGES", 2):
+            self.assertEqual(["holder", "big", "small"], asyncio.run(_scenario()))
+        self._assert_idle()
+
+    def test_request_cancelled_after_grant_gives_cpu_back(self):
+        async def _scenario():
+            holder = await ResourceManager.acquire({"cpu": 1}, queue_key="pipeline")
+            waiting_task = asyncio.create_task(ResourceManager.acquire({"cpu": 1}, queue_key="pipeline"))
+            await self._settle()
+            await ResourceManager.release(holder)  # grants waiting request...
+            self.assertEqual(1.0, ResourceManager._used_cpu)
+            waiting_task.cancel()  # ...which is cancelled before it resumes
+            with self.assertRaises(asyncio.CancelledError):
+                await waiting_task
+            self.assertEqual(0.0, ResourceManager._used_cpu)
+            await ResourceManager.release(await asyncio.wait_for(ResourceManager.acquire({"cpu": 1}, queue_key="pipeline"), timeout=1))
+
+        asyncio.run(_scenario())
+        self._assert_idle()
+
+    def test_request_timing_out_is_withdrawn(self):
+        async def _scenario():
+            holder = await ResourceManager.acquire({"cpu": 1}, queue_key="first")
+            self.assertIsNone(await ResourceManager.acquire({"cpu": 1}, queue_key="second"))
+            self.assertNotIn("second", ResourceManager._queues)
+            self.assertNotIn("second", ResourceManager._served_cpu)
+            await ResourceManager.release(holder)
+
+        with patch.object(EnvVar, "RESOURCE_MANAGER_QUEUE_TIMEOUT", 0.1):
+            asyncio.run(_scenario())
+        self._assert_idle()
+
+    def test_head_blocked_by_memory_is_admitted_by_recheck(self):
+        self.memory.available = 50 * 1024 * 1024
+
+        async def _scenario():
+            task = asyncio.create_task(ResourceManager.acquire({"cpu": 1, "memory": 100}, queue_key="pipeline"))
+            await asyncio.sleep(ResourceManager.RECHECK_INTERVAL * 2.5)
+            self.assertFalse(task.done())
+            self.memory.available = ONE_GB  # freed by something other than our stages
+            request = await asyncio.wait_for(task, timeout=ResourceManager.RECHECK_INTERVAL * 2)
+            await ResourceManager.release(request)
+
+        with patch.object(EnvVar, "MAX_CONCURRENT_STAGES", 2), self.assertLogs(level="WARNING") as logs:
+            asyncio.run(_scenario())
+        # logged once per blocked request, not with every recheck
+        self.assertEqual(1, sum("Not enough memory" in line for line in logs.output))
+        self._assert_idle()
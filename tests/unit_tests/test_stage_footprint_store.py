@@ -0,0 +1,73 @@
+import json, tempfile, unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from pipelines_declarative_executor.executor.resource_manager import ResourceManager
+from pipelines_declarative_executor.executor.stage_footprint_store import StageFootprintStore
+from pipelines_declarative_executor.model.stage import Stage, StageType
+from pipelines_declarative_executor.utils.env_var_utils import EnvVar
+
+
+@patch.object(EnvVar, "ENABLE_STAGE_FOOTPRINT_STORE", True)
+@patch.object(EnvVar, "ENABLE_RESOURCE_MANAGER", True)
+@patch.object(EnvVar, "STAGE_FOOTPRINT_HISTORY_SIZE", 20)
+@patch.object(StageFootprintStore, "_footprints", None)
+@patch.dict(StageFootprintStore._recorded, clear=True)
+class TestStageFootprintStore(unittest.TestCase):
+
+    def setUp(self):
+        store_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(store_dir.cleanup)
+        self.store_path = Path(store_dir.name).joinpath("footprints", "stage_footprints.json")
+        store_path_patch = patch.object(EnvVar, "STAGE_FOOTPRINT_STORE_PATH", str(self.store_path))
+        store_path_patch.start()
+        self.addCleanup(store_path_patch.stop)
+
+    @staticmethod
+    def _stage(**kwargs) -> Stage:
+        return Stage(name="Build", type=StageType.PYTHON_MODULE, path="/app/quber_cli", command="build", **kwargs)
+
+    def test_learned_footprint_is_persisted_and_reserved_on_next_admission(self):
+        for peak_memory_mb in range(100, 300, 10):
+            StageFootprintStore.record(self._stage(), peak_memory_mb)
+        StageFootprintStore.save()
+        self.assertEqual(20, len(json.loads(self.store_path.read_text())[StageFootprintStore.calculate_key(self._stage())]))
+
+        StageFootprintStore._footprints = None  # next execution reads store file again
+        stage = self._stage()
+        _, memory = ResourceManager.get_stage_request(StageFootprintStore.resolve_resources(stage))
+        self.assertEqual(280, memory)
+        self.assertEqual(280, stage.custom_data["reserved_memory_mb"])
+
+        # explicitly declared memory isn't overridden, and other stages keep default reservation
+        self.assertEqual({"memory": 64}, StageFootprintStore.resolve_resources(self._stage(resources={"memory": 64})))
+        other_stage = Stage(name="Deploy", type=StageType.PYTHON_MODULE, path="/app/quber_cli", command="deploy")
+        _, memory = ResourceManager.get_stage_request(StageFootprintStore.resolve_resources(other_stage))
+        self.assertEqual(EnvVar.REQUIRED_MEMORY_PER_SUBPROCESS, memory)
+
+    def test_save_merges_samples_of_concurrent_executions(self):
+        key = StageFootprintStore.calculate_key(self._stage())
+        self.store_path.parent.mkdir(parents=True)
+        self.store_path.write_text(json.dumps({key: [500.0]}))
+        StageFootprintStore.record(self._stage(), 100)
+        self.store_path.write_text(json.dumps({key: [500.0, 600.0]}))  # written by other execution meanwhile
+        StageFootprintStore.save()
+        self.assertEqual([500.0, 600.0, 100.0], json.loads(self.store_path.read_text())[key])
+
+    def test_missing_or_corrupt_store_falls_back_to_defaults(self):
+        stage = self._stage()
+        self.assertIsNone(StageFootprintStore.resolve_resources(stage))
+        self.assertNotIn("reserved_memory_mb", stage.custom_data)
+
+        self.store_path.parent.mkdir(parents=True)
+        self.store_path.write_text("{not json")
+        StageFootprintStore._footprints = None
+        with self.assertLogs(level="WARNING"):
+            _, memory = ResourceManager.get_stage_request(StageFootprintStore.resolve_resources(stage))
+        self.assertEqual(EnvVar.REQUIRED_MEMORY_PER_SUBPROCESS, memory)
+
+        # corrupt store is replaced with learned footprints
+        StageFootprintStore.record(stage, 128)
+        with self.assertLogs(level="WARNING"):
+            StageFootprintStore.save()
+        self.assertEqual({StageFootprintStore.calculate_key(stage): [128.0]}, json.loads(self.store_path.read_text()))
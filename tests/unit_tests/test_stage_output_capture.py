@@ -0,0 +1,82 @@
+import asyncio, sys, tempfile, unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from pipelines_declarative_executor.executor.stage_output_capture import StageOutputCapture
+
+
+class TestStageOutputCapture(unittest.TestCase):
+
+    def test_output_is_streamed_to_log_file_keeping_bounded_tail(self):
+        output = b"".join(f"line {i}\r\n".encode("utf-8") for i in range(1000))
+
+        async def _consume(capture):
+            stream = asyncio.StreamReader()
+            for start in range(0, len(output), 1000):  # lines are split between chunks
+                stream.feed_data(output[start:start + 1000])
+            stream.feed_eof()
+            await capture.consume_stream(stream)
+
+        with tempfile.TemporaryDirectory() as logs_dir:
+            capture = StageOutputCapture(Path(logs_dir).joinpath("stdout.log"), max_lines=10)
+            asyncio.run(_consume(capture))
+            self.assertEqual(output, capture.log_file_path.read_bytes())
+            self.assertEqual(1000, capture.total_lines)
+            self.assertEqual([f"line {i}" for i in range(990, 1000)], list(capture.lines))
+            self.assertEqual(990, capture.omitted_lines)
+            self.assertTrue(capture.render().startswith(f"... 990 earlier lines omitted, full output is in \"{capture.log_file_path.as_posix()}\" ...\nline 990"))
+
+    @patch.object(StageOutputCapture, "LOG_FLUSH_SIZE", 100)
+    @patch.object(StageOutputCapture, "LOG_FLUSH_INTERVAL", 3600)
+    def test_log_file_writes_are_batched(self):
+        async def _consume(capture):
+            stream = asyncio.StreamReader()
+            task = asyncio.create_task(capture.consume_stream(stream))
+            stream.feed_data(b"x" * 60 + b"\n")
+            await asyncio.sleep(0.1)
+            self.assertEqual(b"", capture.log_file_path.read_bytes())  # below flush size - still buffered
+            stream.feed_data(b"y" * 60 + b"\n")
+            await asyncio.sleep(0.1)
+            self.assertEqual(122, len(capture.log_file_path.read_bytes()))
+            stream.feed_data(b"tail")
+            stream.feed_eof()
+            await task
+
+        with tempfile.TemporaryDirectory() as logs_dir:
+            capture = StageOutputCapture(Path(logs_dir).joinpath("stdout.log"))
+            asyncio.run(_consume(capture))
+            self.assertEqual(b"x" * 60 + b"\n" + b"y" * 60 + b"\ntail", capture.log_file_path.read_bytes())
+            self.assertEqual(3, capture.total_lines)
+
+    def test_long_lines_are_truncated(self):
+        capture = StageOutputCapture(max_lines=10)
+        long_line = b"x" * (StageOutputCapture.MAX_LINE_LENGTH * 3)
+        for start in range(0, len(long_line), 1000):
+            capture._feed(long_line[start:start + 1000])
+        capture._feed(b"\nshort line\nunterminated")
+        capture._finish()
+        self.assertEqual(["x" * StageOutputCapture.MAX_LINE_LENGTH + "...", "short line", "unterminated"], list(capture.lines))
+        self.assertEqual(3, capture.total_lines)
+
+    def test_stdout_and_stderr_are_captured_separately(self):
+        script = "import sys\nfor i in range(100):\n    print(f'out {i}')\n    print(f'err {i}', file=sys.stderr)"
+
+        async def _run(stdout, stderr):
+            process = await asyncio.create_subprocess_exec(sys.executable, "-c", script, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+            await asyncio.gather(stdout.consume_stream(process.stdout), stderr.consume_stream(process.stderr))
+            return await process.wait()
+
+        with tempfile.TemporaryDirectory() as logs_dir:
+            stdout = StageOutputCapture(Path(logs_dir).joinpath("stdout.log"), max_lines=5)
+            stderr = StageOutputCapture(Path(logs_dir).joinpath("stderr.log"), max_lines=5)
+            self.assertEqual(0, asyncio.run(_run(stdout, stderr)))
+            self.assertEqual([f"err {i}" for i in range(95, 100)], list(stderr.lines))
+            self.assertEqual([f"out {i}" for i in range(95, 100)], list(stdout.lines))
+            self.assertEqual("".join(f"err {i}\n" for i in range(100)), stderr.log_file_path.read_text())
+
+            # output redirected into log file directly (fork server, module workers) is collected from it
+            reread_stderr = StageOutputCapture(stderr.log_file_path, max_lines=5)
+            reread_stderr.consume_log_file()
+            self.assertEqual(list(stderr.lines), list(reread_stderr.lines))
+            self.assertEqual(100, reread_stderr.total_lines)
+            self.assertFalse(StageOutputCapture(Path(logs_dir).joinpath("missing.log")).has_output())
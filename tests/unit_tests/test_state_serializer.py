@@ -0,0 +1,58 @@
+import json, tempfile, unittest
+from datetime import datetime
+from pathlib import Path
+from unittest.mock import patch
+
+from pipelines_declarative_executor.model.executor import StateFileFormat
+from pipelines_declarative_executor.utils import state_serializer
+from pipelines_declarative_executor.utils.env_var_utils import EnvVar
+from pipelines_declarative_executor.utils.state_serializer import StateSerializer
+
+
+class TestStateSerializer(unittest.TestCase):
+
+    STATE = {"status": "FAILED", "vars": {"NUMBER": 21, "NESTED": {"LIST": [1, "2", None]}}, "finished": datetime(2025, 5, 4, 12, 1, 11)}
+
+    @unittest.skipUnless(state_serializer.msgpack, "'msgpack' package is not installed")
+    def test_msgpack_state_file_is_written_and_loaded(self):
+        with tempfile.TemporaryDirectory() as state_dir, patch.object(EnvVar, "STATE_FILE_FORMAT", StateFileFormat.MSGPACK):
+            state_dir = Path(state_dir)
+            StateSerializer.write(self.STATE, state_dir, "execution.json")
+            self.assertEqual(["execution.msgpack"], [path.name for path in state_dir.iterdir()])
+            self.assertTrue(StateSerializer.exists(state_dir, "execution.json"))
+            self.assertEqual({**self.STATE, "finished": "2025-05-04T12:01:11"}, StateSerializer.load(state_dir, "execution.json"))
+
+    @unittest.skipUnless(state_serializer.msgpack, "'msgpack' package is not installed")
+    def test_state_written_in_other_format_is_found_on_retry(self):
+        with tempfile.TemporaryDirectory() as state_dir:
+            state_dir = Path(state_dir)
+            with patch.object(EnvVar, "STATE_FILE_FORMAT", StateFileFormat.MSGPACK):
+                StateSerializer.write({"status": "FAILED"}, state_dir, "execution.json")
+            # retry runs with default format - it reads msgpack state, and replaces it with json one
+            with patch.object(EnvVar, "STATE_FILE_FORMAT", StateFileFormat.JSON):
+                self.assertEqual({"status": "FAILED"}, StateSerializer.load(state_dir, "execution.json"))
+                StateSerializer.write({"status": "SUCCESS"}, state_dir, "execution.json")
+            self.assertEqual(["execution.json"], [path.name for path in state_dir.iterdir()])
+            with patch.object(EnvVar, "STATE_FILE_FORMAT", StateFileFormat.MSGPACK):
+                self.assertEqual({"status": "SUCCESS"}, StateSerializer.load(state_dir, "execution.json"))
+                StateSerializer.remove(state_dir, "execution.json")
+            self.assertFalse(StateSerializer.exists(state_dir, "execution.json"))
+            self.assertIsNone(StateSerializer.load(state_dir, "execution.json"))
+
+    def test_msgpack_format_falls_back_to_json_when_msgpack_is_missing(self):
+        with tempfile.TemporaryDirectory() as state_dir, \
+                patch.object(EnvVar, "STATE_FILE_FORMAT", StateFileFormat.MSGPACK), \
+                patch.object(state_serializer, "msgpack", None), \
+                patch.object(StateSerializer, "_fallback_logged", False):
+            state_dir = Path(state_dir)
+            with self.assertLogs(level="WARNING"):
+                StateSerializer.write({"status": "FAILED"}, state_dir, "execution.json")
+            self.assertEqual(["execution.json"], [path.name for path in state_dir.iterdir()])
+            self.assertEqual({"status": "FAILED"}, json.loads(state_dir.joinpath("execution.json").read_text()))
+            self.assertEqual({"status": "FAILED"}, StateSerializer.load(state_dir, "execution.json"))
+
+            # state written with msgpack by other installation can't be retried without it
+            state_dir.joinpath("execution.json").unlink()
+            state_dir.joinpath("execution.msgpack").write_bytes(b"\x81")
+            with self.assertRaisesRegex(Exception, "'msgpack' package is not installed"):
+                StateSerializer.load(state_dir, "execution.json")